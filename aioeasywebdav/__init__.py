@@ -1,4 +1,14 @@
 from .client import *
+from .cache import MetadataCache
+from .retry import RetryPolicy
+from .throttle import TokenBucket
+from .metrics import Metrics
+from .tracing import Tracer, OpenTelemetryTracer, RequestTrace
+from .sync import SyncAction, SyncReport
+from .index import SyncIndex
+from .listing import Listing
+from .bulk import TransferResult, BulkStats
+from .manager import TransferManager, Transfer, TransferCancelled
 
 def connect(*args, **kwargs):
     """connect(host, port=0, auth=None, username=None, password=None, protocol='http', path="/")"""
@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .client import File, WebdavException, parse_checksums, file_checksums, UPLOAD_CHECKSUMS, DOWNLOAD_CHECKSUMS
+
+# Outcome of one (src, dst) pair of upload_many / download_many, error is None on success
+TransferResult = namedtuple('TransferResult', ['src', 'dst', 'size', 'error'])
+
+
+class BulkStats(object):
+    """
+    Running totals of an upload_many / download_many call, updated as each transfer finishes
+    """
+
+    def __init__(self):
+        self.done = 0  # transfers completed
+        self.failed = 0
+        self.bytes = 0  # bytes transferred
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def files_per_second(self):
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def throughput(self):
+        """
+        :return: bytes per second transferred so far
+        """
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def add(self, result):
+        if result.error is None:
+            self.done += 1
+            self.bytes += result.size
+        else:
+            self.failed += 1
+
+    def __repr__(self):
+        return '<BulkStats done=%d failed=%d bytes=%d elapsed=%.1fs throughput=%.0fB/s>' % (
+            self.done, self.failed, self.bytes, self.elapsed, self.throughput)
+
+
+def _read_small(path, limit):
+    with open(path, 'rb') as f:
+        data = f.read(limit + 1)
+    return data if len(data) <= limit else None
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+async def _run(pairs, transfer, concurrency, stats):
+    """
+    Run transfer(src, dst) over pairs with at most concurrency in flight
+    :return: async iterator of TransferResult in order of completion
+    """
+    pairs = iter(pairs)  # shared by the workers, so a generator of pairs is consumed lazily
+    results = asyncio.Queue()
+
+    async def worker():
+        for src, dst in pairs:
+            try:
+                results.put_nowait(TransferResult(src, dst, await transfer(src, dst), None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                results.put_nowait(TransferResult(src, dst, 0, ex))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    running = asyncio.gather(*workers)
+    running.add_done_callback(lambda future: results.put_nowait(None))
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            stats.add(result)
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        stats.finished = time.monotonic()
+
+
+def upload_many(client, pairs, concurrency, small_file_bytes, checksums=UPLOAD_CHECKSUMS, mkdirs=True, bandwidth=None,
+                stats=None):
+    """
+    Implementation of Client.upload_many
+    """
+    stats = stats if stats is not None else BulkStats()
+    loop = asyncio.get_event_loop()
+
+    async def transfer(src, dst):
+        parent = client._abspath(dst).rsplit('/', 1)[0]
+        if mkdirs and parent:
+            # Known collections are skipped and concurrent MKCOLs of one collection shared by the client
+            await client.mkdirs(parent)
+        async with client.limit_files:
+            data = await loop.run_in_executor(client._io_executor, _read_small, src, small_file_bytes)
+        if data is None:
+            await client.upload(src, dst, checksums, bandwidth=bandwidth)
+            return os.path.getsize(src)
+
+        # Small file: read whole, hashed in one go and sent as a body which can be retried as is
+        hexdigests = dict((kind.upper(), hashlib.new(kind.lower(), data).hexdigest()) for kind in checksums)
+        headers = {'OC-Checksum': 'MD5:%s' % hexdigests['MD5']} if 'MD5' in hexdigests else {}
+        client._invalidate(dst)
+
+        async def put():
+            await client._throttle(dst, len(data), bandwidth)
+            async with (await client._send('PUT', dst, (200, 201, 204), retry=False, data=data, headers=headers)):
+                pass
+        await client.retry_policy.call('PUT', put)
+        client.metrics.sent(len(data))
+        return len(data)
+
+    return _run(pairs, transfer, concurrency, stats)
+
+
+def download_many(client, pairs, concurrency, small_file_bytes, bandwidth=None, stats=None):
+    """
+    Implementation of Client.download_many
+    """
+    stats = stats if stats is not None else BulkStats()
+    loop = asyncio.get_event_loop()
+    local_dirs = set()
+
+    async def fetch(path):
+        """
+        :return: (data, size, checksum) with the size and checksum the response reports, data None if over
+                 small_file_bytes
+        """
+        async with (await client._send('GET', path, 200, retry=False)) as response:
+            size = response.content_length
+            if size is not None and size > small_file_bytes:
+                return None, size, None
+            if size is None:
+                # Without a Content-Length the body is read up to the limit only
+                data = b''
+                while len(data) <= small_file_bytes:
+                    chunk = await response.content.read(small_file_bytes + 1 - len(data))
+                    if not chunk:
+                        break
+                    data += chunk
+                if len(data) > small_file_bytes:
+                    return None, None, None
+            else:
+                data = await response.read()
+            checksum = response.headers.get('OC-Checksum')
+        await client._throttle(path, len(data), bandwidth)
+        client.metrics.received(len(data))
+        return data, size, checksum
+
+    async def transfer(src, dst):
+        directory = os.path.dirname(dst)
+        if directory and directory not in local_dirs:
+            os.makedirs(directory, exist_ok=True)
+            local_dirs.add(directory)
+        path = src.name if isinstance(src, File) else src
+        data = None
+        if not isinstance(src, File) or src.size <= small_file_bytes:
+            # Small file: one GET read whole and written straight to dst, no part file or range plan
+            async with client.limit_files:
+                data, size, checksum = await client.retry_policy.call('GET', lambda: fetch(path))
+        if data is None:
+            error = await client.download(src, dst, bandwidth=bandwidth)
+            if error:
+                raise WebdavException(error)
+            return os.path.getsize(dst)
+
+        # Checked against the listing where there is one, otherwise against the response headers
+        if isinstance(src, File):
+            size, checksum = src.size, src.checksum
+        if size is not None and len(data) != size:
+            raise WebdavException('Received %d bytes of "%s", expected %d' % (len(data), path, size))
+        for kind, value in parse_checksums(checksum).items():
+            if kind in DOWNLOAD_CHECKSUMS and hashlib.new(kind.lower(), data).hexdigest() != value.lower():
+                raise WebdavException('Invalid Checksum, expected: %s' % checksum)
+        async with client.limit_files:
+            await loop.run_in_executor(client._io_executor, _write_file, dst, data)
+        return len(data)
+
+    return _run(pairs, transfer, concurrency, stats)
+
+
+def verify_many(client, pairs, concurrency, processes=None, stats=None):
+    """
+    Implementation of Client.verify_many
+    """
+    stats = stats if stats is not None else BulkStats()
+    loop = asyncio.get_event_loop()
+    executor = ProcessPoolExecutor(processes) if processes else client._io_executor
+
+    async def verify(src, dst):
+        remote_file = src if isinstance(src, File) else (await client.ls(src))[0]
+        size = os.path.getsize(dst)
+        if size != remote_file.size:
+            raise WebdavException('"%s" has %d bytes, expected %d' % (dst, size, remote_file.size))
+        expected = dict((kind, value.lower()) for kind, value in parse_checksums(remote_file.checksum).items()
+                        if kind in DOWNLOAD_CHECKSUMS)
+        if expected:
+            async with client.limit_files:
+                local = await loop.run_in_executor(executor, file_checksums, dst, tuple(expected))
+            if local != expected:
+                raise WebdavException('Invalid Checksum of "%s", expected: %s' % (dst, remote_file.checksum))
+        return size
+
+    async def results():
+        try:
+            async for result in _run(pairs, verify, concurrency, stats):
+                yield result
+        finally:
+            if processes:
+                executor.shutdown(wait=False)
+
+    return results()
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = 10000
+CACHE_TTL = 30  # seconds an entry is served without asking the server
+
+
+class CacheEntry(object):
+    __slots__ = ('value', 'etag', 'lastmodified', 'expires')
+
+    def __init__(self, value, etag, lastmodified, expires):
+        self.value = value
+        self.etag = etag
+        self.lastmodified = lastmodified
+        self.expires = expires
+
+    def fresh(self):
+        return time.monotonic() < self.expires
+
+
+class MetadataCache(object):
+    """
+    Size bounded LRU of remote metadata (listings and existence) keyed by normalized url.
+    Entries are served directly until their ttl expires, after which an entry with an
+    ETag is revalidated with a conditional request rather than fetched again.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        """
+        :param int max_entries: number of urls kept, least recently used are evicted first
+        :param float ttl: seconds before an entry needs revalidating
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # url -> {kind: CacheEntry}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(url):
+        return url.rstrip('/') or url
+
+    def get(self, url, kind):
+        """
+        :param str url: normalized url
+        :param str kind: type of metadata, eg. 'ls' or 'exists'
+        :return: (CacheEntry or None) entry, possibly stale
+        """
+        kinds = self._entries.get(url)
+        if kinds is None or kind not in kinds:
+            return None
+        self._entries.move_to_end(url)
+        return kinds[kind]
+
+    def put(self, url, kind, value, etag=None, lastmodified=None):
+        kinds = self._entries.setdefault(url, {})
+        kinds[kind] = CacheEntry(value, etag, lastmodified, time.monotonic() + self.ttl)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def refresh(self, entry):
+        entry.expires = time.monotonic() + self.ttl
+
+    def invalidate(self, url):
+        self._entries.pop(url, None)
+
+    def invalidate_tree(self, url):
+        """
+        Drop url and every url below it, after a collection was deleted, moved or replaced
+        """
+        self._entries.pop(url, None)
+        prefix = url + '/'
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, revalidations=self.revalidations,
+                    evictions=self.evictions, entries=len(self._entries))
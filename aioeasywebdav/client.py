@@ -1,13 +1,18 @@
+import io
 import os
 import ssl
+import json
 import time
 import shutil
 import logging
 import hashlib
+import heapq
 import asyncio
 import aiohttp
 import platform
 import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABCMeta, abstractmethod
 from numbers import Number
 import xml.etree.cElementTree as xml
@@ -16,9 +21,55 @@ from urllib.parse import urlparse, quote, unquote
 
 from http.client import responses as HTTP_CODES
 
+from .cache import MetadataCache
+from .retry import RetryPolicy
+from .throttle import TokenBucket
+from .metrics import Metrics
+from .tracing import trace_config, trace_chunk, end_trace, TracedResponse
+from .listing import File, Listing, isdir
+
 DOWNLOAD_CHUNK_SIZE_BYTES = 1 * 1024 * 1024
 MAX_OPEN_FILES = 512
+IO_THREADS = 8
 TEMP_NAME='.part'
+RESUME_NAME='.part.json'
+DOWNLOAD_RANGE_SIZE_BYTES = 10 * 1000 * 1000
+DOWNLOAD_STREAMS_PER_FILE = 8
+MIN_RANGE_SIZE_BYTES = 2 * DOWNLOAD_CHUNK_SIZE_BYTES  # never split off less than this
+MAX_RANGE_SIZE_BYTES = 512 * 1024 * 1024
+RANGE_TARGET_SECONDS = 10  # adaptive ranges are sized to take about this long at the stream's observed rate
+STREAM_BUFFER_BYTES = 64 * 1024 * 1024  # out of order data held when downloading into a file object, or for checksums
+UPLOAD_CHUNK_SIZE_BYTES = 1 * 1024 * 1024
+UPLOAD_CHECKSUMS = ('MD5',)
+CHUNKED_UPLOAD_SIZE_BYTES = 10 * 1024 * 1024
+CHUNKED_UPLOAD_PARALLEL = 4
+CHUNKED_UPLOAD_MAX_CHUNKS = 10000  # limit of the Nextcloud chunking v2 protocol
+WALK_CONCURRENCY = 8
+SYNC_CONCURRENCY = 8
+BATCH_CONCURRENCY = 16
+BATCH_OPERATIONS = ('delete', 'move', 'copy', 'mkdir', 'mkdirs', 'rmdir')
+BULK_CONCURRENCY = 16
+BULK_SMALL_FILE_BYTES = 1 * 1024 * 1024  # upload_many / download_many move files up to this size in one request
+SEEK_SKIP_BYTES = 256 * 1024  # short forward seeks read through the open response rather than reconnecting
+RESUME_SAVE_INTERVAL = 2  # seconds between writes of the resume sidecar
+RESUME_BLOCK_SIZE_BYTES = 4 * 1024 * 1024  # granularity of the block hashes in the resume sidecar
+PAUSE_HOLD_SECONDS = 30  # a paused upload keeps its PUT open this long, then sends it again once resumed
+TRANSFER_SLOTS = 4  # concurrent transfers per TransferManager class
+DOWNLOAD_CHECKSUMS = ('MD5', 'SHA1', 'SHA256')  # server checksums a download is verified against
+HASH_READ_SIZE_BYTES = 1024 * 1024
+
+
+PROPFIND_BODY = """<?xml version="1.0"?>
+<a:propfind xmlns:a="DAV:">
+    <a:prop xmlns:oc="http://owncloud.org/ns">
+        <oc:checksums/>
+        <a:getcontentlength/>
+        <a:getlastmodified/>
+        <a:creationdate/>
+        <a:getcontenttype/>
+        <a:getetag/>
+    </a:prop>
+</a:propfind>"""
 
 
 class WebdavException(Exception):
@@ -29,11 +80,26 @@ class ConnectionFailed(WebdavException):
     pass
 
 
+class _UploadPaused(WebdavException):
+    """
+    A PUT given up because its upload stayed paused longer than PAUSE_HOLD_SECONDS
+    """
+    pass
+
+
+class RangeNotSupported(WebdavException):
+    """
+    The server answered a range request with something other than the requested range
+    """
+    pass
+
+
 def codestr(code):
     return HTTP_CODES.get(code, 'UNKNOWN')
 
 
-File = namedtuple('File', ['name', 'size', 'mtime', 'ctime', 'contenttype', 'checksum'])
+# Outcome of one operation of Client.batch, error is None on success
+BatchResult = namedtuple('BatchResult', ['operation', 'result', 'error'])
 
 
 def prop(elem, name, default=None, ns='{DAV:}'):
@@ -41,21 +107,880 @@ def prop(elem, name, default=None, ns='{DAV:}'):
     return default if child is None else child.text
 
 
+_DAV_HREF = '{DAV:}href'
+_DAV_PROPSTAT = '{DAV:}propstat'
+_DAV_PROP = '{DAV:}prop'
+_OC_CHECKSUMS = '{http://owncloud.org/ns}checksums'
+
+
+def _strip_prefix(text, prefix):
+    return text[len(prefix):] if prefix and text.startswith(prefix) else text
+
+
+def _prop_text(props, tag, default):
+    value = props.get(tag)
+    return default if value is None else value.text
+
+
 def elem2file(elem, baseurl='', basepath=''):
-    length = prop(elem, 'getcontentlength', 0)
+    """
+    Convert a multistatus <D:response> to a File, walking each propstat/prop once
+    """
+    href = ''
+    props = {}
+    for child in elem:
+        if child.tag == _DAV_HREF:
+            href = child.text or ''
+        elif child.tag == _DAV_PROPSTAT:
+            for prop_elem in child.iterfind(_DAV_PROP):
+                for value in prop_elem:
+                    if value.tag not in props:
+                        props[value.tag] = value
+    basepath = '/' + basepath.strip('/') if basepath.strip('/') else ''
+    length = _prop_text(props, '{DAV:}getcontentlength', None)
+    # Owncloud Webdav checksum support. Unsure if regular owncloud client creates the checksum, if not refer to:
+    # https://github.com/owncloud/core/pull/21997#issuecomment-176972659
+    # Silently ignored on other webdav servers.
+    checksums = props.get(_OC_CHECKSUMS)
+    checksum = checksums[0].text if checksums is not None and len(checksums) else None
     return File(
-        unquote(prop(elem, 'href').replace(baseurl, '').replace(basepath, '')),
+        unquote(_strip_prefix(_strip_prefix(href, baseurl), basepath)),
         int(length) if length else 0,
-        prop(elem, 'getlastmodified', ''),
-        prop(elem, 'creationdate', ''),
-        prop(elem, 'getcontenttype', ''),
-        # Owncloud Webdav checksum support. Unsure if regular owncloud client creates the checksum, if not refer to:
-        # https://github.com/owncloud/core/pull/21997#issuecomment-176972659
-        # Silently ignored on other webdav servers.
-        prop(elem, 'checksum', None, ns='{http://owncloud.org/ns}'),
+        _prop_text(props, '{DAV:}getlastmodified', ''),
+        _prop_text(props, '{DAV:}creationdate', ''),
+        _prop_text(props, '{DAV:}getcontenttype', ''),
+        checksum,
+        _prop_text(props, '{DAV:}getetag', None),
     )
 
 
+def _host_key(host, scheme='http'):
+    """
+    :param str host: host name, host:port or url
+    :param str scheme: scheme giving the default port of a host without one
+    :return: 'hostname:port', lower case and with the default port filled in
+    """
+    parsed = urlparse(host if '://' in host else '//' + host)
+    port = parsed.port or {'http': 80, 'https': 443}.get(parsed.scheme or scheme)
+    return '%s:%s' % ((parsed.hostname or '').lower(), port)
+
+
+def parse_checksums(checksum):
+    """
+    :param (str or None) checksum: oc:checksum value, eg. "SHA1:abc MD5:def ADLER32:123"
+    :return: dict of upper case algorithm name to hex digest
+    """
+    checksums = {}
+    for entry in (checksum or '').split():
+        kind, _, value = entry.partition(':')
+        if value:
+            checksums[kind.upper()] = value
+    return checksums
+
+
+def _read_and_hash(fileobj, size, digests):
+    chunk = fileobj.read(size)
+    for digest in digests.values():
+        digest.update(chunk)
+    return chunk
+
+
+def _read_at(fileobj, lock, offset, size):
+    try:
+        return os.pread(fileobj.fileno(), size, offset)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        with lock:
+            fileobj.seek(offset)
+            return fileobj.read(size)
+
+
+def _remaining_size(fileobj):
+    """
+    :return: (int or None) bytes left to read from a regular file, None for pipes and other streams
+    """
+    try:
+        return os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        pass
+    try:
+        if fileobj.seekable():
+            pos = fileobj.tell()
+            size = fileobj.seek(0, os.SEEK_END) - pos
+            fileobj.seek(pos)
+            return size
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
+
+
+def _pwrite(fd, data, offset):
+    """
+    Write all of data to fd at offset without moving the shared file position
+    """
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def _hash_block(path, offset, size):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return hashlib.sha1(f.read(size)).hexdigest()
+
+
+def _hash_range(path, start, end, digests):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while start < end:
+            data = f.read(min(HASH_READ_SIZE_BYTES, end - start))
+            if not data:
+                raise WebdavException('"%s" ends at %d, expected %d bytes' % (path, start, end))
+            for digest in digests:
+                digest.update(data)
+            start += len(data)
+
+
+def file_checksums(path, kinds=('MD5',)):
+    """
+    Hash a local file with several algorithms in one read, a plain function so it can run in a process pool
+    :param str path: local file
+    :param tuple kinds: algorithms, eg. ('MD5', 'SHA256')
+    :return: dict of upper case algorithm name to lower case hex digest
+    """
+    digests = dict((kind.upper(), hashlib.new(kind.lower())) for kind in kinds)
+    _hash_range(path, 0, os.path.getsize(path), list(digests.values()))
+    return dict((kind, digest.hexdigest()) for kind, digest in digests.items())
+
+
+def _preallocate(fd, length):
+    if os.fstat(fd).st_size == length:
+        return
+    os.ftruncate(fd, length)
+    try:
+        os.posix_fallocate(fd, 0, length)
+    except (AttributeError, OSError):
+        pass  # sparse file from ftruncate is good enough
+
+
+class RangeWriter(object):
+    """
+    Writes the chunks of one download stream through a single open file handle.
+    Writes run on the client's bounded io thread pool with at most one write in
+    flight per stream, so a slow disk holds off the stream's next network read
+    rather than buffering or blocking the event loop.
+    """
+
+    def __init__(self, client, write, close=None, threaded=True):
+        """
+        :param Client client: owning client, provides the io thread pool and io_stats
+        :param write: callable(data, offset) performing a blocking write
+        :param close: optional callable releasing the file handle
+        :param bool threaded: run writes on the thread pool, otherwise inline on the event loop
+        """
+        self._client = client
+        self._write = write
+        self._close = close
+        self._threaded = threaded
+        self._future = None
+        self.pending = 0  # bytes handed to the writer but not yet confirmed written
+
+    def _timed_write(self, data, offset):
+        started = time.perf_counter()
+        self._write(data, offset)
+        return time.perf_counter() - started
+
+    async def write(self, data, offset):
+        await self.flush()
+        stats = self._client.io_stats
+        stats['writes'] += 1
+        self.pending = len(data)
+        if self._threaded:
+            loop = asyncio.get_event_loop()
+            self._future = loop.run_in_executor(self._client._io_executor, self._timed_write, data, offset)
+        else:
+            stats['blocking_time'] += self._timed_write(data, offset)
+            stats['bytes_written'] += self.pending
+            self.pending = 0
+
+    async def flush(self):
+        if self._future is None:
+            return
+        stats = self._client.io_stats
+        future, self._future = self._future, None
+        started = time.perf_counter()
+        try:
+            stats['thread_time'] += await future
+        finally:
+            stats['backpressure_time'] += time.perf_counter() - started
+        stats['bytes_written'] += self.pending
+        self.pending = 0
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            if self._close:
+                self._close()
+
+
+class DownloadState(object):
+    """
+    Resume metadata for a download into a single preallocated ``.part`` file.
+    The metadata lives in a small json sidecar next to the part file and records
+    how many bytes of each range have been written, and a hash of each fixed size
+    block once all of it is on disk. Blocks are hashed from the data as it is written,
+    ranges being split on block boundaries so each block has a single writer. Resuming
+    checks the blocks against their hashes and fetches again only what is missing or
+    damaged.
+    """
+
+    def __init__(self, local_path, remote_file, ranges, block_size=RESUME_BLOCK_SIZE_BYTES):
+        self.part_path = local_path + TEMP_NAME
+        self.path = local_path + RESUME_NAME
+        self.remote_file = remote_file
+        self.ranges = ranges  # [[start, end, written], ...] with end exclusive
+        self.block_size = block_size
+        self.blocks = {}  # block index -> SHA1 of the block as written
+        self.hasher = None  # PrefixHasher computing the checksums of the whole file
+        self.fd = None
+        self.executor = None
+        self.io_stats = dict(bytes_read_back=0)
+        self._digests = {}  # block index -> [SHA1 so far, next offset] of blocks being written
+        self._hashing = {}  # block index -> future of a hash read back from the part file
+        self._saved = 0
+        self._saving = None  # future of the sidecar write in progress
+        self._generation = 0  # sidecar snapshots taken
+        self._written_generation = 0  # latest snapshot on disk
+        self._save_lock = threading.Lock()
+
+    @staticmethod
+    def _identity(remote_file):
+        return dict(name=remote_file.name, size=remote_file.size,
+                    mtime=remote_file.mtime, checksum=remote_file.checksum)
+
+    @classmethod
+    def load(cls, local_path, remote_file, range_size=None):
+        """
+        Load the sidecar for local_path if it matches remote_file, otherwise start fresh
+        :param str local_path: final path of the download
+        :param File remote_file: remote file description as returned by ls
+        :param (int or None) range_size: size of each range for a fresh download, None for a single range
+        :return: DownloadState
+        """
+        state = cls(local_path, remote_file, [])
+        if os.path.exists(state.part_path):
+            try:
+                with open(state.path) as f:
+                    saved = json.load(f)
+                if saved['remote'] == cls._identity(remote_file):
+                    state.ranges = saved['ranges']
+                    state.block_size = saved.get('block_size', state.block_size)
+                    state.blocks = dict((int(index), digest) for index, digest in saved.get('blocks', {}).items())
+                    return state
+            except (OSError, ValueError, KeyError):
+                pass
+        size = remote_file.size
+        range_size = range_size or size
+        state.ranges = [[start, min(start + range_size, size), 0] for start in range(0, size, range_size)]
+        return state
+
+    @property
+    def written(self):
+        return sum(min(written, end - start) for start, end, written in self.ranges)
+
+    def open(self, executor=None, io_stats=None):
+        """
+        :param executor: thread pool hashing the blocks, the event loop's default if None
+        :param (dict or None) io_stats: client io_stats, counting the bytes read back from the part file
+        """
+        self.executor = executor
+        self.io_stats = io_stats if io_stats is not None else self.io_stats
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o666)
+        _preallocate(self.fd, self.remote_file.size)
+
+    def close(self):
+        if self.fd is not None:
+            self.save()
+            os.close(self.fd)
+            self.fd = None
+
+    def _covered(self, start, end):
+        """
+        :return: True if every byte from start to end (exclusive) has been written
+        """
+        for rng_start, rng_end, written in self.ranges:
+            if rng_start < end and rng_end > start and rng_start + written < min(rng_end, end):
+                return False
+        return True
+
+    def restart(self):
+        """
+        Forget what has been written, the whole file is fetched again as one range
+        """
+        self.ranges = [[0, self.remote_file.size, 0]]
+        self.blocks = {}
+        self._digests = {}
+
+    def _prefix(self):
+        """
+        :return: number of bytes from the start of the file which have all been written
+        """
+        for start, end, written in self.ranges:
+            if written < end - start:
+                return start + written
+        return self.remote_file.size
+
+    def _block_bounds(self, index):
+        start = index * self.block_size
+        return start, min(start + self.block_size, self.remote_file.size)
+
+    def write(self, data, offset):
+        """
+        Write to the part file and hash the data into its blocks, runs on the io thread pool.
+        Each block is written in order by one stream, a block whose data doesn't arrive in
+        order is left to be read back from the part file once complete.
+        """
+        _pwrite(self.fd, data, offset)
+        end = offset + len(data)
+        position = offset
+        while position < end:
+            index = position // self.block_size
+            block_start, block_end = self._block_bounds(index)
+            digest = self._digests.get(index)
+            if digest is None and position == block_start and index not in self.blocks:
+                digest = self._digests[index] = [hashlib.sha1(), block_start]
+            piece_end = min(end, block_end)
+            if digest is not None:
+                if position > digest[1]:
+                    del self._digests[index]  # gap, a stream started mid block
+                elif piece_end > digest[1]:
+                    digest[0].update(data[digest[1] - offset:piece_end - offset])
+                    digest[1] = piece_end
+                    if piece_end == block_end:
+                        self.blocks[index] = digest[0].hexdigest()
+                        del self._digests[index]
+            position = piece_end
+
+    def _hash(self, index):
+        start, end = self._block_bounds(index)
+        self.io_stats['bytes_read_back'] += end - start
+        loop = asyncio.get_event_loop()
+        future = self._hashing[index] = loop.run_in_executor(self.executor, _hash_block, self.part_path, start,
+                                                             end - start)
+
+        def hashed(future):
+            if self._hashing.get(index) is future:
+                del self._hashing[index]
+                if not future.cancelled() and future.exception() is None:
+                    self.blocks[index] = future.result()
+        future.add_done_callback(hashed)
+
+    def update(self, rng, written, force=False):
+        before = rng[0] + rng[2]
+        rng[2] = min(written, rng[1] - rng[0])
+        after = rng[0] + rng[2]
+        if after > before and self.fd is not None:
+            # Blocks this write completed which weren't hashed as written, read back while still cached
+            for index in range(before // self.block_size, (after - 1) // self.block_size + 1):
+                if index not in self.blocks and index not in self._hashing and self._covered(*self._block_bounds(index)):
+                    self._hash(index)
+            if self.hasher:
+                self.hasher.advance(self._prefix())
+        now = time.time()
+        if force or now - self._saved > RESUME_SAVE_INTERVAL:
+            self._save_later()
+            self._saved = now
+
+    async def flush(self):
+        """
+        Wait for the block hashes and the sidecar write in progress
+        """
+        while self._hashing:
+            await asyncio.gather(*self._hashing.values(), return_exceptions=True)
+        if self._saving is not None:
+            await asyncio.gather(self._saving, return_exceptions=True)
+
+    async def verify(self):
+        """
+        Check the blocks on disk against their hashes. Damaged blocks, and written blocks whose hash
+        wasn't recorded, are marked as not downloaded so only they are fetched again.
+        :return: list of the indices of the blocks to fetch again
+        """
+        await self.flush()
+        loop = asyncio.get_event_loop()
+        size = self.remote_file.size
+        count = -(-size // self.block_size)
+        recorded = sorted(index for index in self.blocks if index < count)
+        self.io_stats['bytes_read_back'] += sum(self._block_bounds(index)[1] - self._block_bounds(index)[0]
+                                                for index in recorded)
+        digests = await asyncio.gather(*[loop.run_in_executor(
+            self.executor, _hash_block, self.part_path, self._block_bounds(index)[0],
+            self._block_bounds(index)[1] - self._block_bounds(index)[0]) for index in recorded])
+        good = set(index for index, digest in zip(recorded, digests) if self.blocks[index] == digest)
+        bad = [index for index in range(count) if index not in good and self._covered(*self._block_bounds(index))]
+        self.blocks = dict((index, self.blocks[index]) for index in good)
+        self._digests = {}
+        # One range per run of good or missing blocks
+        ranges = []
+        for index in range(count):
+            start, end = self._block_bounds(index)
+            done = index in good
+            if ranges and (ranges[-1][2] == ranges[-1][1] - ranges[-1][0]) == done:
+                ranges[-1][1] = end
+                if done:
+                    ranges[-1][2] = end - ranges[-1][0]
+            else:
+                ranges.append([start, end, end - start if done else 0])
+        self.ranges = ranges
+        if bad:
+            self.save()
+        return bad
+
+    def _snapshot(self):
+        self._generation += 1
+        return self._generation, dict(remote=self._identity(self.remote_file), block_size=self.block_size,
+                                      ranges=[list(rng) for rng in self.ranges], blocks=dict(self.blocks))
+
+    def _write(self, generation, saved):
+        with self._save_lock:
+            if generation < self._written_generation:
+                return  # a later snapshot was written first, or the sidecar removed
+            self._written_generation = generation
+            temp = self.path + '.tmp'
+            with open(temp, 'w') as f:
+                json.dump(saved, f)
+            os.replace(temp, self.path)
+
+    def _save_later(self):
+        """
+        Write the sidecar on the io thread pool, skipped while the previous write is still running
+        """
+        if self._saving is not None and not self._saving.done():
+            return
+        loop = asyncio.get_event_loop()
+        self._saving = loop.run_in_executor(self.executor, self._write, *self._snapshot())
+
+    def save(self):
+        self._write(*self._snapshot())
+
+    def remove(self):
+        with self._save_lock:
+            self._written_generation = float('inf')
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+class PrefixHasher(object):
+    """
+    Checksums of a download computed while it runs, so the final check needn't read the file again.
+    Digests advance over the file in order: data arriving at the hashed position is hashed straight
+    from memory, data arriving ahead of it is held until the position reaches it. Past max_bytes held
+    or waiting to be hashed, data is dropped and read back from the part file once it is all on disk
+    and everything before it is hashed. Hashing runs on a thread of its own, off the event loop.
+    """
+
+    def __init__(self, client, path, kinds, max_bytes=STREAM_BUFFER_BYTES):
+        """
+        :param Client client: owning client, its io_stats count the bytes read back
+        :param str path: part file being downloaded into
+        :param tuple kinds: algorithms, eg. ('MD5', 'SHA1')
+        :param int max_bytes: cap on data held in memory, out of order or waiting for the hashing thread
+        """
+        self._client = client
+        self.path = path
+        self.max_bytes = max_bytes
+        self.digests = dict((kind.upper(), hashlib.new(kind.lower())) for kind in kinds)
+        self.position = 0  # bytes submitted for hashing, always a prefix of the file
+        self.held = 0  # bytes in memory, out of order or queued
+        self._ahead = {}  # offset -> data received ahead of position
+        self._offsets = []  # heap of the offsets in _ahead
+        self._executor = ThreadPoolExecutor(max_workers=1)  # one thread keeps the updates in order
+        self._last = None
+        self.error = None
+
+    def _update(self, data):
+        for digest in self.digests.values():
+            digest.update(data)
+
+    def _read_back(self, start, end):
+        _hash_range(self.path, start, end, list(self.digests.values()))
+
+    def _submit(self, held, fn, *args):
+        future = asyncio.wrap_future(self._executor.submit(fn, *args))
+
+        def done(future):
+            # On the event loop, like every change to held
+            self.held -= held
+            if not future.cancelled() and future.exception() is not None and self.error is None:
+                self.error = future.exception()
+        future.add_done_callback(done)
+        self._last = future
+
+    def _hash(self, offset, data):
+        if offset < self.position:
+            data = data[self.position - offset:]
+        self.held += len(data)
+        self.position += len(data)
+        self._submit(len(data), self._update, data)
+
+    def _drain(self):
+        while self._offsets and self._offsets[0] <= self.position:
+            offset = heapq.heappop(self._offsets)
+            data = self._ahead.pop(offset)
+            self.held -= len(data)
+            if offset + len(data) > self.position:
+                self._hash(offset, data)
+
+    def feed(self, offset, data):
+        """
+        Data received for offset, before or after it's written
+        """
+        if offset + len(data) <= self.position or offset in self._ahead or self.held + len(data) > self.max_bytes:
+            return  # already hashed, or left to be read back
+        if offset <= self.position:
+            self._hash(offset, data)
+            self._drain()
+        else:
+            self._ahead[offset] = data
+            heapq.heappush(self._offsets, offset)
+            self.held += len(data)
+
+    def advance(self, written):
+        """
+        :param int written: length of the prefix of the file known to be on disk
+        """
+        self._drain()
+        while self.position < written:
+            end = min(self._offsets[0], written) if self._offsets else written
+            self._client.io_stats['bytes_read_back'] += end - self.position
+            self._submit(0, self._read_back, self.position, end)
+            self.position = end
+            self._drain()
+
+    async def hexdigests(self, size):
+        """
+        :param int size: file size, all of it on disk
+        :return: dict of upper case algorithm name to lower case hex digest
+        """
+        self.advance(size)
+        if self._last is not None:
+            await asyncio.gather(self._last, return_exceptions=True)
+        if self.error is not None:
+            raise self.error
+        return dict((kind, digest.hexdigest()) for kind, digest in self.digests.items())
+
+    def close(self):
+        self._ahead.clear()
+        self._offsets = []
+        self._executor.shutdown(wait=False)
+
+
+class DownloadScheduler(object):
+    """
+    Hands out the byte ranges of one DownloadState to a bounded number of streams.
+    Each range is sized from the requesting stream's observed throughput and once no
+    unclaimed bytes remain, an idle stream splits the remainder of the range expected
+    to finish last. Ranges are split on the state's block boundaries.
+    """
+
+    def __init__(self, state, streams=DOWNLOAD_STREAMS_PER_FILE, min_size=MIN_RANGE_SIZE_BYTES,
+                 max_size=MAX_RANGE_SIZE_BYTES):
+        self.state = state
+        self.streams = max(1, streams)
+        self.min_size = min_size
+        self.max_size = max_size
+        self._active = {}  # id(range) -> (range, start time, written at start)
+
+    @staticmethod
+    def _remaining(rng):
+        return rng[1] - rng[0] - rng[2]
+
+    def range_size(self, rate=None):
+        """
+        :param (float or None) rate: throughput of the requesting stream in bytes per second, None if unknown
+        :return: number of bytes to give the stream next
+        """
+        if not rate:
+            size = min(DOWNLOAD_RANGE_SIZE_BYTES, -(-self.state.remote_file.size // self.streams))
+        else:
+            size = rate * RANGE_TARGET_SECONDS
+        return int(min(max(size, self.min_size), self.max_size))
+
+    def _align(self, offset):
+        return -(-offset // self.state.block_size) * self.state.block_size
+
+    def _split(self, rng, cut):
+        new = [cut, rng[1], 0]
+        rng[1] = cut
+        self.state.ranges.insert(self.state.ranges.index(rng) + 1, new)
+        return new
+
+    def _eta(self, active):
+        rng, started, initial = active
+        elapsed = time.time() - started
+        rate = (rng[2] - initial) / elapsed if elapsed > 0 else 0
+        return self._remaining(rng) / rate if rate else float('inf')
+
+    def next_range(self, rate=None):
+        """
+        Claim the next range for a stream
+        :param (float or None) rate: throughput the stream achieved on its previous range
+        :return: ([start, end, written] or None) range to download, None when there's nothing left worth splitting
+        """
+        # Leave a fair share of the unclaimed bytes for the other streams
+        unclaimed = sum(self._remaining(rng) for rng in self.state.ranges if id(rng) not in self._active)
+        idle = max(1, self.streams - len(self._active))
+        size = max(min(self.range_size(rate), -(-unclaimed // idle)), self.min_size)
+        claim = None
+        for rng in self.state.ranges:
+            if id(rng) not in self._active and self._remaining(rng) > 0:
+                cut = self._align(rng[0] + rng[2] + size)
+                if self._remaining(rng) > size + self.min_size and cut < rng[1]:
+                    self._split(rng, cut)
+                claim = rng
+                break
+        else:
+            # Nothing unclaimed, steal half the remainder of the range expected to finish last
+            if self._active:
+                victim = max(self._active.values(), key=self._eta)[0]
+                remaining = self._remaining(victim)
+                cut = self._align(victim[0] + victim[2] + remaining // 2)
+                if remaining >= 2 * self.min_size and cut < victim[1]:
+                    claim = self._split(victim, cut)
+        if claim:
+            self._active[id(claim)] = (claim, time.time(), claim[2])
+        return claim
+
+    def release(self, rng):
+        self._active.pop(id(rng), None)
+
+
+class ReorderBuffer(object):
+    """
+    Reassembles blocks fetched in parallel into a strictly sequential writer.
+    Blocks are claimed in order and no block more than max_bytes ahead of the
+    write position may be claimed, so at most max_bytes are held in memory.
+    """
+
+    def __init__(self, writer, size, block_size, max_bytes):
+        """
+        :param RangeWriter writer: sequential destination
+        :param int size: total number of bytes
+        :param int block_size: bytes fetched per request
+        :param int max_bytes: cap on bytes fetched ahead of the writer
+        """
+        self.writer = writer
+        self.size = size
+        self.block_size = block_size
+        self.blocks = -(-size // block_size)
+        self.window = max(1, max_bytes // block_size)
+        self.written = 0
+        self.error = None
+        self._next_claim = 0
+        self._next_write = 0
+        self._done = {}
+        self._cond = asyncio.Condition()
+
+    @staticmethod
+    def block_size_for(streams, max_bytes):
+        # Two blocks per stream fit in the buffer, so streams are rarely held up by a slow one
+        return int(min(max(max_bytes // (2 * max(1, streams)), 256 * 1024), DOWNLOAD_RANGE_SIZE_BYTES))
+
+    def block_range(self, index):
+        """
+        :return: (start, end) byte range of block index, end inclusive
+        """
+        start = index * self.block_size
+        return start, min(start + self.block_size, self.size) - 1
+
+    async def claim(self):
+        """
+        Wait until the next block fits in the buffer and claim it
+        :return: (int or None) block index, None when no blocks are left
+        """
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.error or self._next_claim >= self.blocks
+                                      or self._next_claim < self._next_write + self.window)
+            if self.error or self._next_claim >= self.blocks:
+                return None
+            self._next_claim += 1
+            return self._next_claim - 1
+
+    async def complete(self, index, data):
+        async with self._cond:
+            if self.error is not None:
+                return  # aborted, blocks still in flight are dropped rather than written
+            self._done[index] = data
+            while self._next_write in self._done:
+                data = self._done.pop(self._next_write)
+                await self.writer.write(data, self.written)
+                self.written += len(data)
+                self._next_write += 1
+            self._cond.notify_all()
+
+    async def abort(self, error):
+        async with self._cond:
+            self.error = error
+            self._done.clear()
+            self._cond.notify_all()
+
+
+class RemoteReader(object):
+    """
+    Seekable, read-only async file object over a remote file. Range requests are
+    issued lazily on read: sequential reads share one response and a seek only
+    costs a new request once data is read from the new position.
+    """
+
+    def __init__(self, client, path, size=None):
+        """
+        :param Client client: client used for requests
+        :param str path: remote path of the file
+        :param (int or None) size: size of the file if known, needed to seek relative to the end
+        """
+        self._client = client
+        self.name = path
+        self.size = size
+        self._pos = 0
+        self._response = None
+        self._response_pos = 0
+        self._leftover = None
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            if self.size is None:
+                raise WebdavException('Size of "%s" unknown, cannot seek from end' % self.name)
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+        self._pos = offset
+        return offset
+
+    async def _take(self, size):
+        chunk = self._leftover
+        if not chunk:
+            chunk = memoryview(await self._response.content.readany())
+            self._client._trace_chunk(self._response, len(chunk))
+        self._leftover = chunk[size:]
+        chunk = chunk[:size]
+        self._response_pos += len(chunk)
+        return chunk
+
+    async def _position_response(self):
+        if self._response is not None and not 0 <= self._pos - self._response_pos <= SEEK_SKIP_BYTES:
+            self._abandon()
+        if self._response is None:
+            if self.size is not None and self._pos >= self.size:
+                return False
+            headers = {"Range": "bytes=%d-" % self._pos} if self._pos else {}
+            response = await self._client._send('GET', self.name, (200, 206, 416), retry=False, headers=headers)
+            if response.status == 416:
+                await response.release()
+                return False
+            self._response = response
+            # A server ignoring the Range header starts from the beginning, skipped below
+            self._response_pos = self._pos if response.status == 206 else 0
+        while self._response_pos < self._pos:
+            if not await self._take(self._pos - self._response_pos):
+                await self.close()
+                return False
+        return True
+
+    def _abandon(self):
+        if self._response is not None:
+            self._response.close()
+        self._response = None
+        self._leftover = None
+
+    async def read_chunk(self, size=DOWNLOAD_CHUNK_SIZE_BYTES):
+        """
+        Read whatever is available up to size bytes without copying
+        :param int size: maximum number of bytes to return
+        :return: memoryview, empty at end of file
+        """
+        policy = self._client.retry_policy
+        attempt, started = 0, time.monotonic()
+        while True:
+            try:
+                if not await self._position_response():
+                    return memoryview(b'')
+                chunk = await self._take(size)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                # Reconnect and resume from the current position
+                self._abandon()
+                attempt += 1
+                if not policy.should_retry('GET', ex, attempt, started):
+                    raise
+                await asyncio.sleep(policy.delay(attempt, ex))
+        if not chunk:
+            await self.close()
+        self._pos += len(chunk)
+        self._client.metrics.received(len(chunk))
+        await self._client._throttle(self.name, len(chunk))
+        return chunk
+
+    async def read(self, size=-1):
+        """
+        :param int size: number of bytes to read, -1 to read to the end of the file
+        :return: bytes, shorter than size only at end of file
+        """
+        data = bytearray()
+        while size < 0 or len(data) < size:
+            chunk = await self.read_chunk(size - len(data) if size >= 0 else DOWNLOAD_CHUNK_SIZE_BYTES)
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    async def readinto(self, buffer):
+        """
+        Fill a caller owned (reusable) buffer
+        :param buffer: writable bytes-like object
+        :return: number of bytes read, less than len(buffer) only at end of file
+        """
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view):
+            chunk = await self.read_chunk(len(view) - filled)
+            if not chunk:
+                break
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+        return filled
+
+    async def close(self):
+        if self._response is not None:
+            await self._response.release()
+        self._response = None
+        self._leftover = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type:
+            self._abandon()
+        else:
+            await self.close()
+
+
 class OperationFailed(WebdavException):
     _OPERATIONS = dict(
         HEAD = "get header",
@@ -64,13 +989,16 @@ class OperationFailed(WebdavException):
         DELETE = "delete",
         MKCOL = "create directory",
         PROPFIND = "list directory",
+        MOVE = "move",
+        COPY = "copy",
         )
 
-    def __init__(self, method, path, expected_code, actual_code):
+    def __init__(self, method, path, expected_code, actual_code, headers=None):
         self.method = method
         self.path = path
         self.expected_code = expected_code
         self.actual_code = actual_code
+        self.headers = headers  # response headers, eg. Retry-After
         operation_name = self._OPERATIONS[method]
         self.reason = 'Failed to {operation_name} "{path}"'.format(**locals())
         expected_codes = (expected_code,) if isinstance(expected_code, Number) else expected_code
@@ -117,7 +1045,9 @@ class ProgressHandler(object):
 class Client(object):
 
     def __init__(self, url=None, host=None, port=0, auth=None, username=None, password=None,
-                 protocol='http', verify_ssl=True, path=None, cert=None, max_connections=65):
+                 protocol='http', verify_ssl=True, path=None, cert=None, max_connections=65,
+                 io_threads=IO_THREADS, max_streams=None, metadata_cache=None, retry_policy=None, max_bandwidth=None,
+                 tracer=None):
         self.log = logging.getLogger("%s.%s" % (self.__class__.__module__, self.__class__.__name__))
         self._max_connections = max_connections
 
@@ -133,6 +1063,16 @@ class Client(object):
                 self.baseurl = '{0}/{1}'.format(self.baseurl, path)
                 self.basepath = path
         self.cwd = '/'
+        # Optional MetadataCache serving repeated ls / exists calls
+        self.metadata_cache = metadata_cache
+        # Absolute paths of collections known to exist, lets mkdirs skip them
+        self._known_dirs = set()
+        self._mkdirs_pending = {}
+        # Retries of transient failures, for every request
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Bandwidth limits in bytes per second over every transfer of the client, and per server host
+        self.bandwidth = TokenBucket(max_bandwidth)
+        self.host_bandwidth = {}  # 'hostname:port' -> TokenBucket
 
         sslcontext = None
         if cert:
@@ -142,63 +1082,137 @@ class Client(object):
         if not auth and username and password:
             auth = aiohttp.BasicAuth(username, password=password)
 
-        self.session = aiohttp.ClientSession(connector=conn, auth=auth)
+        # Optional Tracer receiving the timeline of each request, no trace hooks are installed without one
+        self.tracer = tracer
+        self._traces = weakref.WeakKeyDictionary()  # response -> RequestTrace
+        trace_configs = [trace_config(tracer)] if tracer is not None else None
+        self.session = aiohttp.ClientSession(connector=conn, auth=auth, trace_configs=trace_configs,
+                                             response_class=TracedResponse if tracer is not None else aiohttp.ClientResponse)
 
         self._closed = False
-        self._rate_ave_period = 2  # approx period in seconds over which the download rate it averaged
-        self._download_rates = {}
-        self._rate_tracking = {}
-        self._rate_calc_future = asyncio.ensure_future(self._rate_calc())
+        # Traffic rates and request statistics, computed when read
+        self.metrics = Metrics()
 
         self.limit_files = asyncio.Semaphore(MAX_OPEN_FILES)
+        # Cap on concurrent download streams across every file on this client
+        self.limit_streams = asyncio.Semaphore(max_streams or max_connections)
+        self._io_executor = ThreadPoolExecutor(max_workers=io_threads)
+        # Disk write accounting, times in seconds. blocking_time is spent on the event loop itself,
+        # backpressure_time is network reads held off waiting for the disk, bytes_read_back counts every
+        # read of downloaded data back from disk to hash or verify it.
+        self.io_stats = dict(writes=0, bytes_written=0, thread_time=0.0, blocking_time=0.0, backpressure_time=0.0,
+                             bytes_read_back=0)
 
     def __del__(self):
         self.close()
 
     def close(self):
         self.session.close()
+        self._io_executor.shutdown(wait=False)
         self._closed = True
 
-    async def _rate_calc(self):
-        prev = time.time() - self._rate_ave_period
-        while not self._closed:
-            now = time.time()
-            for name, downloaded in self._rate_tracking.items():
-                # assert isinstance(entry, self._rate_tracking_entry)
-                period = now - prev
-                # moving = self._download_rates.get(name, 0)
-                # moving = moving + downloaded - moving/period
-                # self._download_rates[name] = moving
-                self._download_rates[name] = downloaded / period
-                self._rate_tracking[name] = 0
-            prev = now
-            await asyncio.sleep(self._rate_ave_period)
-
-    def _rate_notify(self, name, downloaded):
-        self._rate_tracking[name] = self._rate_tracking.get(name, 0) + downloaded
-        self._rate_tracking[None] = self._rate_tracking.get(None, 0) + downloaded
-
     def download_rate(self, name = None):
         """
-        :param (str or None) name: filename or None for global rate
-        :return: download rate in bytes per second
+        :param (str or None) name: local filename of a running download, or None for the client's rate
+        :return: download rate in bytes per second, a moving average over the last few seconds
+        """
+        if name is None:
+            return self.metrics.rate_in.value()
+        return self.metrics.transfer_rate(name)
+
+    def _trace_chunk(self, response, nbytes):
+        if self._traces:
+            trace = self._traces.get(response)
+            if trace is not None:
+                trace_chunk(self.tracer, trace, nbytes)
+
+    def set_bandwidth(self, rate, host=None):
+        """
+        Change a bandwidth limit, also while transfers are running
+        :param (float or None) rate: bytes per second, None for unlimited
+        :param (str or None) host: limit transfers to this host[:port], the port defaults to the client's scheme's,
+                                   None for the client wide limit
+        """
+        if host is None:
+            self.bandwidth.rate = rate
+            return
+        host = _host_key(host, urlparse(self.baseurl).scheme)
+        if host in self.host_bandwidth:
+            self.host_bandwidth[host].rate = rate
+        else:
+            self.host_bandwidth[host] = TokenBucket(rate)
+
+    async def _throttle(self, path, nbytes, bandwidth=None):
+        """
+        Wait until nbytes to or from path fit within the transfer's, the host's and the client's limits
+        :param (TokenBucket or None) bandwidth: limit of the individual transfer
         """
-        return self._download_rates.get(name, 0)# / self._rate_ave_period
+        host = _host_key(self._get_url(path)) if self.host_bandwidth else None
+        for bucket in (bandwidth, self.host_bandwidth.get(host), self.bandwidth):
+            if bucket is not None and bucket.rate:
+                await bucket.consume(nbytes)
 
-    async def _send(self, method, path, expected_code, **kwargs):
+    async def _send(self, method, path, expected_code, retry=True, **kwargs):
+        """
+        :param bool retry: retry transient failures according to retry_policy, only if the request body can be sent again
+        """
         url = self._get_url(path)
-        response = await self.session.request(method, url, allow_redirects=False, **kwargs)
-        if isinstance(expected_code, Number) and response.status != expected_code \
-            or not isinstance(expected_code, Number) and response.status not in expected_code:
-            raise OperationFailed(method, path, expected_code, response.status)
-        return response
+
+        async def send():
+            if self.tracer is not None:
+                kwargs['trace_request_ctx'] = trace_ctx = {'method': method, 'path': str(path)}
+            started = self.metrics.request_started(method)
+            try:
+                response = await self.session.request(method, url, allow_redirects=False, **kwargs)
+            except BaseException:
+                self.metrics.request_finished(method, started, failed=True)
+                raise
+            trace = trace_ctx.get('trace') if self.tracer is not None else None
+            if isinstance(expected_code, Number) and response.status != expected_code \
+                or not isinstance(expected_code, Number) and response.status not in expected_code:
+                self.metrics.request_finished(method, started, failed=True)
+                await response.release()
+                error = OperationFailed(method, path, expected_code, response.status, response.headers)
+                if trace is not None:
+                    end_trace(self.tracer, trace, error)
+                raise error
+            self.metrics.request_finished(method, started)
+            if trace is not None:
+                self._traces[response] = trace
+                # end_trace only acts once, whichever comes first of the end of the body, release and close
+                response.trace_end = lambda: end_trace(self.tracer, trace)
+                response.content.on_eof(response.trace_end)
+            return response
+
+        if not retry:
+            return await send()
+        return await self.retry_policy.call(method, send)
 
     def _get_url(self, path):
-        path = quote(str(path).strip())
+        path = str(path).strip()
+        if urlparse(path).scheme in ('http', 'https'):
+            return path  # already a full url, eg. a Nextcloud upload collection
+        path = quote(path)
         if path.startswith('/'):
             return self.baseurl + path
         return "".join((self.baseurl, self.cwd, path))
 
+    def _cache_key(self, path):
+        return MetadataCache.key(self._get_url(path))
+
+    def _invalidate(self, path, tree=False):
+        """
+        Drop cached metadata of path and its parent collection after a change
+        :param bool tree: also drop everything below path, for a collection deleted, moved or copied over
+        """
+        if self.metadata_cache is not None:
+            url = self._cache_key(path)
+            if tree:
+                self.metadata_cache.invalidate_tree(url)
+            else:
+                self.metadata_cache.invalidate(url)
+            self.metadata_cache.invalidate(url.rsplit('/', 1)[0])
+
     def cd(self, path):
         path = path.strip()
         if not path:
@@ -211,33 +1225,57 @@ class Client(object):
         else:
             self.cwd += stripped_path
 
+    def _remember_dirs(self, entries):
+        for entry in entries:
+            if isdir(entry):
+                self._known_dirs.add(entry.name.rstrip('/'))
+
+    def _forget_dirs(self, path):
+        path = self._abspath(path).rstrip('/')
+        if path in self._known_dirs:
+            prefix = path + '/'
+            self._known_dirs = set(known for known in self._known_dirs
+                                   if known != path and not known.startswith(prefix))
+
     async def mkdir(self, path, safe=False):
         expected_codes = 201 if not safe else (201, 301, 405)
+        self._invalidate(path)
         async with (await self._send('MKCOL', path, expected_codes)):
             pass
+        self._known_dirs.add(self._abspath(path).rstrip('/'))
+
+    async def _mkdir_shared(self, path):
+        # Concurrent mkdirs creating the same collection wait on a single MKCOL
+        future = self._mkdirs_pending.get(path)
+        if future is None:
+            future = asyncio.ensure_future(self.mkdir(path, safe=True))
+            self._mkdirs_pending[path] = future
+            future.add_done_callback(lambda f: self._mkdirs_pending.pop(path, None))
+        await asyncio.shield(future)
 
     async def mkdirs(self, path):
-        dirs = [d for d in path.split('/') if d]
-        if not dirs:
-            return
-        if path.startswith('/'):
-            dirs[0] = '/' + dirs[0]
-        old_cwd = self.cwd
-        try:
-            for dir in dirs:
-                try:
-                    await self.mkdir(dir, safe=True)
-                except Exception as e:
-                    if e.actual_code == 409:
-                        raise
-                finally:
-                    self.cd(dir)
-        finally:
-            self.cd(old_cwd)
+        """
+        Create path and any missing parents. Collections already known to exist, from earlier
+        mkdir, ls or walk calls on this client, are skipped.
+        :param str path: collection to create
+        :return: None
+        """
+        current = ''
+        for dir in [d for d in self._abspath(path).split('/') if d]:
+            current += '/' + dir
+            if current in self._known_dirs:
+                continue
+            try:
+                await self._mkdir_shared(current)
+            except OperationFailed as e:
+                if e.actual_code == 409:
+                    raise
 
     async def rmdir(self, path, safe=False):
         path = str(path).rstrip('/') + '/'
         expected_codes = 204 if not safe else (204, 404)
+        self._invalidate(path, tree=True)
+        self._forget_dirs(path)
         async with (await self._send('DELETE', path, expected_codes)):
             pass
 
@@ -247,23 +1285,373 @@ class Client(object):
         :return: None
         """
         path = path.name if isinstance(path, File) else path
+        self._invalidate(path, tree=True)
+        self._forget_dirs(path)
         async with (await self._send('DELETE', path, 204)):
             pass
 
-    async def upload(self, local_path_or_fileobj, remote_path):
-        if isinstance(local_path_or_fileobj, str):
-            async with self.limit_files:
-                with open(local_path_or_fileobj, 'rb') as f:
-                    await self._upload(f, remote_path)
-        else:
-            await self._upload(local_path_or_fileobj, remote_path)
+    async def _copy_or_move(self, method, src, dst, overwrite, depth):
+        src = src.name if isinstance(src, File) else src
+        headers = {'Destination': self._get_url(dst), 'Overwrite': 'T' if overwrite else 'F', 'Depth': depth}
+        self._invalidate(src, tree=True)
+        self._invalidate(dst, tree=True)
+        self._forget_dirs(dst)
+        if method == 'MOVE':
+            self._forget_dirs(src)
+        async with (await self._send(method, src, (201, 204), headers=headers)):
+            pass
 
-    async def _upload(self, fileobj, remote_path, **kwargs):
-        async with self.limit_files:
+    async def copy(self, src, dst, overwrite=False, depth='infinity'):
+        """
+        Copy a file or collection on the server, without the data passing through the client
+        :param (File | str) src: path from server root or File object to copy
+        :param str dst: destination path
+        :param bool overwrite: replace an existing destination, otherwise fail with 412
+        :param str depth: 'infinity' copies a collection with its contents, '0' the collection alone
+        :return: None
+        """
+        await self._copy_or_move('COPY', src, dst, overwrite, str(depth))
+
+    async def move(self, src, dst, overwrite=False):
+        """
+        Move or rename a file or collection on the server
+        :param (File | str) src: path from server root or File object to move
+        :param str dst: destination path
+        :param bool overwrite: replace an existing destination, otherwise fail with 412
+        :return: None
+        """
+        await self._copy_or_move('MOVE', src, dst, overwrite, 'infinity')
+
+    async def batch(self, operations, concurrency=BATCH_CONCURRENCY):
+        """
+        Run many independent operations concurrently, eg. [('move', 'a', 'b'), ('delete', 'c'),
+        ('copy', 'd', 'e', {'overwrite': True})]. A failure doesn't stop the other operations.
+        Operations may run in any order, create nested collections with 'mkdirs' rather than 'mkdir'.
+        :param operations: iterable of tuples (name, *args) with an optional dict of keyword arguments last,
+                           name being one of delete, move, copy, mkdir, mkdirs or rmdir
+        :param int concurrency: maximum operations in flight
+        :return: list of BatchResult in the order of operations
+        """
+        numbered = enumerate(operations)  # shared by the workers, so a generator of operations is consumed lazily
+        results = []
+
+        async def worker():
+            for index, operation in numbered:
+                results.append(None)
+                try:
+                    name, args = operation[0], list(operation[1:])
+                    if name not in BATCH_OPERATIONS:
+                        raise ValueError('Unsupported batch operation "%s"' % name)
+                    kwargs = args.pop() if args and isinstance(args[-1], dict) else {}
+                    results[index] = BatchResult(operation, await getattr(self, name)(*args, **kwargs), None)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    results[index] = BatchResult(operation, None, ex)
+
+        await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+        return results
+
+    def upload_many(self, pairs, concurrency=BULK_CONCURRENCY, checksums=UPLOAD_CHECKSUMS, mkdirs=True, bandwidth=None,
+                    stats=None, small_file_bytes=BULK_SMALL_FILE_BYTES):
+        """
+        Upload many files through a pool of workers sharing the client's connections. Files up to
+        small_file_bytes are read and hashed whole and sent in a single PUT, larger ones go through upload.
+        :param pairs: iterable of (local path, remote path), consumed as the workers need more
+        :param int concurrency: maximum uploads in flight
+        :param tuple checksums: algorithms computed over each file, MD5 is also sent as an OC-Checksum header
+        :param bool mkdirs: create the remote parent collections, each one once
+        :param (float or TokenBucket or None) bandwidth: bytes per second limit shared by all the uploads
+        :param (BulkStats or None) stats: totals updated as uploads finish
+        :param int small_file_bytes: largest file sent in one request
+        :return: async iterator of TransferResult in order of completion, failures carry the exception
+        """
+        from .bulk import upload_many
+        bandwidth = TokenBucket(bandwidth) if isinstance(bandwidth, Number) else bandwidth
+        return upload_many(self, pairs, concurrency, small_file_bytes, checksums, mkdirs, bandwidth, stats)
+
+    def download_many(self, pairs, concurrency=BULK_CONCURRENCY, bandwidth=None, stats=None,
+                      small_file_bytes=BULK_SMALL_FILE_BYTES):
+        """
+        Download many files through a pool of workers sharing the client's connections. Files up to
+        small_file_bytes are fetched in a single GET and written straight to the local path, without a
+        part file; larger ones go through download. Local parent directories are created once.
+        :param pairs: iterable of (File or remote path, local path), consumed as the workers need more.
+                      Passing the File from a listing lets large files skip the small file attempt.
+        :param int concurrency: maximum downloads in flight
+        :param (float or TokenBucket or None) bandwidth: bytes per second limit shared by all the downloads
+        :param (BulkStats or None) stats: totals updated as downloads finish
+        :param int small_file_bytes: largest file fetched in one request
+        :return: async iterator of TransferResult in order of completion, failures carry the exception
+        """
+        from .bulk import download_many
+        bandwidth = TokenBucket(bandwidth) if isinstance(bandwidth, Number) else bandwidth
+        return download_many(self, pairs, concurrency, small_file_bytes, bandwidth, stats)
+
+    def verify_many(self, pairs, processes=None, concurrency=BULK_CONCURRENCY, stats=None):
+        """
+        Check local copies against the size and checksums (MD5, SHA1, SHA256) the server reports, eg. a tree
+        downloaded earlier. Nothing is transferred, the local files are read and hashed.
+        :param pairs: iterable of (File or remote path, local path), consumed as the workers need more
+        :param (int or None) processes: hash in a pool of this many processes, spreading the work over several
+                                        cores, rather than on the client's io threads
+        :param int concurrency: maximum files being checked at once
+        :param (BulkStats or None) stats: totals updated as files are checked, bytes counts the bytes hashed
+        :return: async iterator of TransferResult in order of completion, mismatches carry a WebdavException
+        """
+        from .bulk import verify_many
+        return verify_many(self, pairs, concurrency, processes, stats)
+
+    async def upload(self, local_path_or_fileobj, remote_path, checksums=UPLOAD_CHECKSUMS, verify=None, precompute=False,
+                     bandwidth=None, progress_handler=None, enabled_event=None):
+        """
+        :param (str or file) local_path_or_fileobj: local file path or readable file-like object, which need not be seekable
+        :param str remote_path: destination path
+        :param tuple checksums: algorithms ('MD5', 'SHA1', 'SHA256') computed while the body is sent
+        :param (bool or None) verify: compare the computed checksums with the server's oc:checksums afterwards,
+                                      None does so when no OC-Checksum header went with the upload
+        :param bool precompute: read a seekable file beforehand to send an OC-Checksum MD5 header, for servers which
+                                must check the body as it arrives; a file which fits in one chunk is read once and
+                                always gets the header, otherwise the file is only read while it is sent
+        :param (float or TokenBucket or None) bandwidth: bytes per second limit of this upload, a TokenBucket can be
+                                                         adjusted while the upload runs or shared between uploads
+        :param (ProgressHandler or None) progress_handler: optional class of callbacks which gets notified of progress
+        :param (asyncio.Event or None) enabled_event: optional Event used to pause/resume the upload. The PUT is held
+                                                      open through a pause of up to PAUSE_HOLD_SECONDS, a longer one
+                                                      drops it and the PUT is sent again from the start on resume.
+                                                      A source which isn't seekable can't be sent again, its PUT is
+                                                      held for the whole pause, subject to the server's body timeout
+        :return: dict of algorithm to hex digest of the uploaded data
+        """
+        error = 'Unknown'
+        bandwidth = TokenBucket(bandwidth) if isinstance(bandwidth, Number) else bandwidth
+        self.metrics.transfer_started(str(remote_path))
+        try:
+            if isinstance(local_path_or_fileobj, str):
+                async with self.limit_files:
+                    with open(local_path_or_fileobj, 'rb') as f:
+                        hexdigests = await self._upload(f, remote_path, checksums, verify, precompute, bandwidth,
+                                                        progress_handler, enabled_event)
+            else:
+                hexdigests = await self._upload(local_path_or_fileobj, remote_path, checksums, verify, precompute,
+                                                bandwidth, progress_handler, enabled_event)
+            error = None
+            return hexdigests
+        except Exception as ex:
+            error = str(ex) or type(ex).__name__
+            raise
+        finally:
+            self.metrics.transfer_finished(str(remote_path))
+            if isinstance(progress_handler, ProgressHandler):
+                await progress_handler.done_callback(error)
+
+    async def _upload(self, fileobj, remote_path, checksums=UPLOAD_CHECKSUMS, verify=None, precompute=False, bandwidth=None,
+                      progress_handler=None, enabled_event=None, **kwargs):
+        headers = {}
+        size = _remaining_size(fileobj)
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        try:
+            start = fileobj.tell() if fileobj.seekable() else None
+        except (AttributeError, OSError, ValueError):
+            start = None
+        small = start is not None and size is not None and size <= UPLOAD_CHUNK_SIZE_BYTES
+        if small or precompute and start is not None:
+            # The header goes before the body, so the MD5 is known before sending
             loop = asyncio.get_event_loop()
-            local_hash = await loop.run_in_executor(None, self._md5, fileobj)
-        headers = {"OC-Checksum" : "MD5:%s" % local_hash}
-        async with (await self._send('PUT', remote_path, (200, 201, 204), data=fileobj, headers=headers, **kwargs)):
+            if small:
+                # Small enough to read once and send from memory
+                fileobj = io.BytesIO(await loop.run_in_executor(self._io_executor, fileobj.read))
+                start = 0
+            local_hash = await loop.run_in_executor(self._io_executor, self._md5, fileobj)
+            headers["OC-Checksum"] = "MD5:%s" % local_hash
+        digests = {}
+        self._invalidate(remote_path)
+
+        async def put():
+            # The body is streamed from the file, so each attempt rewinds it and hashes afresh
+            if start is not None:
+                fileobj.seek(start)
+            digests.clear()
+            digests.update((kind.upper(), hashlib.new(kind.lower())) for kind in checksums)
+            paused = [] if start is not None else None
+            try:
+                async with (await self._send('PUT', remote_path, (200, 201, 204), retry=False,
+                                             data=self._upload_body(fileobj, digests, remote_path, bandwidth, size,
+                                                                    progress_handler, enabled_event, paused),
+                                             headers=headers, **kwargs)):
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                if paused:
+                    # aiohttp reports the body's exception as a connection error, not retried either way
+                    raise _UploadPaused('Upload of "%s" paused' % remote_path) from ex
+                raise
+
+        while True:
+            try:
+                if start is None:
+                    await put()  # a pipe can't be sent twice
+                else:
+                    await self.retry_policy.call('PUT', put)
+                break
+            except _UploadPaused:
+                # The PUT was dropped during a long pause, sent again from the start once resumed
+                await enabled_event.wait()
+        hexdigests = dict((kind, digest.hexdigest()) for kind, digest in digests.items())
+        if verify or verify is None and "OC-Checksum" not in headers:
+            # Without the header the server couldn't check the body, compare with what it reports instead
+            await self._verify_checksums(remote_path, hexdigests, warn=bool(verify))
+        return hexdigests
+
+    async def _upload_body(self, fileobj, digests, remote_path=None, bandwidth=None, size=None, progress_handler=None,
+                           enabled_event=None, paused=None):
+        """
+        :param (list or None) paused: appended to when a pause outlasts PAUSE_HOLD_SECONDS and the body gives up,
+                                      None to hold the request for however long the pause lasts
+        """
+        # Each chunk is read and hashed on the io pool, the source is only read once
+        loop = asyncio.get_event_loop()
+        sent = 0
+        while True:
+            if enabled_event is not None and not enabled_event.is_set():
+                if paused is None:
+                    await enabled_event.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(enabled_event.wait(), PAUSE_HOLD_SECONDS)
+                    except asyncio.TimeoutError:
+                        paused.append(sent)
+                        raise _UploadPaused('Upload of "%s" paused' % remote_path)
+            chunk = await loop.run_in_executor(self._io_executor, _read_and_hash, fileobj, UPLOAD_CHUNK_SIZE_BYTES, digests)
+            if not chunk:
+                break
+            await self._throttle(remote_path, len(chunk), bandwidth)
+            self.metrics.sent(len(chunk), str(remote_path))
+            yield chunk
+            sent += len(chunk)
+            if isinstance(progress_handler, ProgressHandler):
+                await progress_handler.progress_callback(size, sent)
+
+    async def _verify_checksums(self, remote_path, hexdigests, warn=True):
+        """
+        :param bool warn: log a warning when the server reports no comparable checksum, rather than a debug message
+        """
+        remote = parse_checksums((await self.ls(remote_path))[0].checksum)
+        common = set(remote) & set(hexdigests)
+        if not common:
+            self.log.log(logging.WARNING if warn else logging.DEBUG,
+                         'No comparable checksum reported for "%s", upload not verified', remote_path)
+        for kind in common:
+            if remote[kind].lower() != hexdigests[kind]:
+                raise WebdavException('Checksum mismatch for "%s": %s:%s uploaded, server has %s:%s'
+                                      % (remote_path, kind, hexdigests[kind], kind, remote[kind]))
+
+    def _uploads_url(self):
+        parts = self.baseurl.rstrip('/').split('/dav/files/', 1)
+        if len(parts) != 2:
+            raise WebdavException('uploads_url is required for chunked upload to "%s"' % self.baseurl)
+        return '%s/dav/uploads/%s' % (parts[0], parts[1].split('/')[0])
+
+    async def upload_chunked(self, local_path_or_fileobj, remote_path, chunk_size=CHUNKED_UPLOAD_SIZE_BYTES,
+                             parallel=CHUNKED_UPLOAD_PARALLEL, progress_handler=None, uploads_url=None, transfer_id=None,
+                             bandwidth=None):
+        """
+        Upload with the Nextcloud / ownCloud chunking v2 protocol: chunks are sent in parallel into an upload
+        collection which is then moved to remote_path. Repeating an interrupted upload skips the chunks already sent.
+        :param (str or file) local_path_or_fileobj: local file path or seekable file-like object
+        :param str remote_path: destination path
+        :param int chunk_size: bytes per chunk, raised if needed to stay within the protocol's 10000 chunks
+        :param int parallel: number of chunks uploaded concurrently
+        :param (ProgressHandler or None) progress_handler: optional class of callbacks which gets notified of progress
+        :param (str or None) uploads_url: url of the uploads collection, derived from a .../dav/files/<user> url if None
+        :param (str or None) transfer_id: upload collection name, derived from the source and destination if None
+        :param (float or TokenBucket or None) bandwidth: bytes per second limit of this upload
+        :return: None
+        """
+        error = 'Unknown'
+        bandwidth = TokenBucket(bandwidth) if isinstance(bandwidth, Number) else bandwidth
+        self.metrics.transfer_started(str(remote_path))
+        try:
+            if isinstance(local_path_or_fileobj, str):
+                async with self.limit_files:
+                    with open(local_path_or_fileobj, 'rb') as f:
+                        await self._upload_chunked(f, remote_path, chunk_size, parallel, progress_handler,
+                                                   uploads_url, transfer_id, bandwidth)
+            else:
+                await self._upload_chunked(local_path_or_fileobj, remote_path, chunk_size, parallel, progress_handler,
+                                           uploads_url, transfer_id, bandwidth)
+            error = None
+        except Exception as ex:
+            error = str(ex) or type(ex).__name__
+            raise
+        finally:
+            self.metrics.transfer_finished(str(remote_path))
+            if isinstance(progress_handler, ProgressHandler):
+                await progress_handler.done_callback(error)
+
+    async def _upload_chunked(self, fileobj, remote_path, chunk_size, parallel, progress_handler, uploads_url, transfer_id,
+                              bandwidth=None):
+        size = _remaining_size(fileobj)
+        if size is None:
+            raise WebdavException('Chunked upload of "%s" needs a seekable source' % remote_path)
+        if not size:
+            await self._upload(fileobj, remote_path)
+            return
+        base = fileobj.tell()
+        destination = self._get_url(remote_path)
+        chunk_size = max(chunk_size, -(-size // CHUNKED_UPLOAD_MAX_CHUNKS))
+        if transfer_id is None:
+            try:
+                mtime = os.fstat(fileobj.fileno()).st_mtime
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                mtime = None
+            transfer_id = 'aioeasywebdav-%s' % hashlib.md5(repr((destination, size, mtime)).encode()).hexdigest()
+        upload_dir = '%s/%s' % ((uploads_url or self._uploads_url()).rstrip('/'), transfer_id)
+        headers = {'Destination': destination, 'OC-Total-Length': str(size)}
+        self._invalidate(remote_path)
+
+        try:
+            existing = dict((entry.name.rstrip('/').rsplit('/', 1)[-1], entry.size)
+                            for entry in await self.ls(upload_dir + '/'))
+        except OperationFailed as ex:
+            if ex.actual_code != 404:
+                raise
+            existing = {}
+            async with (await self._send('MKCOL', upload_dir, 201, headers={'Destination': destination})):
+                pass
+
+        chunks = [('%05d' % number, offset, min(chunk_size, size - offset))
+                  for number, offset in enumerate(range(0, size, chunk_size), 1)]
+        missing = [chunk for chunk in chunks if existing.get(chunk[0]) != chunk[2]]
+        uploaded = [size - sum(length for name, offset, length in missing)]
+        if isinstance(progress_handler, ProgressHandler):
+            await progress_handler.progress_callback(size, uploaded[0])
+
+        limit = asyncio.Semaphore(parallel)
+        lock = threading.Lock()
+        loop = asyncio.get_event_loop()
+
+        async def put(name, offset, length):
+            async with limit:
+                data = await loop.run_in_executor(self._io_executor, _read_at, fileobj, lock, base + offset, length)
+                await self._throttle(upload_dir, length, bandwidth)
+                self.metrics.sent(length, str(remote_path))
+                async with (await self._send('PUT', '%s/%s' % (upload_dir, name), (201, 204), data=data, headers=headers)):
+                    pass
+            uploaded[0] += length
+            if isinstance(progress_handler, ProgressHandler):
+                await progress_handler.progress_callback(size, uploaded[0])
+
+        results = await asyncio.gather(*[put(*chunk) for chunk in missing], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        if isinstance(progress_handler, ProgressHandler):
+            await progress_handler.verifying_callback()
+        async with (await self._send('MOVE', upload_dir + '/.file', (201, 204), headers=headers)):
             pass
 
     async def _check_existing_download(self, fileobj, remote_file, start):
@@ -282,17 +1670,63 @@ class Client(object):
                     fileobj.seek(0)
         return valid
 
-    async def _download_stream(self, local_path, part_path, remote_file, start, end, progress_callback = None, enabled_event = None):
+    @staticmethod
+    def _check_range(response, start, whole):
+        """
+        :param int start: first byte requested
+        :param bool whole: a 200 response with the whole file from byte 0 is acceptable
+        """
+        if response.status == 200:
+            if start or not whole:
+                raise RangeNotSupported('Server ignored the range request from byte %d of "%s"' % (start, response.url))
+            return
+        try:
+            first = int(response.headers['Content-Range'].split()[1].split('-')[0])
+        except (KeyError, IndexError, ValueError):
+            first = None
+        if first != start:
+            raise RangeNotSupported('Server sent Content-Range "%s" for a request from byte %d' % (
+                response.headers.get('Content-Range'), start))
+
+    def _range_writer(self, local_path, part_path, state):
+        if state:
+            return RangeWriter(self, state.write)
+        if isinstance(local_path, str):
+            fileobj = open(part_path, 'r+b')
+
+            def write(data, offset):
+                fileobj.seek(offset)
+                fileobj.write(data)
+            return RangeWriter(self, write, fileobj.close)
+        # Caller supplied file object, not necessarily thread safe so it's written on the loop
+        return RangeWriter(self, lambda data, offset: local_path.write(data), threaded=False)
+
+    async def _download_stream(self, local_path, part_path, remote_file, start, end, progress_callback = None, enabled_event = None,
+                               state = None, rng = None, bandwidth = None, transfer = None, stop_on_pause = False):
+        """
+        :param bool stop_on_pause: return once paused, for the caller to give up its stream slot while waiting,
+                                   rather than waiting to resume here
+        """
         finished = False
-        pos = existing = 0
-        retry = 5
-        while not finished and retry:
-            retry -= 1
+        transfer = str(local_path) if transfer is None else transfer
+        pos = existing = rng[2] if state else 0
+        attempt, started, failed_at = 0, time.monotonic(), None
+        while not finished:
             try:
-                if enabled_event:
+                if enabled_event and not enabled_event.is_set():
+                    # Paused, waiting outside limit_files with the connection let go
+                    if stop_on_pause:
+                        break
                     await enabled_event.wait()
 
-                if isinstance(local_path, str):
+                if state:
+                    # Single preallocated file, resume from the bytes already written to this range
+                    pos = rng[2]
+                    start, end = rng[0], rng[1] - 1
+                    req_start = start + pos
+                    if req_start > end:
+                        finished = True
+                elif isinstance(local_path, str):
                     exists = os.path.exists(part_path)
                     mode = 'r+b' if exists else 'w+b'
 
@@ -308,48 +1742,126 @@ class Client(object):
                             if req_start >= end:
                                 finished = True
                 else:
-                    req_start = start
+                    # File object written sequentially, carry on after the bytes it already received
+                    req_start = start + pos
+                    if req_start > end:
+                        finished = True
 
-                if not isinstance(end, int) or req_start < end:
+                if not finished and (state or not isinstance(local_path, str) or not isinstance(end, int) or req_start < end):
 
                     header = {"Range": "bytes=%s-%s" % (req_start, end)}
-                    async with (await self._send(
-                            'GET', remote_file.name, (200,206), chunked=True, headers=header)) as response:
-
-                        while True:
-                            if enabled_event and not enabled_event.is_set():
-                                await asyncio.sleep(3) # Rate limiting
-                                break
-                            chunk = await response.content.read(DOWNLOAD_CHUNK_SIZE_BYTES)
-                            if not chunk:
-                                finished = True
-                                break
-
-                            self._rate_notify(str(local_path), len(chunk))
-
-                            if isinstance(local_path, str):
-                                async with self.limit_files:
-                                    with open(part_path, 'r+b') as fileobj:
-                                        fileobj.seek(pos)
-                                        length = len(chunk)
-                                        fileobj.write(chunk)
-                                        pos += length
-                                        if progress_callback:
-                                            await progress_callback(part_path, pos)
-                            else:
-                                length = len(chunk)
-                                local_path.write(chunk)
-                                pos += length
-                                if progress_callback:
-                                    await progress_callback(part_path, pos)
-
-
+                    async with self.limit_files:
+                        writer = self._range_writer(local_path, part_path, state)
+                        offset = start if state else 0
+                        try:
+                            async with (await self._send(
+                                    'GET', remote_file.name, (200,206), retry=False, headers=header)) as response:
+                                # A whole body from byte 0 only fits where the stream stops at its range's end itself
+                                self._check_range(response, req_start, bool(state) or not isinstance(end, int) or
+                                                  end >= remote_file.size - 1)
+
+                                while True:
+                                    if enabled_event and not enabled_event.is_set():
+                                        # Paused: let the connection go, the next request resumes from pos
+                                        break
+                                    chunk = await response.content.read(DOWNLOAD_CHUNK_SIZE_BYTES)
+                                    if not chunk:
+                                        finished = True
+                                        break
+
+                                    self.metrics.received(len(chunk), transfer)
+                                    self._trace_chunk(response, len(chunk))
+                                    await self._throttle(remote_file.name, len(chunk), bandwidth)
+
+                                    if state and len(chunk) >= rng[1] - start - pos:
+                                        # Reached the end of the range, which the scheduler may have shortened mid-stream
+                                        chunk = chunk[:max(rng[1] - start - pos, 0)]
+                                        finished = True
+
+                                    # Waits for this stream's previous write, holding off the next network read
+                                    await writer.write(chunk, offset + pos)
+                                    if state and state.hasher:
+                                        state.hasher.feed(offset + pos, chunk)
+                                    pos += len(chunk)
+                                    if state:
+                                        state.update(rng, pos - writer.pending)
+                                    if progress_callback:
+                                        await progress_callback(part_path, pos)
+                                    if finished:
+                                        break
+                        finally:
+                            try:
+                                await writer.close()
+                            finally:
+                                if state:
+                                    state.update(rng, pos - writer.pending)
+
+            except asyncio.CancelledError:
+                raise
             except Exception as ex:
-                await asyncio.sleep(3) # Rate limiting
-                if not retry:
-                    raise  # somewhere to breakpoint
+                if failed_at != pos:
+                    # Made progress since the last failure, the budget applies to failures in a row
+                    attempt, started, failed_at = 0, time.monotonic(), pos
+                attempt += 1
+                if not self.retry_policy.should_retry('GET', ex, attempt, started):
+                    raise
+                # The next attempt resumes from the bytes already written
+                await asyncio.sleep(self.retry_policy.delay(attempt, ex))
         return part_path, pos - existing
 
+    async def _download_worker(self, scheduler, local_path, remote_file, progress_callback = None, enabled_event = None,
+                               bandwidth = None):
+        rate = None
+        while True:
+            if enabled_event:
+                # A paused stream waits without its slot, other transfers may use it meanwhile
+                await enabled_event.wait()
+            async with self.limit_streams:
+                rng = scheduler.next_range(rate)
+                if not rng:
+                    return
+                started = time.time()
+                try:
+                    part_path, downloaded = await self._download_stream(
+                        local_path, "%s@%d" % (scheduler.state.part_path, rng[0]), remote_file, rng[0], rng[1] - 1,
+                        progress_callback, enabled_event, scheduler.state, rng, bandwidth, stop_on_pause=True)
+                finally:
+                    scheduler.release(rng)
+            elapsed = time.time() - started
+            rate = downloaded / elapsed if elapsed > 0 else None
+
+    async def _reorder_worker(self, reorder, remote_file, progress_callback = None, enabled_event = None, bandwidth = None,
+                              transfer = None):
+        downloaded = 0
+        while True:
+            index = await reorder.claim()
+            if index is None:
+                return "stream", downloaded
+            start, end = reorder.block_range(index)
+            block = io.BytesIO()
+            try:
+                while block.tell() < end - start + 1:
+                    if enabled_event:
+                        # Paused, wait without a stream slot and carry on after the bytes already fetched
+                        await enabled_event.wait()
+                    async with self.limit_streams:
+                        part_path, fetched = await self._download_stream(
+                            block, "stream@%d" % start, remote_file, start + block.tell(), end, None, enabled_event,
+                            bandwidth=bandwidth, transfer=transfer, stop_on_pause=True)
+                    if not fetched and (enabled_event is None or enabled_event.is_set()):
+                        break
+                if block.tell() != end - start + 1:
+                    raise WebdavException("Short read of %s bytes %d-%d" % (remote_file.name, start, end))
+                await reorder.complete(index, block.getvalue())
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                await reorder.abort(ex)
+                raise
+            downloaded += end - start + 1
+            if progress_callback:
+                await progress_callback("stream", reorder.written)
+
     @staticmethod
     def join_parts(local_path, partfiles):
         # Join all parts together
@@ -365,6 +1877,12 @@ class Client(object):
         with open(fname, "rb") as f:
             return Client._md5(f)
 
+    async def _file_checksums(self, local_path, kinds):
+        loop = asyncio.get_event_loop()
+        self.io_stats['bytes_read_back'] += os.path.getsize(local_path)
+        async with self.limit_files:
+            return await loop.run_in_executor(self._io_executor, file_checksums, local_path, tuple(kinds))
+
     @staticmethod
     def _md5(fileobj):
         start = fileobj.tell()
@@ -374,18 +1892,32 @@ class Client(object):
         fileobj.seek(start)
         return hash_md5.hexdigest()
 
-    async def download(self, remote_file, local_path, progress_handler = None, enabled_event = None):
+    async def download(self, remote_file, local_path, progress_handler = None, enabled_event = None, single_file = True,
+                       streams_per_file = DOWNLOAD_STREAMS_PER_FILE, stream_buffer_bytes = STREAM_BUFFER_BYTES,
+                       bandwidth = None):
         """
-        :param str local_path: path to write local file
+        :param (str or file) local_path: path to write local file, or file-like object to write into
         :param File remote_file: remote file description as returned by ls
         :param (ProgressHandler or None) progress_handler: optional class of callbacks which gets notified of progress
-        :param (asyncio.Event or None) enabled_event: optional Event used to pause/resume download
+        :param (asyncio.Event or None) enabled_event: optional Event used to pause/resume download, streams stop before
+                                                      their next chunk, letting go of their connection and stream slot,
+                                                      and continue from there with a new range request on resume
+        :param bool single_file: write all ranges into one preallocated part file rather than joining .N.part files
+        :param int streams_per_file: maximum parallel range streams for this file, also capped client wide by max_streams
+        :param int stream_buffer_bytes: memory cap for blocks held out of order when local_path is a file object, and
+                                        for data held to compute the checksums of a single_file download as it arrives
+        :param (float or TokenBucket or None) bandwidth: bytes per second limit shared by this download's streams,
+                                                         a TokenBucket can be adjusted while the download runs
         :return:
         """
         error = 'Unknown'
         responses = []
         cur_lengths = {}
+        state = None
+        hasher = None
         loop = asyncio.get_event_loop()
+        bandwidth = TokenBucket(bandwidth) if isinstance(bandwidth, Number) else bandwidth
+        self.metrics.transfer_started(str(local_path))
 
         try:
             if isinstance(remote_file, str):
@@ -393,51 +1925,108 @@ class Client(object):
                 remote_file = (await self.ls(remote_file))[0]
 
             expected_length = remote_file.size
+            # Servers may report several checksums, eg. "SHA1:... MD5:... ADLER32:..."
+            expected_checksums = dict((kind, value.lower()) for kind, value in parse_checksums(remote_file.checksum).items()
+                                      if kind in DOWNLOAD_CHECKSUMS)
 
             chunks = []
-            range_details = None
+            downloads = []
 
-            if isinstance(local_path, str):
-                # Download to local filename in multiple part files
+            if isinstance(progress_handler, ProgressHandler):
+                async def progress_callback(part_path, cur_length):
+                    cur_lengths[part_path] = cur_length
+                    await progress_handler.progress_callback(expected_length, sum(cur_lengths.values()))
+            else:
+                progress_callback = None
 
+            if isinstance(local_path, str):
                 dirname = os.path.dirname(local_path)
                 if not dirname:
                     dirname = '.'
                 if not os.path.exists(dirname):
                     os.makedirs(dirname)
 
-                chunksize = (10*1000*1000)
+            if isinstance(local_path, str) and single_file:
+                # Download to a single preallocated part file, ranges handed out adaptively to each stream
+                if expected_length:
+                    state = DownloadState.load(local_path, remote_file)
+                    state.open(self._io_executor, self.io_stats)
+                    if expected_checksums:
+                        # Checksums computed as the data lands rather than by reading the file again at the end
+                        hasher = state.hasher = PrefixHasher(self, state.part_path, tuple(expected_checksums),
+                                                             stream_buffer_bytes)
+                    if state.written:
+                        # Resuming, check the blocks already on disk
+                        damaged = await state.verify()
+                        if damaged:
+                            self.log.warning('Fetching %d damaged blocks of "%s" again', len(damaged), local_path)
+                    scheduler = DownloadScheduler(state, streams_per_file)
+                    downloads = [self._download_worker(scheduler, local_path, remote_file, progress_callback, enabled_event,
+                                                       bandwidth)
+                                 for _ in range(scheduler.streams)]
+
+            elif isinstance(local_path, str):
+                # Download to local filename in multiple part files
+                chunksize = DOWNLOAD_RANGE_SIZE_BYTES
                 chunks = [(idx, rng, rng + chunksize-1) for idx, rng in enumerate(range(0, remote_file.size, chunksize))]
 
                 if chunks:
                     partname = "%s.{}%s" % (local_path, TEMP_NAME)
                     chunks[-1] = (chunks[-1][0],chunks[-1][1], expected_length)
-                    range_details = [(partname.format(str(i)),start,end) for i,start,end in chunks]
+                    downloads = [self._download_stream(local_path, partname.format(str(i)), remote_file, start, end,
+                                                       progress_callback, enabled_event, bandwidth=bandwidth)
+                                 for i, start, end in chunks]
 
             else:  # Assume local_path is a file-like object to stream into
-                range_details = [("stream", 0, remote_file.size)]
-
-            if range_details:
-
-                if isinstance(progress_handler, ProgressHandler):
-                    async def progress_callback(part_path, cur_length):
-                        cur_lengths[part_path] = cur_length
-                        await progress_handler.progress_callback(expected_length, sum(cur_lengths.values()))
+                block_size = ReorderBuffer.block_size_for(streams_per_file, stream_buffer_bytes)
+                if streams_per_file > 1 and expected_length > block_size:
+                    # Fetch blocks in parallel, written to the file object strictly in order
+                    reorder = ReorderBuffer(self._range_writer(local_path, "stream", None), expected_length,
+                                            block_size, stream_buffer_bytes)
+                    downloads = [self._reorder_worker(reorder, remote_file, progress_callback, enabled_event, bandwidth,
+                                                      str(local_path))
+                                 for _ in range(min(streams_per_file, reorder.blocks))]
                 else:
-                    progress_callback = None
-
-                downloads = [self._download_stream(local_path, part_path, remote_file, start, end, progress_callback, enabled_event)
-                             for part_path, start, end in range_details]
-                responses = await asyncio.gather(*downloads)
-
-            partfiles = [part for part, dl_size in responses]
+                    downloads = [self._download_stream(local_path, "stream", remote_file, 0, expected_length - 1,
+                                                       progress_callback, enabled_event, bandwidth=bandwidth)]
+
+            if downloads:
+                # Let every stream finish before raising, they share the part file handle
+                responses = await asyncio.gather(*downloads, return_exceptions=True)
+                if state and any(isinstance(response, RangeNotSupported) for response in responses):
+                    # Whole bodies instead of ranges, start over in one stream from the first byte
+                    self.log.warning('Server ignores range requests, downloading "%s" in one stream', local_path)
+                    await state.flush()
+                    state.restart()
+                    if hasher:
+                        hasher.close()
+                        hasher = state.hasher = PrefixHasher(self, state.part_path, tuple(expected_checksums),
+                                                             stream_buffer_bytes)
+                    cur_lengths.clear()
+                    responses = await asyncio.gather(self._download_stream(
+                        local_path, state.part_path, remote_file, 0, expected_length - 1, progress_callback,
+                        enabled_event, state, state.ranges[0], bandwidth), return_exceptions=True)
+                for response in responses:
+                    if isinstance(response, Exception):
+                        raise response
 
             if expected_length == 0:
                 error = "Null file reported"
             else:
-                if isinstance(local_path, str):  # Check and re-assemble part files
+                if not isinstance(local_path, str):
+                    if sum(dl_size for part, dl_size in responses) == expected_length:
+                        error = None
+
+                else:  # Check and re-assemble part files
                     local_temp = local_path + TEMP_NAME
-                    if sum([os.path.getsize(f) for f in partfiles]) == expected_length and len(partfiles) == len(chunks):
+                    if state:
+                        await state.flush()
+                        state.close()
+                        if state.written == expected_length:
+                            error = None
+                    elif sum([os.path.getsize(part) for part, dl_size in responses]) == expected_length \
+                            and len(responses) == len(chunks):
+                        partfiles = [part for part, dl_size in responses]
                         error = None
                         if len(chunks) > 1:
                             async with self.limit_files:
@@ -445,21 +2034,31 @@ class Client(object):
                         else:
                             os.rename(partfiles[0], local_temp)
 
-                    if remote_file.checksum:
+                    if expected_checksums and not error:
                         if isinstance(progress_handler, ProgressHandler):
                             await progress_handler.verifying_callback()
-                        kind, hash = remote_file.checksum.split(":")
-                        local_hash = None
-                        if kind == 'MD5':
-                            async with self.limit_files:
-                                local_hash = await loop.run_in_executor(None, self.md5, local_temp)
-                        if local_hash != hash:
+                        if hasher:
+                            local_checksums = await hasher.hexdigests(expected_length)
+                        else:
+                            local_checksums = await self._file_checksums(local_temp, expected_checksums)
+                        if local_checksums != expected_checksums and state and await self._repair_download(
+                                state, local_path, remote_file, progress_callback, enabled_event, bandwidth,
+                                streams_per_file):
+                            local_checksums = await self._file_checksums(local_temp, expected_checksums)
+                        if local_checksums != expected_checksums:
                             error = "Invalid Checksum, expected: %s" % str(remote_file.checksum)
                             os.rename(local_temp, local_path+".invalid")
+                            if state:
+                                state.remove()
 
                     if not error:
                         os.rename(local_temp, local_path)
+                        if state:
+                            state.remove()
 
+        except asyncio.CancelledError:
+            # An Exception before Python 3.8, a cancelled download isn't a failed one
+            raise
         except Exception as ex:
             tb = __import__('traceback').format_exc()
             error = str(ex)
@@ -467,42 +2066,287 @@ class Client(object):
                 error = type(ex)
 
         finally:
+            if hasher:
+                hasher.close()
+            if state:
+                try:
+                    await state.flush()
+                finally:
+                    state.close()
             if isinstance(progress_handler, ProgressHandler):
                 await progress_handler.done_callback(error)
-            if local_path in self._rate_tracking:
-                del self._rate_tracking[local_path]
-            if local_path in self._download_rates:
-                del self._download_rates[local_path]
+            self.metrics.transfer_finished(str(local_path))
         return error
 
-    async def ls(self, remote_path=''):
+    async def _repair_download(self, state, local_path, remote_file, progress_callback, enabled_event, bandwidth,
+                               streams_per_file):
+        """
+        Fetch again the blocks of a completed download which no longer match their recorded hashes
+        :param DownloadState state: closed state of the download
+        :return: True if any block was fetched again
+        """
+        state.hasher = None  # whatever is fetched again, the file is hashed anew
+        state.open(self._io_executor, self.io_stats)
+        try:
+            damaged = await state.verify()
+            if damaged:
+                self.log.warning('Checksum of "%s" failed, fetching %d damaged blocks again', local_path, len(damaged))
+                scheduler = DownloadScheduler(state, streams_per_file)
+                results = await asyncio.gather(*[
+                    self._download_worker(scheduler, local_path, remote_file, progress_callback, enabled_event, bandwidth)
+                    for _ in range(scheduler.streams)], return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        raise result
+                await state.flush()
+        finally:
+            state.close()
+        return bool(damaged)
+
+    async def iter_content(self, remote_path, start=0, end=None, chunk_size=DOWNLOAD_CHUNK_SIZE_BYTES):
+        """
+        Stream the content of a remote file without writing it anywhere
+        :param (File | str) remote_path: path from server root or File object to read
+        :param int start: first byte to return
+        :param (int or None) end: stop before this byte, None for the end of the file
+        :param int chunk_size: maximum size of each chunk
+        :return: async iterator of memoryview chunks as they arrive from the connection
+        """
+        if isinstance(remote_path, File):
+            reader = RemoteReader(self, remote_path.name, remote_path.size)
+        else:
+            reader = RemoteReader(self, remote_path)
+        reader.seek(start)
+        async with reader:
+            while end is None or reader.tell() < end:
+                chunk = await reader.read_chunk(chunk_size if end is None else min(chunk_size, end - reader.tell()))
+                if not chunk:
+                    break
+                yield chunk
+
+    async def open_read(self, remote_file):
+        """
+        :param (File | str) remote_file: path from server root or File object as returned by ls
+        :return: RemoteReader
+        """
+        if isinstance(remote_file, str):
+            # Lookup remote file details
+            remote_file = (await self.ls(remote_file))[0]
+        return RemoteReader(self, remote_file.name, remote_file.size)
+
+    async def ls(self, remote_path='', columnar=False):
         """
         :param str remote_path: path relative to the server to list
-        :return: [File]
+        :param bool columnar: return a Listing, compact for large collections, rather than a list
+        :return: [File] or Listing
         """
+        cache = self.metadata_cache
+        if cache is None:
+            entries = Listing() if columnar else []
+            async for entry in self.ils(remote_path):
+                entries.append(entry)
+            self._remember_dirs(entries)
+            return entries
+
+        url = self._cache_key(remote_path)
+        cached = cache.get(url, 'ls')
+        if cached is not None and cached.fresh():
+            cache.hits += 1
+            return Listing(cached.value) if columnar else list(cached.value)
         headers = {'Depth': '1'}
-        checksum_prop = """<?xml version="1.0"?>
-        <a:propfind xmlns:a="DAV:">
-            <a:prop xmlns:oc="http://owncloud.org/ns">
-                <oc:checksums/>
-                <a:getcontentlength/>
-                <a:getlastmodified/>
-                <a:creationdate/>
-                <a:getcontenttype/>
-            </a:prop>
-        </a:propfind>"""
+        expected_codes = (207, 301)
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+            expected_codes = (207, 301, 304, 412)  # 412 is the not modified response for methods other than GET/HEAD
+        async with (await self._send(
+                'PROPFIND', remote_path, expected_codes, headers=headers, data=PROPFIND_BODY)) as response:
+            if response.status in (304, 412):
+                cache.revalidations += 1
+                cache.refresh(cached)
+                return Listing(cached.value) if columnar else list(cached.value)
+            # Redirect
+            if response.status == 301:
+                return await self.ls(urlparse(response.headers['location']).path, columnar)
+            entries = [entry async for entry in self._iter_multistatus(response)]
+        self._remember_dirs(entries)
+        cache.misses += 1
+        path = self._abspath(remote_path).rstrip('/')
+        own = [entry for entry in entries if entry.name.rstrip('/') == path] or entries[:1]
+        # Files are immutable tuples, a tuple of them can be shared between the cache and callers
+        entries = tuple(entries)
+        cache.put(url, 'ls', entries, own[0].etag if own else None, own[0].mtime if own else None)
+        return Listing(entries) if columnar else list(entries)
+
+    async def ils(self, remote_path='', depth=1):
+        """
+        Iterate over a directory listing as it arrives. Entries are parsed incrementally and
+        discarded once yielded, so memory use stays flat however large the collection.
+        :param str remote_path: path relative to the server to list
+        :param (int or str) depth: PROPFIND depth, 0, 1 or 'infinity'
+        :return: async iterator of File
+        """
+        headers = {'Depth': str(depth)}
         async with (await self._send(
-                'PROPFIND', remote_path, (207, 301), headers=headers, data=checksum_prop)) as response:
+                'PROPFIND', remote_path, (207, 301), headers=headers, data=PROPFIND_BODY)) as response:
             # Redirect
             if response.status == 301:
                 url = urlparse(response.headers['location'])
-                return self.ls(url.path)
-            tree = xml.fromstring(await response.read())
+                async for entry in self.ils(url.path, depth):
+                    yield entry
+                return
+            async for entry in self._iter_multistatus(response):
+                yield entry
+
+    async def _iter_multistatus(self, response):
+        parser = xml.XMLPullParser(events=('start', 'end'))
+        root = None
+        while True:
+            data = await response.content.readany()
+            if data:
+                self._trace_chunk(response, len(data))
+                parser.feed(data)
+            else:
+                parser.close()
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                elif event == 'end' and elem.tag == '{DAV:}response':
+                    yield elem2file(elem, self.baseurl, self.basepath)
+                    root.remove(elem)
+            if not data:
+                break
+
+    def _abspath(self, path):
+        path = str(path).strip()
+        return path if path.startswith('/') else self.cwd + path
+
+    @staticmethod
+    def _split_listing(dirpath, entries):
+        dirs, files = [], []
+        for entry in entries:
+            if entry.name.rstrip('/') == dirpath.rstrip('/'):
+                continue  # the collection itself
+            (dirs if isdir(entry) else files).append(entry)
+        return dirs, files
+
+    async def walk(self, remote_path='', max_concurrency=WALK_CONCURRENCY, infinity=True):
+        """
+        Recursively list a collection like os.walk. The whole tree is requested in one Depth: infinity
+        PROPFIND where the server allows it, otherwise sibling collections are listed concurrently.
+        Removing entries from dirs before the next iteration prunes them from the walk.
+        :param str remote_path: collection to walk
+        :param int max_concurrency: maximum listing requests in flight
+        :param bool infinity: try a single Depth: infinity request first
+        :return: async iterator of (dirpath, dirs, files) where dirs and files are lists of File
+        """
+        root = self._abspath(remote_path).rstrip('/') + '/'
+
+        if infinity:
+            try:
+                entries = [entry async for entry in self.ils(root, depth='infinity')]
+                self._remember_dirs(entries)
+            except OperationFailed as ex:
+                if ex.actual_code not in (400, 403, 501):
+                    raise
+                # Server only allows finite depth, walk level by level instead
+            else:
+                children = {}
+                for entry in entries:
+                    children.setdefault(entry.name.rstrip('/').rsplit('/', 1)[0] + '/', []).append(entry)
+                queue = [root]
+                while queue:
+                    dirpath = queue.pop(0)
+                    dirs, files = self._split_listing(dirpath, children.get(dirpath, []))
+                    yield dirpath, dirs, files
+                    queue.extend(entry.name.rstrip('/') + '/' for entry in dirs)
+                return
+
+        work = asyncio.Queue()
+        results = asyncio.Queue()
+
+        async def worker():
+            while True:
+                dirpath = await work.get()
+                try:
+                    results.put_nowait((dirpath,) + self._split_listing(dirpath, await self.ls(dirpath)))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    results.put_nowait(ex)
 
-        entries = [elem2file(elem, self.baseurl, self.basepath) for elem in tree.findall('{DAV:}response')]
-        return entries
+        workers = [asyncio.ensure_future(worker()) for _ in range(max(1, max_concurrency))]
+        try:
+            work.put_nowait(root)
+            pending = 1
+            while pending:
+                result = await results.get()
+                pending -= 1
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+                # Queued after the caller had the chance to prune dirs
+                for entry in result[1]:
+                    work.put_nowait(entry.name.rstrip('/') + '/')
+                    pending += 1
+        finally:
+            for task in workers:
+                task.cancel()
+
+    async def sync_down(self, remote_dir, local_dir, concurrency=SYNC_CONCURRENCY, checksum=False, delete=False,
+                        dry_run=False, index=None, processes=None):
+        """
+        Bring local_dir up to date with a remote collection. Files are downloaded when missing locally,
+        when their size differs or when the remote copy is newer, and keep the remote modification time.
+        :param str remote_dir: collection to mirror
+        :param str local_dir: local directory, created if needed
+        :param int concurrency: maximum transfers (and checksum computations) in flight
+        :param bool checksum: decide on the server's MD5 instead of modification times where one is reported
+        :param bool delete: remove local files and directories which don't exist remotely
+        :param bool dry_run: only work out what would be done
+        :param (SyncIndex or None) index: state kept from previous runs, skips unchanged collections and hashes
+        :param (int or None) processes: with checksum, hash the local files in a pool of this many processes
+        :return: SyncReport with the plan, completed actions, errors, bytes transferred and throughput
+        """
+        from .sync import sync
+        return await sync(self, remote_dir, local_dir, True, concurrency, checksum, delete, dry_run, index, processes)
+
+    async def sync_up(self, local_dir, remote_dir, concurrency=SYNC_CONCURRENCY, checksum=False, delete=False,
+                      dry_run=False, index=None, processes=None):
+        """
+        Bring a remote collection up to date with local_dir. Files are uploaded when missing remotely,
+        when their size differs or when the local copy is newer.
+        :param str local_dir: local directory to mirror
+        :param str remote_dir: collection, created if needed
+        :param int concurrency: maximum transfers (and checksum computations) in flight
+        :param bool checksum: decide on the server's MD5 instead of modification times, and verify uploads
+        :param bool delete: remove remote files and collections which don't exist locally
+        :param bool dry_run: only work out what would be done
+        :param (SyncIndex or None) index: state kept from previous runs, skips unchanged collections and hashes
+        :param (int or None) processes: with checksum, hash the local files in a pool of this many processes
+        :return: SyncReport with the plan, completed actions, errors, bytes transferred and throughput
+        """
+        from .sync import sync
+        return await sync(self, remote_dir, local_dir, False, concurrency, checksum, delete, dry_run, index, processes)
 
     async def exists(self, remote_path):
-        async with (await self._send('HEAD', remote_path, (200, 301, 404))) as response:
+        cache = self.metadata_cache
+        cached = None
+        headers = {}
+        if cache is not None:
+            url = self._cache_key(remote_path)
+            cached = cache.get(url, 'exists')
+            if cached is not None and cached.fresh():
+                cache.hits += 1
+                return cached.value
+            if cached is not None and cached.etag:
+                headers['If-None-Match'] = cached.etag
+        async with (await self._send('HEAD', remote_path, (200, 301, 304, 404), headers=headers)) as response:
+            if response.status == 304 and cached is not None:
+                cache.revalidations += 1
+                cache.refresh(cached)
+                return cached.value
             ret =  True if response.status != 404 else False
+            if cache is not None:
+                cache.misses += 1
+                cache.put(url, 'exists', ret, response.headers.get('ETag'), response.headers.get('Last-Modified'))
         return ret
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+
+class SyncIndex(object):
+    """
+    On-disk record of both sides of a sync, kept in a SQLite database between runs.
+    Remote collections are stored with their ETag so unchanged subtrees needn't be listed again,
+    and local files with the size and mtime their MD5 was computed for so they needn't be hashed again.
+    One index describes one pair of directories; opening it for another pair starts it afresh.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: database file, created if missing
+        """
+        self.path = path
+        self.remote_dirs = {}  # relative path ('' for the root) -> ETag or None
+        self.remote_files = {}  # relative path -> (size, mtime, ctime, contenttype, checksum, etag)
+        self.local_files = {}  # relative path -> (size, mtime, md5 or None)
+        self._saved = ({}, {}, {})
+
+    def _connect(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        db = sqlite3.connect(self.path)
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS remote_dirs (path TEXT PRIMARY KEY, etag TEXT);
+            CREATE TABLE IF NOT EXISTS remote_files (path TEXT PRIMARY KEY, size INTEGER, mtime TEXT, ctime TEXT,
+                                                     contenttype TEXT, checksum TEXT, etag TEXT);
+            CREATE TABLE IF NOT EXISTS local_files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, md5 TEXT);
+        """)
+        return db
+
+    def load(self, remote_root, local_dir):
+        """
+        Read the recorded state, blocking
+        :param str remote_root: absolute remote collection being synced
+        :param str local_dir: local directory being synced
+        """
+        db = self._connect()
+        try:
+            roots = dict(db.execute('SELECT key, value FROM meta'))
+            wanted = {'remote_root': remote_root, 'local_dir': os.path.abspath(local_dir)}
+            if roots != wanted:
+                with db:
+                    for table in ('meta', 'remote_dirs', 'remote_files', 'local_files'):
+                        db.execute('DELETE FROM %s' % table)
+                    db.executemany('INSERT INTO meta VALUES (?, ?)', wanted.items())
+            self.remote_dirs = dict(db.execute('SELECT path, etag FROM remote_dirs'))
+            self.remote_files = dict((row[0], row[1:]) for row in db.execute('SELECT * FROM remote_files'))
+            self.local_files = dict((row[0], row[1:]) for row in db.execute('SELECT * FROM local_files'))
+        finally:
+            db.close()
+        self._saved = (dict(self.remote_dirs), dict(self.remote_files), dict(self.local_files))
+
+    def save(self):
+        """
+        Write the entries changed since load, blocking
+        """
+        db = self._connect()
+        try:
+            with db:
+                for table, current, saved in zip(('remote_dirs', 'remote_files', 'local_files'),
+                                                  (self.remote_dirs, self.remote_files, self.local_files), self._saved):
+                    db.executemany('DELETE FROM %s WHERE path = ?' % table,
+                                   ((path,) for path in saved if path not in current))
+                    changed = [(path,) + (row if isinstance(row, tuple) else (row,))
+                               for path, row in current.items() if saved.get(path, ()) != row]
+                    if changed:
+                        db.executemany('INSERT OR REPLACE INTO %s VALUES (%s)' % (table, ', '.join('?' * len(changed[0]))),
+                                       changed)
+        finally:
+            db.close()
+        self._saved = (dict(self.remote_dirs), dict(self.remote_files), dict(self.local_files))
+
+    def local_md5(self, path, size, mtime):
+        """
+        :return: (str or None) recorded MD5 of a local file if its size and mtime are unchanged
+        """
+        entry = self.local_files.get(path)
+        return entry[2] if entry is not None and entry[:2] == (size, mtime) else None
+
+    def invalidate_remote(self, path):
+        """
+        Forget the ETags of the collections above a changed remote path, so the next run lists them
+        :param str path: relative path of the changed entry
+        """
+        parts = path.strip('/').split('/')[:-1]
+        self.remote_dirs[''] = None
+        for i in range(len(parts)):
+            self.remote_dirs['/'.join(parts[:i + 1])] = None
@@ -0,0 +1,286 @@
+import sys
+import time
+import calendar
+import datetime
+import email.utils
+from array import array
+from collections import namedtuple
+
+_MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_NO_TIME = -2 ** 63  # missing timestamp in a Listing column
+_MONTHS = dict((name, number) for number, name in enumerate(_MONTH_NAMES, 1))
+
+
+def parse_http_date(text):
+    """
+    :param (str or None) text: RFC 1123 date such as getlastmodified, eg. "Sun, 06 Nov 1994 08:49:37 GMT"
+    :return: (int or None) epoch seconds
+    """
+    if not text:
+        return None
+    try:
+        # Fast path for the form servers send, email.utils handles the rest
+        _, day, month, year, clock, zone = text.split()
+        if zone == 'GMT':
+            hour, minute, second = clock.split(':')
+            return calendar.timegm((int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second)))
+    except (ValueError, KeyError):
+        pass
+    parsed = email.utils.parsedate_tz(text)
+    return int(email.utils.mktime_tz(parsed)) if parsed else None
+
+
+def parse_iso_date(text):
+    """
+    :param (str or None) text: ISO 8601 date such as creationdate, eg. "1994-11-06T08:49:37Z"
+    :return: (int or None) epoch seconds, times without an offset are taken as UTC
+    """
+    if not text:
+        return None
+    try:
+        value = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        return parse_http_date(text)  # some servers send creationdate in the getlastmodified format
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return int(value.timestamp())
+
+
+def format_http_date(epoch):
+    """
+    :param int epoch: seconds
+    :return: str RFC 1123 date, eg. "Sun, 06 Nov 1994 08:49:37 GMT"
+    """
+    t = time.gmtime(epoch)
+    return '%s, %02d %s %04d %02d:%02d:%02d GMT' % (_DAYS[t.tm_wday], t.tm_mday, _MONTH_NAMES[t.tm_mon - 1],
+                                                   t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def format_iso_date(epoch):
+    """
+    :param int epoch: seconds
+    :return: str ISO 8601 date in UTC, eg. "1994-11-06T08:49:37Z"
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
+
+
+def _epoch(value, parse):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return parse(value)
+    return int(value)
+
+
+def _date(value, format):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return format(value)
+
+
+def _isdir(name, contenttype):
+    return name.endswith('/') or contenttype == 'httpd/unix-directory'
+
+
+def isdir(entry):
+    """
+    :param File entry: listing entry
+    :return: True if the entry is a collection
+    """
+    return _isdir(entry.name, entry.contenttype)
+
+
+class File(namedtuple('File', ['name', 'size', 'mtime', 'ctime', 'contenttype', 'checksum'])):
+    """
+    Entry of a listing, a namedtuple. mtime and ctime are the dates as the server sent them, '' when
+    missing; modified and created parse them into epoch seconds, None when missing or unparsable.
+    Epoch seconds may be passed for mtime and ctime, they are formatted as HTTP and ISO 8601 dates.
+    The content type is interned, large listings share one string per type.
+    The ETag is an attribute outside the tuple, None unless the server sent one.
+    """
+    __slots__ = ()
+    etag = None
+
+    def __new__(cls, name, size, mtime='', ctime='', contenttype='', checksum=None, etag=None):
+        """
+        :param str name: path from the server root
+        :param int size: bytes
+        :param (str or int or None) mtime: last modification as an HTTP date or epoch seconds
+        :param (str or int or None) ctime: creation as an ISO 8601 date or epoch seconds
+        :param str contenttype: MIME type
+        :param (str or None) checksum: oc:checksum value
+        :param (str or None) etag: entity tag
+        """
+        if etag is not None and cls is File:
+            cls = _TaggedFile
+        entry = super(File, cls).__new__(cls, name, size, _date(mtime, format_http_date), _date(ctime, format_iso_date),
+                                         sys.intern(contenttype) if contenttype else '', checksum)
+        if etag is not None:
+            entry.__dict__['etag'] = etag
+        return entry
+
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+    @property
+    def modified(self):
+        return _epoch(self.mtime, parse_http_date)
+
+    @property
+    def created(self):
+        return _epoch(self.ctime, parse_iso_date)
+
+
+class _TaggedFile(File):
+    """
+    File carrying an ETag, which needs an instance dict as a tuple can't have further slots.
+    Read only like the tuple, entries are shared with the metadata cache.
+    """
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'File' object attribute '%s' is read-only" % name)
+
+    def _replace(self, **kwargs):
+        etag = kwargs.pop('etag', self.etag)
+        values = list(map(kwargs.pop, self._fields, self))
+        if kwargs:
+            raise ValueError('Got unexpected field names: %r' % list(kwargs))
+        return File(*values, etag=etag)
+
+    def __repr__(self):
+        return 'File(%s, etag=%r)' % (', '.join('%s=%r' % item for item in zip(self._fields, self)), self.etag)
+
+
+class Listing(object):
+    """
+    Column oriented listing: sizes and timestamps in arrays, names, interned content types, checksums
+    and ETags in lists. Takes a fraction of the memory of a list of File for large collections, and
+    sorts, filters and sums without creating a File per entry. Still reads as a sequence of File.
+    Dates are kept as epoch seconds, the server's text only where formatting them wouldn't give it back.
+    """
+    __slots__ = ('names', 'sizes', 'modified', 'created', 'mtimes', 'ctimes', 'contenttypes', 'checksums', 'etags')
+
+    def __init__(self, files=()):
+        """
+        :param files: iterable of File to start with
+        """
+        self.names = []
+        self.sizes = array('q')
+        self.modified = array('q')  # epoch seconds, _NO_TIME when missing
+        self.created = array('q')
+        self.mtimes = []  # date text which formatting modified doesn't reproduce, else None
+        self.ctimes = []
+        self.contenttypes = []
+        self.checksums = []
+        self.etags = []
+        for entry in files:
+            self.append(entry)
+
+    def append(self, entry):
+        """
+        :param File entry: entry to add
+        """
+        modified, created = entry.modified, entry.created
+        self.names.append(entry.name)
+        self.sizes.append(entry.size)
+        self.modified.append(_NO_TIME if modified is None else modified)
+        self.created.append(_NO_TIME if created is None else created)
+        self.mtimes.append(None if entry.mtime == _date(modified, format_http_date) else entry.mtime)
+        self.ctimes.append(None if entry.ctime == _date(created, format_iso_date) else entry.ctime)
+        self.contenttypes.append(entry.contenttype)
+        self.checksums.append(entry.checksum)
+        self.etags.append(entry.etag)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _entry(self, i):
+        mtime, ctime = self.mtimes[i], self.ctimes[i]
+        if mtime is None and self.modified[i] != _NO_TIME:
+            mtime = self.modified[i]
+        if ctime is None and self.created[i] != _NO_TIME:
+            ctime = self.created[i]
+        return File(self.names[i], self.sizes[i], mtime, ctime, self.contenttypes[i], self.checksums[i], self.etags[i])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._take(range(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Listing index out of range')
+        return self._entry(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._entry(i)
+
+    def __eq__(self, other):
+        if isinstance(other, Listing):
+            return all(getattr(self, column) == getattr(other, column) for column in self.__slots__)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return '<Listing of %d entries, %d bytes>' % (len(self), self.total_size())
+
+    def _take(self, indices):
+        taken = Listing()
+        for column in self.__slots__:
+            values = getattr(self, column)
+            picked = [values[i] for i in indices]
+            setattr(taken, column, array(values.typecode, picked) if isinstance(values, array) else picked)
+        return taken
+
+    def _column(self, key):
+        columns = dict(name=self.names, size=self.sizes, mtime=self.modified, modified=self.modified,
+                       ctime=self.created, created=self.created, contenttype=self.contenttypes)
+        if key not in columns:
+            raise ValueError('Cannot sort a listing by %r' % key)
+        return columns[key]
+
+    def sort(self, key='name', reverse=False):
+        """
+        Sort in place
+        :param str key: name, size, mtime, ctime or contenttype, entries without a timestamp come first
+        :param bool reverse: descending order
+        """
+        ordered = self._take(sorted(range(len(self)), key=self._column(key).__getitem__, reverse=reverse))
+        for column in self.__slots__:
+            setattr(self, column, getattr(ordered, column))
+
+    def filter(self, predicate=None, min_size=None, max_size=None, since=None, until=None, dirs=None):
+        """
+        :param predicate: function of a File returning True to keep it, slower than the other criteria
+        :param (int or None) min_size: smallest size kept
+        :param (int or None) max_size: largest size kept
+        :param (int or None) since: earliest modification kept, in epoch seconds
+        :param (int or None) until: latest modification kept, in epoch seconds
+        :param (bool or None) dirs: keep only collections if True, only files if False
+        :return: Listing of the matching entries
+        """
+        indices = range(len(self))
+        if min_size is not None:
+            indices = [i for i in indices if self.sizes[i] >= min_size]
+        if max_size is not None:
+            indices = [i for i in indices if self.sizes[i] <= max_size]
+        if since is not None:
+            indices = [i for i in indices if self.modified[i] != _NO_TIME and self.modified[i] >= since]
+        if until is not None:
+            indices = [i for i in indices if self.modified[i] != _NO_TIME and self.modified[i] <= until]
+        if dirs is not None:
+            indices = [i for i in indices if _isdir(self.names[i], self.contenttypes[i]) == dirs]
+        if predicate is not None:
+            indices = [i for i in indices if predicate(self._entry(i))]
+        return self._take(indices)
+
+    def total_size(self):
+        """
+        :return: sum of the sizes in bytes
+        """
+        return sum(self.sizes)
@@ -0,0 +1,329 @@
+import time
+import heapq
+import asyncio
+import itertools
+
+from .client import File, ProgressHandler, WebdavException, TRANSFER_SLOTS
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class TransferCancelled(WebdavException):
+    """
+    Raised by Transfer.wait for a cancelled transfer, unlike asyncio.CancelledError it doesn't
+    look like the waiting task itself was cancelled
+    """
+    pass
+
+
+class Transfer(object):
+    """
+    One upload or download owned by a TransferManager. state is one of queued, running, paused,
+    done, failed or cancelled.
+    """
+
+    def __init__(self, manager, transfer_id, kind, src, dst, priority, group, progress_handler, kwargs):
+        self.id = transfer_id
+        self.kind = kind  # 'download' or 'upload'
+        self.src = src
+        self.dst = dst
+        self.priority = priority  # higher runs first within its group
+        self.group = group
+        self.state = QUEUED
+        self.size = None
+        self.transferred = 0
+        self.verifying = False
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._manager = manager
+        self._handler = progress_handler
+        self._kwargs = kwargs
+        self._enabled = asyncio.Event()  # set while the transfer may move data
+        self._finished = asyncio.Event()
+        self._entry = None  # current queue entry, older ones are skipped
+        self._slot = False
+        self._task = None
+
+    def pause(self):
+        self._manager.pause(self)
+
+    def resume(self):
+        self._manager.resume(self)
+
+    def cancel(self):
+        self._manager.cancel(self)
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING, PAUSED)
+
+    async def wait(self):
+        """
+        Wait until the transfer is over
+        :return: result of the upload (dict of algorithm to hex digest) or download (None)
+        :raises TransferCancelled: the transfer was cancelled
+        """
+        await self._finished.wait()
+        if self.state == FAILED:
+            raise self.error
+        if self.state == CANCELLED:
+            raise TransferCancelled('Transfer %d was cancelled' % self.id)
+        return self.result
+
+    def snapshot(self):
+        """
+        :return: dict describing the transfer, rate in bytes per second
+        """
+        return dict(
+            id=self.id,
+            kind=self.kind,
+            src=self.src.name if isinstance(self.src, File) else str(self.src),
+            dst=str(self.dst),
+            priority=self.priority,
+            group=self.group,
+            state=self.state,
+            size=self.size,
+            transferred=self.transferred,
+            verifying=self.verifying,
+            rate=self._manager.client.metrics.transfer_rate(str(self.dst)) if self.state == RUNNING else 0.0,
+            error=None if self.error is None else str(self.error) or type(self.error).__name__,
+            created=self.created,
+            started=self.started,
+            finished=self.finished,
+        )
+
+    def __repr__(self):
+        return '<Transfer %d %s %s -> %s %s>' % (self.id, self.kind, self.snapshot()['src'], self.dst, self.state)
+
+
+class _TransferProgress(ProgressHandler):
+    """
+    Keeps a Transfer's progress up to date and forwards to the caller's ProgressHandler
+    """
+
+    def __init__(self, transfer):
+        self.transfer = transfer
+
+    async def progress_callback(self, total_size, current_size):
+        self.transfer.size = total_size
+        self.transfer.transferred = current_size
+        if isinstance(self.transfer._handler, ProgressHandler):
+            await self.transfer._handler.progress_callback(total_size, current_size)
+
+    async def done_callback(self, error):
+        if isinstance(self.transfer._handler, ProgressHandler):
+            await self.transfer._handler.done_callback(error)
+
+    async def verifying_callback(self):
+        self.transfer.verifying = True
+        if isinstance(self.transfer._handler, ProgressHandler):
+            await self.transfer._handler.verifying_callback()
+
+
+class TransferManager(object):
+    """
+    Queue of uploads and downloads run through a client. Each transfer belongs to a group with its own
+    number of concurrency slots, eg. {'interactive': 4, 'backfill': 2}, so urgent transfers needn't wait
+    for a running backfill; within a group, higher priorities start first.
+    Pausing takes effect before the next chunk and frees the transfer's slot; the connection is kept
+    through a short pause. Resuming queues the transfer for a slot again, it then carries on where it
+    stopped.
+    """
+
+    def __init__(self, client, slots=None, default_slots=TRANSFER_SLOTS):
+        """
+        :param Client client: client making the transfers
+        :param (dict or None) slots: group name to concurrent transfers
+        :param int default_slots: concurrent transfers of groups not in slots
+        """
+        self.client = client
+        self.slots = dict(slots or {})
+        self.default_slots = default_slots
+        self.transfers = {}  # id -> Transfer, finished ones are kept until clear
+        self._queues = {}  # group -> heap of [-priority, sequence, Transfer]
+        self._running = {}  # group -> transfers holding a slot
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count()
+
+    def download(self, remote_file, local_path, priority=0, group='default', progress_handler=None, **kwargs):
+        """
+        Queue a download, see Client.download for the keyword arguments
+        :param (File | str) remote_file: path from server root or File object as returned by ls
+        :param (str or file) local_path: path to write local file, or file-like object to write into
+        :param int priority: higher starts first within the group
+        :param str group: concurrency group
+        :param (ProgressHandler or None) progress_handler: optional class of callbacks which gets notified of progress
+        :return: Transfer
+        """
+        return self._add('download', remote_file, local_path, priority, group, progress_handler, kwargs)
+
+    def upload(self, local_path_or_fileobj, remote_path, priority=0, group='default', progress_handler=None, **kwargs):
+        """
+        Queue an upload, see Client.upload for the keyword arguments
+        :param (str or file) local_path_or_fileobj: local file path or readable file-like object
+        :param str remote_path: destination path
+        :param int priority: higher starts first within the group
+        :param str group: concurrency group
+        :param (ProgressHandler or None) progress_handler: optional class of callbacks which gets notified of progress
+        :return: Transfer
+        """
+        return self._add('upload', local_path_or_fileobj, remote_path, priority, group, progress_handler, kwargs)
+
+    def _add(self, kind, src, dst, priority, group, progress_handler, kwargs):
+        transfer = Transfer(self, next(self._ids), kind, src, dst, priority, group, progress_handler, kwargs)
+        self.transfers[transfer.id] = transfer
+        self._enqueue(transfer)
+        self._schedule()
+        return transfer
+
+    def _enqueue(self, transfer):
+        transfer.state = QUEUED
+        transfer._entry = [-transfer.priority, next(self._sequence), transfer]
+        heapq.heappush(self._queues.setdefault(transfer.group, []), transfer._entry)
+
+    def _release(self, transfer):
+        if transfer._slot:
+            transfer._slot = False
+            self._running[transfer.group] -= 1
+
+    def _schedule(self):
+        for group, queue in self._queues.items():
+            limit = self.slots.get(group, self.default_slots)
+            while queue and self._running.get(group, 0) < limit:
+                entry = heapq.heappop(queue)
+                transfer = entry[2]
+                if transfer.state != QUEUED or transfer._entry is not entry:
+                    continue  # paused, cancelled or reprioritized while queued
+                transfer._entry = None
+                transfer._slot = True
+                self._running[group] = self._running.get(group, 0) + 1
+                transfer.state = RUNNING
+                transfer._enabled.set()
+                if transfer._task is None:
+                    transfer.started = time.time()
+                    transfer._task = asyncio.ensure_future(self._run(transfer))
+
+    async def _run(self, transfer):
+        progress = _TransferProgress(transfer)
+        try:
+            if transfer.kind == 'download':
+                error = await self.client.download(transfer.src, transfer.dst, progress_handler=progress,
+                                                   enabled_event=transfer._enabled, **transfer._kwargs)
+                if error:
+                    raise WebdavException(error)
+            else:
+                transfer.result = await self.client.upload(transfer.src, transfer.dst, progress_handler=progress,
+                                                           enabled_event=transfer._enabled, **transfer._kwargs)
+        except asyncio.CancelledError:
+            transfer.state = CANCELLED
+        except Exception as ex:
+            transfer.state = FAILED
+            transfer.error = ex
+        else:
+            transfer.state = DONE
+        finally:
+            self._finish(transfer)
+
+    def _finish(self, transfer):
+        transfer.finished = time.time()
+        transfer._finished.set()
+        self._release(transfer)
+        self._schedule()
+
+    def pause(self, transfer):
+        """
+        Stop a queued or running transfer from moving data, its slot goes to the next queued transfer
+        """
+        if transfer.state not in (QUEUED, RUNNING):
+            return
+        transfer._enabled.clear()
+        transfer.state = PAUSED
+        self._release(transfer)
+        self._schedule()
+
+    def resume(self, transfer):
+        """
+        Queue a paused transfer for a slot again
+        """
+        if transfer.state != PAUSED:
+            return
+        self._enqueue(transfer)
+        self._schedule()
+
+    def cancel(self, transfer):
+        """
+        Stop a transfer for good. A cancelled download keeps its part file, so downloading again resumes it.
+        """
+        if not transfer.active:
+            return
+        if transfer._task is not None:
+            transfer._task.cancel()  # _run finishes the bookkeeping
+            return
+        transfer.state = CANCELLED
+        self._finish(transfer)
+
+    def set_priority(self, transfer, priority):
+        """
+        Change the priority of a transfer, taking effect on its position in the queue
+        """
+        transfer.priority = priority
+        if transfer.state == QUEUED:
+            self._enqueue(transfer)
+            self._schedule()
+
+    def pause_group(self, group):
+        for transfer in list(self.transfers.values()):
+            if transfer.group == group:
+                self.pause(transfer)
+
+    def resume_group(self, group):
+        for transfer in sorted(self.transfers.values(), key=lambda transfer: transfer.id):
+            if transfer.group == group:
+                self.resume(transfer)
+
+    def cancel_all(self):
+        for transfer in list(self.transfers.values()):
+            self.cancel(transfer)
+
+    async def join(self):
+        """
+        Wait until no transfer is queued or running, paused ones are not waited for
+        """
+        while True:
+            waiters = [asyncio.ensure_future(transfer._finished.wait()) for transfer in self.transfers.values()
+                       if transfer.state in (QUEUED, RUNNING)]
+            if not waiters:
+                return
+            try:
+                await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+
+    def clear(self):
+        """
+        Forget the finished transfers
+        """
+        self.transfers = dict((transfer_id, transfer) for transfer_id, transfer in self.transfers.items()
+                              if transfer.active)
+
+    def snapshot(self):
+        """
+        :return: dict with per group slots, running, queued and paused counts, and the snapshot of every transfer
+        """
+        groups = {}
+        for transfer in self.transfers.values():
+            counts = groups.setdefault(transfer.group, dict(
+                slots=self.slots.get(transfer.group, self.default_slots), queued=0, running=0, paused=0,
+                done=0, failed=0, cancelled=0))
+            counts[transfer.state] += 1
+        return dict(groups=groups,
+                    transfers=[transfer.snapshot() for _, transfer in sorted(self.transfers.items())])
@@ -0,0 +1,181 @@
+import math
+import time
+
+RATE_TIME_CONSTANT = 5  # seconds, older traffic counts for 1/e as much per time constant
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Rate(object):
+    """
+    Exponentially weighted moving average of a byte rate. Decay is applied when the rate is updated or
+    read, so nothing needs to run in the background.
+    """
+    __slots__ = ('time_constant', '_rate', '_updated')
+
+    def __init__(self, time_constant=RATE_TIME_CONSTANT):
+        self.time_constant = time_constant
+        self._rate = 0.0
+        self._updated = time.monotonic()
+
+    def _decayed(self, now):
+        return self._rate * math.exp(-(now - self._updated) / self.time_constant)
+
+    def add(self, nbytes):
+        now = time.monotonic()
+        self._rate = self._decayed(now) + nbytes / self.time_constant
+        self._updated = now
+
+    def value(self):
+        """
+        :return: bytes per second
+        """
+        return self._decayed(time.monotonic())
+
+
+class Histogram(object):
+    """
+    Cumulative bucket counts, sum and count of observed values, as in a Prometheus histogram
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return dict(buckets=dict(zip(self.buckets, self.counts)), sum=self.sum, count=self.count)
+
+
+class Metrics(object):
+    """
+    Traffic and request statistics of a client: bytes in and out with their EWMA rates, the rate of each
+    running transfer, request counts, errors and latency (time to response headers) per HTTP method, and
+    requests and transfers in flight.
+    """
+
+    def __init__(self, time_constant=RATE_TIME_CONSTANT, buckets=LATENCY_BUCKETS):
+        self.time_constant = time_constant
+        self.buckets = buckets
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.rate_in = Rate(time_constant)
+        self.rate_out = Rate(time_constant)
+        self.transfers = {}  # name -> Rate of transfers in progress, shared by those running under the same name
+        self._transfer_counts = {}  # name -> number of transfers in progress under it
+        self.requests = {}  # method -> count
+        self.errors = {}  # method -> count of failed attempts
+        self.in_flight = {}  # method -> requests awaiting a response
+        self.latency = {}  # method -> Histogram
+
+    def received(self, nbytes, transfer=None):
+        self.bytes_in += nbytes
+        self.rate_in.add(nbytes)
+        if transfer in self.transfers:
+            self.transfers[transfer].add(nbytes)
+
+    def sent(self, nbytes, transfer=None):
+        self.bytes_out += nbytes
+        self.rate_out.add(nbytes)
+        if transfer in self.transfers:
+            self.transfers[transfer].add(nbytes)
+
+    def transfer_started(self, transfer):
+        """
+        :param str transfer: name of the transfer, concurrent transfers of one name are counted together
+        """
+        count = self._transfer_counts.get(transfer, 0)
+        if not count:
+            self.transfers[transfer] = Rate(self.time_constant)
+        self._transfer_counts[transfer] = count + 1
+
+    def transfer_finished(self, transfer):
+        count = self._transfer_counts.get(transfer, 0) - 1
+        if count > 0:
+            self._transfer_counts[transfer] = count
+        else:
+            self._transfer_counts.pop(transfer, None)
+            self.transfers.pop(transfer, None)
+
+    def transfer_rate(self, transfer):
+        """
+        :return: bytes per second of a running transfer, 0 if it isn't running
+        """
+        rate = self.transfers.get(transfer)
+        return rate.value() if rate is not None else 0.0
+
+    def request_started(self, method):
+        self.requests[method] = self.requests.get(method, 0) + 1
+        self.in_flight[method] = self.in_flight.get(method, 0) + 1
+        return time.monotonic()
+
+    def request_finished(self, method, started, failed=False):
+        """
+        :param float started: value returned by request_started
+        :param bool failed: no response, or an unexpected status
+        """
+        self.in_flight[method] -= 1
+        if method not in self.latency:
+            self.latency[method] = Histogram(self.buckets)
+        self.latency[method].observe(time.monotonic() - started)
+        if failed:
+            self.errors[method] = self.errors.get(method, 0) + 1
+
+    def snapshot(self):
+        """
+        :return: dict of the current values, rates in bytes per second
+        """
+        return dict(
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            rate_in=self.rate_in.value(),
+            rate_out=self.rate_out.value(),
+            transfers=dict((name, rate.value()) for name, rate in self.transfers.items()),
+            requests=dict(self.requests),
+            errors=dict(self.errors),
+            in_flight=dict(self.in_flight),
+            latency=dict((method, histogram.snapshot()) for method, histogram in self.latency.items()),
+        )
+
+    def prometheus(self, prefix='aioeasywebdav'):
+        """
+        :param str prefix: metric name prefix
+        :return: str in the Prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name, kind, samples):
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for labels, value in samples:
+                label_text = ','.join('%s="%s"' % (key, val) for key, val in labels)
+                lines.append('%s_%s%s %s' % (prefix, name, '{%s}' % label_text if label_text else '', _number(value)))
+
+        metric('received_bytes_total', 'counter', [((), self.bytes_in)])
+        metric('sent_bytes_total', 'counter', [((), self.bytes_out)])
+        metric('receive_rate_bytes', 'gauge', [((), self.rate_in.value())])
+        metric('send_rate_bytes', 'gauge', [((), self.rate_out.value())])
+        metric('transfers_in_flight', 'gauge', [((), len(self.transfers))])
+        metric('requests_total', 'counter', [((('method', m),), n) for m, n in sorted(self.requests.items())])
+        metric('request_errors_total', 'counter', [((('method', m),), n) for m, n in sorted(self.errors.items())])
+        metric('requests_in_flight', 'gauge', [((('method', m),), n) for m, n in sorted(self.in_flight.items())])
+        lines.append('# TYPE %s_request_duration_seconds histogram' % prefix)
+        for method, histogram in sorted(self.latency.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append('%s_request_duration_seconds_bucket{method="%s",le="%s"} %d'
+                             % (prefix, method, _number(bound), count))
+            lines.append('%s_request_duration_seconds_bucket{method="%s",le="+Inf"} %d' % (prefix, method, histogram.count))
+            lines.append('%s_request_duration_seconds_sum{method="%s"} %s' % (prefix, method, _number(histogram.sum)))
+            lines.append('%s_request_duration_seconds_count{method="%s"} %d' % (prefix, method, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
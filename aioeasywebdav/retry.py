@@ -0,0 +1,129 @@
+import time
+import random
+import asyncio
+import email.utils
+
+import aiohttp
+
+RETRY_ATTEMPTS = 5
+RETRY_BACKOFF = 0.5  # seconds before the first retry, doubled for each further one
+RETRY_MAX_BACKOFF = 30
+RETRY_MAX_RETRY_AFTER = 120  # longest Retry-After honoured, in seconds
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, ConnectionError)
+# Idempotent methods, repeating them after a lost response is harmless. A MKCOL, MOVE or COPY which succeeded
+# but whose response was lost fails when repeated (405, 404, 412), so they aren't retried unless given a budget
+RETRY_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PROPFIND', 'PUT', 'DELETE')
+
+
+def parse_retry_after(value):
+    """
+    :param (str or None) value: Retry-After header, delay in seconds or an HTTP date
+    :return: (float or None) seconds to wait
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when a failed request is tried again. Failures are retried when they are
+    transient: a status in statuses or an exception in exceptions. Retries are spaced by exponential
+    backoff with full jitter, so clients failing together don't retry together, and wait at least as
+    long as the server's Retry-After. Only idempotent methods are retried unless budgets says otherwise.
+    """
+
+    def __init__(self, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF, max_backoff=RETRY_MAX_BACKOFF, jitter=True,
+                 statuses=RETRY_STATUSES, exceptions=RETRY_EXCEPTIONS, budgets=None, max_elapsed=None,
+                 max_retry_after=RETRY_MAX_RETRY_AFTER, methods=RETRY_METHODS):
+        """
+        :param int attempts: tries per operation including the first, 1 disables retrying
+        :param float backoff: upper bound of the first delay in seconds
+        :param float max_backoff: upper bound of any delay in seconds
+        :param bool jitter: pick each delay uniformly between 0 and its bound
+        :param tuple statuses: HTTP statuses treated as transient
+        :param tuple exceptions: exception types treated as transient
+        :param (dict or None) budgets: attempts per HTTP method overriding attempts, eg. {'MOVE': 1}
+        :param (float or None) max_elapsed: seconds after which an operation is no longer retried
+        :param float max_retry_after: cap on the delay requested by a Retry-After header
+        :param tuple methods: HTTP methods retried with attempts, others are tried once unless they have a budget
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+        self.budgets = dict(budgets or {})
+        self.max_elapsed = max_elapsed
+        self.max_retry_after = max_retry_after
+        self.methods = tuple(methods)
+
+    def attempts_for(self, method):
+        return self.budgets.get(method, self.attempts if method in self.methods else 1)
+
+    def retryable(self, error):
+        """
+        :param Exception error: failure of the last attempt
+        :return: True if the failure may be transient
+        """
+        status = getattr(error, 'actual_code', None)
+        if status is not None:
+            return status in self.statuses
+        return isinstance(error, self.exceptions)
+
+    def should_retry(self, method, error, attempt, started):
+        """
+        :param str method: HTTP method of the operation
+        :param Exception error: failure of the last attempt
+        :param int attempt: number of attempts made so far
+        :param float started: time.monotonic() of the first attempt
+        :return: True if another attempt should be made
+        """
+        if attempt >= self.attempts_for(method):
+            return False
+        if self.max_elapsed is not None and time.monotonic() - started >= self.max_elapsed:
+            return False
+        return self.retryable(error)
+
+    def delay(self, attempt, error=None):
+        """
+        :param int attempt: number of attempts made so far, 1 after the first failure
+        :param (Exception or None) error: failure of the last attempt, may carry a Retry-After header
+        :return: seconds to wait before the next attempt
+        """
+        bound = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        delay = random.uniform(0, bound) if self.jitter else bound
+        headers = getattr(error, 'headers', None)
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+    async def call(self, method, operation):
+        """
+        Run operation until it succeeds, fails permanently or the budget is spent
+        :param str method: HTTP method, selects the budget
+        :param operation: coroutine function making one attempt
+        :return: result of operation
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return await operation()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                attempt += 1
+                if not self.should_retry(method, ex, attempt, started):
+                    raise
+                await asyncio.sleep(self.delay(attempt, ex))
@@ -0,0 +1,303 @@
+import os
+import time
+import shutil
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .client import Client, File, WebdavException, OperationFailed, parse_checksums, SYNC_CONCURRENCY, TEMP_NAME, \
+    RESUME_NAME
+
+MTIME_TOLERANCE = 2  # seconds, covers servers and filesystems with coarse timestamps
+
+# action is one of 'mkdir', 'download', 'upload' or 'delete', path is relative to the synced directories
+SyncAction = namedtuple('SyncAction', ['action', 'path', 'reason', 'size'])
+
+
+class SyncReport(object):
+    """
+    Outcome of a sync_down / sync_up call. For a dry run only plan is filled in.
+    """
+
+    def __init__(self, plan, dry_run=False):
+        self.plan = plan
+        self.dry_run = dry_run
+        self.done = []  # actions completed
+        self.errors = []  # (action, error message)
+        self.bytes = 0  # bytes transferred
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """
+        :return: bytes per second transferred over the whole sync
+        """
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return '<SyncReport planned=%d done=%d errors=%d bytes=%d throughput=%.0fB/s>' % (
+            len(self.plan), len(self.done), len(self.errors), self.bytes, self.throughput)
+
+
+def _scan_local(local_dir):
+    """
+    :return: (files, dirs) where files maps relative path to (size, mtime) and dirs is a set of relative paths
+    """
+    files, dirs = {}, set()
+    for dirpath, dirnames, filenames in os.walk(local_dir):
+        rel = os.path.relpath(dirpath, local_dir).replace(os.sep, '/')
+        prefix = '' if rel == '.' else rel + '/'
+        dirs.update(prefix + name for name in dirnames)
+        for name in filenames:
+            if name.endswith(TEMP_NAME) or name.endswith(RESUME_NAME):
+                continue  # download in progress
+            stat = os.stat(os.path.join(dirpath, name))
+            files[prefix + name] = (stat.st_size, stat.st_mtime)
+    return files, dirs
+
+
+async def _scan_remote(client, remote_root, max_concurrency):
+    """
+    :return: (files, dirs) where files maps relative path to File and dirs is a set of relative paths
+    """
+    files, dirs = {}, set()
+    try:
+        async for dirpath, subdirs, entries in client.walk(remote_root, max_concurrency=max_concurrency):
+            dirs.update(entry.name[len(remote_root):].strip('/') for entry in subdirs)
+            files.update((entry.name[len(remote_root):], entry) for entry in entries)
+    except OperationFailed as ex:
+        if ex.actual_code != 404:
+            raise
+    return files, dirs
+
+
+def _under(path, roots):
+    """
+    :return: True if one of the collections above path is in roots
+    """
+    if '' in roots:
+        return True
+    parts = path.split('/')[:-1]
+    return any('/'.join(parts[:i + 1]) in roots for i in range(len(parts)))
+
+
+async def _scan_remote_indexed(client, remote_root, index, max_concurrency):
+    """
+    Like _scan_remote, but collections whose ETag matches the index aren't listed, their contents
+    come from the index. Relies on the server changing a collection's ETag whenever anything below
+    it changes, as ownCloud and Nextcloud do.
+    :return: (files, dirs)
+    """
+    try:
+        root = [entry async for entry in client.ils(remote_root, depth=0)]
+    except OperationFailed as ex:
+        if ex.actual_code != 404:
+            raise
+        index.remote_dirs, index.remote_files = {}, {}
+        return {}, set()
+    etags = {'': root[0].etag}
+    files, dirs, reused = {}, set(), set()
+    if root[0].etag and index.remote_dirs.get('') == root[0].etag:
+        reused.add('')
+    else:
+        async for dirpath, subdirs, entries in client.walk(remote_root, max_concurrency=max_concurrency, infinity=False):
+            files.update((entry.name[len(remote_root):], entry) for entry in entries)
+            listed = []
+            for entry in subdirs:
+                path = entry.name[len(remote_root):].strip('/')
+                dirs.add(path)
+                etags[path] = entry.etag
+                if entry.etag and index.remote_dirs.get(path) == entry.etag:
+                    reused.add(path)
+                else:
+                    listed.append(entry)
+            subdirs[:] = listed
+
+    for path, etag in index.remote_dirs.items():
+        if path and _under(path, reused):
+            dirs.add(path)
+            etags[path] = etag
+    for path, row in index.remote_files.items():
+        if _under(path, reused):
+            files[path] = File(remote_root + path, *row)
+    index.remote_dirs = etags
+    index.remote_files = dict((path, tuple(entry[1:]) + (entry.etag,)) for path, entry in files.items())
+    return files, dirs
+
+
+def _changed(src, dst):
+    """
+    :param tuple src: (size, mtime) of the source, mtime may be None
+    :param tuple dst: (size, mtime) of the destination
+    :return: (str or None) reason the destination is out of date
+    """
+    if src[0] != dst[0]:
+        return 'size'
+    if src[1] is not None and dst[1] is not None and src[1] > dst[1] + MTIME_TOLERANCE:
+        return 'mtime'
+    return None
+
+
+async def _local_md5(client, local_path, executor=None):
+    loop = asyncio.get_event_loop()
+    async with client.limit_files:
+        return await loop.run_in_executor(executor or client._io_executor, Client.md5, local_path)
+
+
+def _extraneous(dst_files, dst_dirs, src_files, src_dirs):
+    """
+    :return: relative paths of destination entries missing from the source, topmost collection only
+    """
+    removed = sorted(d for d in dst_dirs - src_dirs)
+    top = [d for i, d in enumerate(removed) if not any(d.startswith(p + '/') for p in removed[:i])]
+    inside = tuple(d + '/' for d in top)
+    return top + sorted(path for path in set(dst_files) - set(src_files) if not path.startswith(inside))
+
+
+async def _plan(client, remote_root, local_dir, down, checksum, delete, concurrency, index=None, executor=None):
+    """
+    :return: (plan, remote_files) where plan is a list of SyncAction
+    """
+    loop = asyncio.get_event_loop()
+    local, local_dirs = await loop.run_in_executor(client._io_executor, _scan_local, local_dir)
+    if index is not None:
+        remote_files, remote_dirs = await _scan_remote_indexed(client, remote_root, index, concurrency)
+    else:
+        remote_files, remote_dirs = await _scan_remote(client, remote_root, concurrency)
+    remote = dict((path, (entry.size, entry.modified)) for path, entry in remote_files.items())
+
+    src, src_dirs, dst, dst_dirs = (remote, remote_dirs, local, local_dirs) if down else \
+        (local, local_dirs, remote, remote_dirs)
+    transfer = 'download' if down else 'upload'
+    semaphore = asyncio.Semaphore(concurrency)
+    hashes = {}
+
+    async def md5(path):
+        known = index.local_md5(path, *local[path]) if index is not None else None
+        if known:
+            return known
+        async with semaphore:
+            hashes[path] = await _local_md5(client, os.path.join(local_dir, *path.split('/')), executor)
+        return hashes[path]
+
+    async def compare(path):
+        if path not in dst:
+            return SyncAction(transfer, path, 'missing', src[path][0])
+        reason = _changed(src[path], dst[path])
+        remote_md5 = parse_checksums(remote_files[path].checksum).get('MD5')
+        if checksum and remote_md5 and reason != 'size':
+            # Content decides, timestamps differ after every upload
+            reason = 'checksum' if await md5(path) != remote_md5.lower() else None
+        return SyncAction(transfer, path, reason, src[path][0]) if reason else None
+
+    plan = [SyncAction('mkdir', path, 'missing', 0) for path in sorted(src_dirs - dst_dirs)]
+    plan += [action for action in await asyncio.gather(*[compare(path) for path in sorted(src)]) if action]
+    if delete:
+        plan += [SyncAction('delete', path, 'extraneous', dst[path][0] if path in dst else 0)
+                 for path in _extraneous(dst, dst_dirs, src, src_dirs)]
+    if index is not None:
+        index.local_files = dict((path, (size, mtime, hashes.get(path) or index.local_md5(path, size, mtime)))
+                                 for path, (size, mtime) in local.items())
+    return plan, remote_files
+
+
+async def _execute(client, plan, remote_root, local_dir, down, checksum, concurrency, remote_files, index=None):
+    report = SyncReport(plan)
+    started = time.monotonic()
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def fail(action, ex):
+        report.errors.append((action, str(ex) or type(ex).__name__))
+
+    async def mkdir(action):
+        if down:
+            os.makedirs(os.path.join(local_dir, *action.path.split('/')), exist_ok=True)
+        else:
+            await client.mkdirs(remote_root + action.path)
+
+    async def transfer(action):
+        local_path = os.path.join(local_dir, *action.path.split('/'))
+        remote_path = remote_root + action.path
+        if down:
+            remote_file = remote_files[action.path]
+            if remote_file.size:
+                error = await client.download(remote_file, local_path)
+                if error:
+                    raise WebdavException(error)
+            else:
+                # download reports empty files as an error
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                open(local_path, 'wb').close()
+            # Keep the server's timestamp so the next sync sees the file as unchanged
+            if remote_file.modified is not None:
+                os.utime(local_path, (remote_file.modified, remote_file.modified))
+            if index is not None:
+                # download verified the content against the server's MD5 where one was reported
+                stat = os.stat(local_path)
+                remote_md5 = parse_checksums(remote_file.checksum).get('MD5')
+                index.local_files[action.path] = (stat.st_size, stat.st_mtime, remote_md5 and remote_md5.lower())
+        else:
+            await client.mkdirs(remote_path.rsplit('/', 1)[0] or '/')
+            hexdigests = await client.upload(local_path, remote_path, verify=checksum or None)
+            scanned = index.local_files.get(action.path) if index is not None else None
+            if scanned is not None and 'MD5' in hexdigests:
+                # Hashed while sending, recorded against the stat seen when planning
+                index.local_files[action.path] = scanned[:2] + (hexdigests['MD5'],)
+        report.bytes += action.size
+
+    async def delete(action):
+        local_path = os.path.join(local_dir, *action.path.split('/'))
+        if not down:
+            await client.delete(remote_root + action.path)
+        elif os.path.isdir(local_path):
+            await loop.run_in_executor(client._io_executor, shutil.rmtree, local_path)
+        else:
+            os.remove(local_path)
+
+    async def run(action, operation):
+        async with semaphore:
+            try:
+                await operation(action)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                fail(action, ex)
+            else:
+                report.done.append(action)
+            finally:
+                if index is not None and not down:
+                    index.invalidate_remote(action.path)
+
+    # Collections parents first, then the transfers concurrently, deletions last
+    for action in plan:
+        if action.action == 'mkdir':
+            await run(action, mkdir)
+    await asyncio.gather(*[run(action, transfer) for action in plan if action.action in ('download', 'upload')])
+    await asyncio.gather(*[run(action, delete) for action in plan if action.action == 'delete'])
+    report.elapsed = time.monotonic() - started
+    return report
+
+
+async def sync(client, remote_dir, local_dir, down, concurrency=SYNC_CONCURRENCY, checksum=False, delete=False,
+               dry_run=False, index=None, processes=None):
+    """
+    Mirror a remote collection and a local directory in one direction, see Client.sync_down and Client.sync_up
+    :return: SyncReport
+    """
+    loop = asyncio.get_event_loop()
+    remote_root = client._abspath(remote_dir).rstrip('/') + '/'
+    if index is not None:
+        await loop.run_in_executor(client._io_executor, index.load, remote_root, local_dir)
+    executor = ProcessPoolExecutor(processes) if checksum and processes else None
+    try:
+        plan, remote_files = await _plan(client, remote_root, local_dir, down, checksum, delete, concurrency, index,
+                                         executor)
+        if dry_run:
+            return SyncReport(plan, dry_run=True)
+        return await _execute(client, plan, remote_root, local_dir, down, checksum, concurrency, remote_files, index)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if index is not None:
+            await loop.run_in_executor(client._io_executor, index.save)
@@ -0,0 +1,65 @@
+import time
+import asyncio
+
+
+class TokenBucket(object):
+    """
+    Bandwidth limit shared by every transfer drawing from it. Tokens (bytes) refill at rate per second
+    up to burst. A transfer takes the tokens for each chunk it moves, going into debt for a chunk larger
+    than what is available and waiting until the debt is repaid. Waiters are served first come first
+    served, so concurrent transfers get an even share of the rate chunk by chunk.
+    The rate can be changed at any time, including while transfers are waiting.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        :param (float or None) rate: bytes per second, None or 0 for unlimited
+        :param (float or None) burst: bytes which may be sent at once after idling, defaults to one second's worth
+        """
+        self._rate = rate or None
+        self._burst = burst
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+
+    @property
+    def burst(self):
+        return self._burst or self._rate or 0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        self._refill()
+        self._rate = rate or None
+        if self._rate is None:
+            self._tokens = 0
+        # Wake the waiter so it recalculates its delay at the new rate
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def consume(self, nbytes):
+        """
+        Wait until nbytes may be transferred
+        :param int nbytes: size of the chunk about to be sent or just received
+        """
+        if not self._rate:
+            return
+        async with self._lock:
+            self._refill()
+            self._tokens -= nbytes
+            while self._rate and self._tokens < 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), -self._tokens / self._rate)
+                except asyncio.TimeoutError:
+                    pass
+                self._refill()
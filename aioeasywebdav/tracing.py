@@ -0,0 +1,210 @@
+import time
+
+import aiohttp
+
+# aiohttp signal -> event name passed to Tracer.event
+_SIGNALS = (
+    ('on_dns_resolvehost_start', 'dns_start'),
+    ('on_dns_resolvehost_end', 'dns_end'),
+    ('on_dns_cache_hit', 'dns_cache_hit'),
+    ('on_connection_queued_start', 'connection_queued'),
+    ('on_connection_queued_end', 'connection_dequeued'),
+    ('on_connection_create_start', 'connect_start'),  # includes the TLS handshake
+    ('on_connection_create_end', 'connect_end'),
+    ('on_connection_reuseconn', 'connection_reused'),
+    ('on_request_headers_sent', 'request_headers_sent'),
+    ('on_request_redirect', 'redirect'),
+)
+
+
+class RequestTrace(object):
+    """
+    Timeline of one HTTP request made on behalf of a WebDAV operation
+    """
+    __slots__ = ('method', 'path', 'url', 'started', 'events', 'status', 'error', 'bytes_sent', 'bytes_received',
+                 'ended', 'span')
+
+    def __init__(self, method, path, url):
+        self.method = method  # WebDAV method, eg. PROPFIND
+        self.path = path  # path as given to the client
+        self.url = url
+        self.started = time.perf_counter()
+        self.events = []  # (name, seconds since started)
+        self.status = None
+        self.error = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.ended = None  # seconds since started, once the response is read, released or closed, or the request failed
+        self.span = None  # free for the Tracer, eg. an OpenTelemetry span
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def timings(self):
+        """
+        :return: dict of event name to seconds since the request started, first occurrence of each
+        """
+        timings = {}
+        for name, offset in self.events:
+            timings.setdefault(name, offset)
+        return timings
+
+
+class Tracer(object):
+    """
+    Receives the timeline of every request of a client, override the hooks of interest.
+    Events are dns_start, dns_end, dns_cache_hit, connection_queued, connection_dequeued, connect_start,
+    connect_end, connection_reused, request_headers_sent, request_chunk, redirect, response_headers,
+    response_chunk and response_end.
+    """
+
+    def request_start(self, trace):
+        pass
+
+    def event(self, trace, name, attributes):
+        """
+        :param RequestTrace trace: request the event belongs to, already has the event appended
+        :param str name: event name
+        :param dict attributes: details of the event, eg. bytes of a chunk
+        """
+        pass
+
+    def request_end(self, trace):
+        """
+        Called once, when the response body has been read, released or closed, or when the request failed
+        """
+        pass
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Records each request as a span with its events, using any tracer providing the OpenTelemetry
+    start_span / add_event / set_attribute / record_exception / end interface.
+    """
+
+    def __init__(self, tracer, chunk_events=False):
+        """
+        :param tracer: eg. opentelemetry.trace.get_tracer(__name__)
+        :param bool chunk_events: add an event per body chunk, otherwise only byte counts are recorded
+        """
+        self.tracer = tracer
+        self.chunk_events = chunk_events
+
+    def request_start(self, trace):
+        trace.span = self.tracer.start_span('WebDAV %s' % trace.method, attributes={
+            'http.method': trace.method, 'http.url': trace.url, 'webdav.path': trace.path})
+
+    def event(self, trace, name, attributes):
+        if self.chunk_events or name not in ('request_chunk', 'response_chunk'):
+            trace.span.add_event(name, attributes)
+
+    def request_end(self, trace):
+        if trace.status is not None:
+            trace.span.set_attribute('http.status_code', trace.status)
+        trace.span.set_attribute('http.request_content_length', trace.bytes_sent)
+        trace.span.set_attribute('http.response_content_length', trace.bytes_received)
+        if trace.error is not None:
+            trace.span.record_exception(trace.error)
+        trace.span.end()
+
+
+def _event(tracer, trace, name, **attributes):
+    trace.events.append((name, trace.elapsed()))
+    tracer.event(trace, name, attributes)
+
+
+def end_trace(tracer, trace, error=None):
+    if trace.ended is not None:
+        return
+    trace.ended = trace.elapsed()
+    trace.error = error
+    if error is None:
+        _event(tracer, trace, 'response_end')
+    tracer.request_end(trace)
+
+
+class TracedResponse(aiohttp.ClientResponse):
+    """
+    Response ending its request's trace when released or closed, the end of the body is never
+    reached when a response is released early, eg. a download aborted or a body left unread
+    """
+    trace_end = None  # set by the client once the response is accepted
+
+    def release(self):
+        self._end_trace()
+        return super(TracedResponse, self).release()
+
+    def close(self):
+        self._end_trace()
+        super(TracedResponse, self).close()
+
+    def _end_trace(self):
+        end, self.trace_end = self.trace_end, None
+        if end is not None:
+            end()
+
+
+def trace_chunk(tracer, trace, nbytes):
+    """
+    Record a chunk of response body read by the client
+    """
+    trace.bytes_received += nbytes
+    _event(tracer, trace, 'response_chunk', bytes=nbytes)
+
+
+def trace_config(tracer):
+    """
+    :param Tracer tracer: receiver of the events
+    :return: aiohttp.TraceConfig feeding tracer, requests carry their RequestTrace in trace_request_ctx['trace']
+    """
+    config = aiohttp.TraceConfig()
+
+    def context_trace(context):
+        return context.trace_request_ctx.get('trace') if context.trace_request_ctx else None
+
+    async def on_request_start(session, context, params):
+        request = context.trace_request_ctx
+        if request is None:
+            return
+        trace = RequestTrace(request.get('method', params.method), request.get('path'), str(params.url))
+        request['trace'] = trace
+        tracer.request_start(trace)
+
+    def forward(name):
+        async def handler(session, context, params):
+            trace = context_trace(context)
+            if trace is not None:
+                _event(tracer, trace, name)
+        return handler
+
+    async def on_request_chunk_sent(session, context, params):
+        trace = context_trace(context)
+        if trace is not None:
+            trace.bytes_sent += len(params.chunk)
+            _event(tracer, trace, 'request_chunk', bytes=len(params.chunk))
+
+    async def on_response_chunk_received(session, context, params):
+        # Only sent by aiohttp for bodies read whole, streamed reads are reported by the client
+        trace = context_trace(context)
+        if trace is not None:
+            trace_chunk(tracer, trace, len(params.chunk))
+
+    async def on_request_end(session, context, params):
+        trace = context_trace(context)
+        if trace is not None:
+            trace.status = params.response.status
+            _event(tracer, trace, 'response_headers', status=params.response.status)
+
+    async def on_request_exception(session, context, params):
+        trace = context_trace(context)
+        if trace is not None:
+            end_trace(tracer, trace, params.exception)
+
+    config.on_request_start.append(on_request_start)
+    config.on_request_chunk_sent.append(on_request_chunk_sent)
+    config.on_response_chunk_received.append(on_response_chunk_received)
+    config.on_request_end.append(on_request_end)
+    config.on_request_exception.append(on_request_exception)
+    for signal, name in _SIGNALS:
+        getattr(config, signal).append(forward(name))
+    return config
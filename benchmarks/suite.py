@@ -0,0 +1,295 @@
+"""
+Throughput benchmarks of the client against the in-process stand-in server, reported as JSON so runs
+on different commits can be compared.
+
+    python -m benchmarks.suite [--output results.json] [--latency 0.005] [--bandwidth 50e6] [--error-rate 0.01]
+                               [--cases download_large,upload_small,propfind_large,mkdirs_deep,join_parts]
+
+Client and server share one process and event loop, so absolute numbers include the server's own work;
+compare runs made with the same options on the same machine. Each case runs in a process of its own, so
+its peak_rss_mb isn't masked by the peak of a case run before it.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import subprocess
+import email.utils
+
+import aiohttp
+from aiohttp import web
+
+import aioeasywebdav
+from tests.server import WebdavServer
+
+FILES_PATH = '/remote.php/dav/files/bench'
+MB = 1000 * 1000
+
+
+class ListingServer(WebdavServer):
+    """
+    Answers PROPFIND on /listing/ with a pregenerated multistatus, so the benchmark measures the client's
+    parsing rather than the server stat-ing a hundred thousand files
+    """
+
+    def __init__(self, entries, **kwargs):
+        super(ListingServer, self).__init__(**kwargs)
+        self.listing = multistatus(entries).encode()
+
+    async def _propfind(self, request, path):
+        if request.path.rstrip('/').endswith('/listing'):
+            await request.read()
+            return web.Response(status=207, content_type='application/xml', body=self.listing)
+        return await super(ListingServer, self)._propfind(request, path)
+
+
+def multistatus(entries):
+    modified = email.utils.formatdate(0, usegmt=True)
+    response = ('<d:response><d:href>%s/listing/file%%06d.bin</d:href><d:propstat><d:prop>'
+                '<d:getlastmodified>%s</d:getlastmodified>'
+                '<d:getcontentlength>%%d</d:getcontentlength>'
+                '<d:getcontenttype>application/octet-stream</d:getcontenttype>'
+                '<d:getetag>"%%x"</d:getetag>'
+                '<oc:checksums><oc:checksum>MD5:d41d8cd98f00b204e9800998ecf8427e</oc:checksum></oc:checksums>'
+                '</d:prop><d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>' % (FILES_PATH, modified))
+    return ('<?xml version="1.0"?><d:multistatus xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">%s</d:multistatus>'
+            % ''.join(response % (i, i, i) for i in range(entries)))
+
+
+class LoopLag(object):
+    """
+    Measures how late the event loop wakes a task sleeping for interval, ie. how long callbacks are held up
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _monitor(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def __enter__(self):
+        self.samples = []
+        self._task = asyncio.ensure_future(self._monitor())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+    def result(self):
+        if not self.samples:
+            return dict(loop_lag_max_ms=0.0, loop_lag_mean_ms=0.0)
+        return dict(loop_lag_max_ms=round(max(self.samples) * 1000, 3),
+                    loop_lag_mean_ms=round(sum(self.samples) / len(self.samples) * 1000, 3))
+
+
+def peak_rss_mb():
+    # Peak over the process's lifetime, meaningful per case as each case has a process to itself
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+async def measure(server, function, nbytes=0, **extra):
+    """
+    Run one benchmark case
+    :param function: coroutine function doing the work, may return a dict of extra figures
+    :param int nbytes: payload bytes moved, for the MB/s figure
+    :return: dict of results
+    """
+    requests = len(server.requests)
+    with LoopLag() as lag:
+        started = time.perf_counter()
+        figures = await function() or {}
+        elapsed = time.perf_counter() - started
+    result = dict(seconds=round(elapsed, 4),
+                  requests=len(server.requests) - requests,
+                  requests_per_s=round((len(server.requests) - requests) / elapsed, 1))
+    if nbytes:
+        result['mb_per_s'] = round(nbytes / MB / elapsed, 2)
+    result.update(figures)
+    result.update(extra)
+    result.update(lag.result())
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+async def download_large(server, client, args):
+    size = int(args.download_mb * MB)
+    with open(server.path(FILES_PATH + '/large.bin'), 'wb') as f:
+        f.write(os.urandom(size))
+    local = os.path.join(args.workdir, 'large.bin')
+
+    async def run():
+        error = await client.download('/large.bin', local, streams_per_file=args.streams)
+        if error:
+            raise aioeasywebdav.WebdavException(error)
+    result = await measure(server, run, size, size_mb=args.download_mb, streams=args.streams)
+    os.remove(local)
+    return result
+
+
+async def upload_small(server, client, args):
+    payload = os.urandom(args.small_size)
+    await client.mkdirs('/small')
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def upload(i):
+        async with limit:
+            await client.upload(io.BytesIO(payload), '/small/file%06d' % i)
+
+    async def run():
+        await asyncio.gather(*[upload(i) for i in range(args.small_files)])
+    result = await measure(server, run, args.small_size * args.small_files,
+                           files=args.small_files, file_size=args.small_size, concurrency=args.concurrency)
+    result['files_per_s'] = round(args.small_files / result['seconds'], 1)
+    return result
+
+
+async def propfind_large(server, client, args):
+    async def run():
+        entries = await client.ls('/listing/')
+        assert len(entries) == args.entries
+    result = await measure(server, run, len(server.listing), entries=args.entries)
+    result['entries_per_s'] = round(args.entries / result['seconds'], 1)
+    return result
+
+
+async def mkdirs_deep(server, client, args):
+    async def run():
+        for tree in range(args.trees):
+            client._known_dirs.clear()  # measure creating, not the known-collection shortcut
+            await client.mkdirs('/deep%d/' % tree + '/'.join('level%03d' % i for i in range(args.depth)))
+    return await measure(server, run, depth=args.depth, trees=args.trees)
+
+
+async def join_parts(server, client, args):
+    parts = []
+    part = os.urandom(int(args.part_mb * MB))
+    for i in range(args.parts):
+        path = os.path.join(args.workdir, 'join.%d.part' % i)
+        with open(path, 'wb') as f:
+            f.write(part)
+        parts.append(path)
+    target = os.path.join(args.workdir, 'joined.bin')
+    loop = asyncio.get_event_loop()
+
+    async def run():
+        await loop.run_in_executor(None, aioeasywebdav.Client.join_parts, target, parts)
+    result = await measure(server, run, len(part) * args.parts, parts=args.parts, part_mb=args.part_mb)
+    os.remove(target)
+    return result
+
+
+CASES = dict(download_large=download_large, upload_small=upload_small, propfind_large=propfind_large,
+             mkdirs_deep=mkdirs_deep, join_parts=join_parts)
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    # Only the listing case pays for generating the listing in its process
+    entries = args.entries if 'propfind_large' in args.cases.split(',') else 0
+    server = ListingServer(entries, latency=args.latency, bandwidth=args.bandwidth,
+                           error_rate=args.error_rate, seed=args.seed)
+    url = await server.start()
+    os.makedirs(server.path(FILES_PATH))
+    os.makedirs(server.path(FILES_PATH + '/listing'))
+    args.workdir = os.path.join(server.root, 'local')
+    os.makedirs(args.workdir)
+    client = aioeasywebdav.connect(url=url + FILES_PATH)
+    results = {}
+    try:
+        for name in args.cases.split(','):
+            results[name] = await CASES[name](server, client, args)
+    finally:
+        client.close()
+        await server.stop()
+    return results
+
+
+def run_isolated(args):
+    """
+    Run every case in a fresh interpreter
+    :return: dict of case name to results
+    """
+    options = []
+    for key, value in vars(args).items():
+        if key not in ('output', 'cases', 'in_process') and value is not None:
+            options += ['--%s' % key.replace('_', '-'), str(value)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for name in args.cases.split(','):
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.suite', '--in-process', '--cases', name]
+                                         + options, cwd=root)
+        results[name] = json.loads(output.decode())['results'][name]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', help='write the JSON report here rather than to stdout')
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second per transfer')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with 503')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--download-mb', type=float, default=64)
+    parser.add_argument('--streams', type=int, default=aioeasywebdav.client.DOWNLOAD_STREAMS_PER_FILE)
+    parser.add_argument('--small-files', type=int, default=1000)
+    parser.add_argument('--small-size', type=int, default=4096)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--depth', type=int, default=50)
+    parser.add_argument('--trees', type=int, default=5)
+    parser.add_argument('--parts', type=int, default=16)
+    parser.add_argument('--part-mb', type=float, default=8)
+    parser.add_argument('--in-process', action='store_true',
+                        help='run the cases one after the other in this process, peak_rss_mb is then cumulative')
+    args = parser.parse_args(argv)
+    unknown = set(args.cases.split(',')) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: %s' % ', '.join(sorted(unknown)))
+
+    if args.in_process:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            results = loop.run_until_complete(run(args))
+        finally:
+            loop.close()
+    else:
+        results = run_isolated(args)
+    report = dict(
+        commit=commit(),
+        python=platform.python_version(),
+        aiohttp=aiohttp.__version__,
+        platform=platform.platform(),
+        options=dict((key, value) for key, value in vars(args).items()
+                     if key not in ('output', 'workdir', 'in_process')),
+        results=results,
+    )
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
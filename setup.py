@@ -32,7 +32,13 @@ setup(
     classifiers = [
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
-        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         ],
     description="A straight-forward WebDAV client, ported from easywebdav to use aiohttp.",
     long_description=DOC,
@@ -42,6 +48,7 @@ setup(
     url="http://github.com/andrewleech/aioeasywebdav",
     version=__version__,  # noqa
     packages=find_packages(exclude=["tests"]),
+    python_requires=">=3.7",
     data_files = [],
     install_requires=[
         "aiohttp", "six"
@@ -130,6 +130,9 @@ class TestCase(unittest.TestCase):
                 continue
             os.remove(path)
 
+    def _loop_run(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
     def _path(self, path):
         return os.path.join(_server_path, path)
 
@@ -0,0 +1,269 @@
+"""
+Minimal in-process WebDAV server used as a stand-in for tests needing features
+the davserver binary lacks, eg. Nextcloud style chunked uploads.
+"""
+import os
+import random
+import shutil
+import hashlib
+import asyncio
+import tempfile
+import email.utils
+from urllib.parse import quote, unquote, urlparse
+
+from aiohttp import web
+
+
+class WebdavServer(object):
+    """
+    Serves a temporary directory over WebDAV on localhost.
+    Supports GET (with Range), HEAD, PUT, DELETE, MKCOL, PROPFIND (Depth 0, 1 and infinity),
+    COPY and MOVE, including assembly of Nextcloud chunking v2 uploads on MOVE of ``<upload>/.file``.
+    """
+
+    def __init__(self, root=None, allow_infinity=True, latency=0, bandwidth=None, error_rate=0, seed=None):
+        """
+        :param float latency: seconds added before every response
+        :param (int or None) bandwidth: bytes per second of each GET body and PUT upload
+        :param float error_rate: fraction of requests answered with 503 Service Unavailable
+        :param seed: seed of the injected errors, for repeatable runs
+        """
+        self.root = root or tempfile.mkdtemp()
+        self.allow_infinity = allow_infinity  # Nextcloud style servers refuse Depth: infinity
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = []  # (method, path) of every request served
+        self.headers = {}  # (method, path) -> headers of the latest such request
+        self.ranges = True  # honour Range headers, otherwise send whole bodies like some servers do
+        self.faults = []  # (method, status, headers) injected into the next matching request, status 'truncate'
+                          # sends half of a GET body then drops the connection, 'corrupt' flips its first byte
+        self.chunked = False  # send GET bodies without a Content-Length
+        self._runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_route('*', '/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, 'localhost', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = 'http://localhost:%d' % port
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, url_path):
+        return os.path.join(self.root, unquote(url_path).strip('/'))
+
+    def _href(self, local_path):
+        href = '/' + os.path.relpath(local_path, self.root).replace(os.sep, '/')
+        href = '/' if href == '/.' else href
+        if os.path.isdir(local_path) and not href.endswith('/'):
+            href += '/'
+        return quote(href)
+
+    @staticmethod
+    def _etag(local_path):
+        stat = os.stat(local_path)
+        if os.path.isdir(local_path):
+            # Like ownCloud/Nextcloud, a collection's ETag changes with anything below it
+            stats = [stat] + [os.stat(os.path.join(dirpath, name)) for dirpath, dirnames, filenames in os.walk(local_path)
+                              for name in dirnames + filenames]
+            return '"%x-%x"' % (max(s.st_mtime_ns for s in stats), sum(s.st_size for s in stats))
+        return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+    def _propxml(self, local_path):
+        stat = os.stat(local_path)
+        props = ['<D:getlastmodified>%s</D:getlastmodified>' % email.utils.formatdate(stat.st_mtime, usegmt=True),
+                 '<D:getetag>%s</D:getetag>' % self._etag(local_path)]
+        if os.path.isdir(local_path):
+            props.append('<D:resourcetype><D:collection/></D:resourcetype>')
+        else:
+            with open(local_path, 'rb') as f:
+                md5 = hashlib.md5(f.read()).hexdigest()
+            props += ['<D:resourcetype/>',
+                      '<D:getcontentlength>%d</D:getcontentlength>' % stat.st_size,
+                      '<D:getcontenttype>application/octet-stream</D:getcontenttype>',
+                      '<oc:checksums><oc:checksum>MD5:%s</oc:checksum></oc:checksums>' % md5]
+        return ('<D:response><D:href>%s</D:href><D:propstat><D:prop>%s</D:prop>'
+                '<D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response>' % (self._href(local_path), ''.join(props)))
+
+    async def _handle(self, request):
+        self.requests.append((request.method, request.path))
+        self.headers[(request.method, request.path)] = request.headers
+        handler = getattr(self, '_' + request.method.lower(), None)
+        if handler is None:
+            return web.Response(status=405)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            await request.read()
+            return web.Response(status=503)
+        for fault in self.faults:
+            if fault[0] == request.method:
+                self.faults.remove(fault)
+                if fault[1] == 'truncate':
+                    return await self._truncate(request, await handler(request, self.path(request.path)))
+                if fault[1] == 'corrupt':
+                    response = await handler(request, self.path(request.path))
+                    response.body = bytes([response.body[0] ^ 0xff]) + response.body[1:]
+                    return response
+                await request.read()
+                return web.Response(status=fault[1], headers=fault[2])
+        response = await handler(request, self.path(request.path))
+        if self.bandwidth and request.method == 'GET' and response.body:
+            return await self._paced(request, response)
+        if self.chunked and request.method == 'GET' and response.body:
+            return await self._chunked(request, response)
+        return response
+
+    @staticmethod
+    async def _chunked(request, response):
+        stream = web.StreamResponse(status=response.status, headers=response.headers)
+        stream.enable_chunked_encoding()
+        await stream.prepare(request)
+        await stream.write(response.body)
+        await stream.write_eof()
+        return stream
+
+    async def _paced(self, request, response, block=64 * 1024):
+        stream = web.StreamResponse(status=response.status, headers=response.headers)
+        stream.content_length = len(response.body)
+        await stream.prepare(request)
+        for offset in range(0, len(response.body), block):
+            await stream.write(response.body[offset:offset + block])
+            await asyncio.sleep(min(block, len(response.body) - offset) / self.bandwidth)
+        await stream.write_eof()
+        return stream
+
+    @staticmethod
+    async def _truncate(request, response):
+        stream = web.StreamResponse(status=response.status, headers=response.headers)
+        stream.content_length = len(response.body)
+        await stream.prepare(request)
+        await stream.write(response.body[:len(response.body) // 2])
+        request.transport.close()
+        return stream
+
+    async def _head(self, request, path):
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        etag = self._etag(path)
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304)
+        size = 0 if os.path.isdir(path) else os.path.getsize(path)
+        return web.Response(status=200, headers={'Content-Length': str(size), 'ETag': etag})
+
+    async def _get(self, request, path):
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        if os.path.isdir(path):
+            return web.Response(status=200)
+        size = os.path.getsize(path)
+        start, end, status = 0, size - 1, 200
+        if 'Range' in request.headers and self.ranges:
+            first, last = request.headers['Range'].split('=', 1)[1].split('-')
+            start, end, status = int(first), min(int(last), size - 1) if last else size - 1, 206
+            if start >= size:
+                return web.Response(status=416)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        headers = {'Content-Range': 'bytes %d-%d/%d' % (start, end, size)} if status == 206 else \
+            {'OC-Checksum': 'MD5:%s' % hashlib.md5(body).hexdigest()}
+        return web.Response(status=status, body=body, headers=headers)
+
+    async def _put(self, request, path):
+        if not os.path.isdir(os.path.dirname(path)):
+            return web.Response(status=409)
+        existed = os.path.exists(path)
+        with open(path, 'wb') as f:
+            async for chunk in request.content.iter_any():
+                f.write(chunk)
+                if self.bandwidth:
+                    await asyncio.sleep(len(chunk) / self.bandwidth)
+        return web.Response(status=204 if existed else 201)
+
+    async def _delete(self, request, path):
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return web.Response(status=204)
+
+    async def _mkcol(self, request, path):
+        if os.path.exists(path):
+            return web.Response(status=405)
+        if not os.path.isdir(os.path.dirname(path)):
+            return web.Response(status=409)
+        os.mkdir(path)
+        return web.Response(status=201)
+
+    async def _propfind(self, request, path):
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        await request.read()
+        depth = request.headers.get('Depth', 'infinity')
+        if depth == 'infinity' and not self.allow_infinity:
+            return web.Response(status=403)
+        if request.headers.get('If-None-Match') == self._etag(path):
+            return web.Response(status=412)
+        paths = [path]
+        if os.path.isdir(path) and depth == '1':
+            paths += [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        elif os.path.isdir(path) and depth == 'infinity':
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                paths += [os.path.join(dirpath, name) for name in sorted(dirnames + filenames)]
+        body = ''.join(self._propxml(p) for p in paths)
+        return web.Response(status=207, content_type='application/xml',
+                            text='<?xml version="1.0"?><D:multistatus xmlns:D="DAV:" '
+                                 'xmlns:oc="http://owncloud.org/ns">%s</D:multistatus>' % body)
+
+    def _destination(self, request):
+        return self.path(urlparse(request.headers['Destination']).path)
+
+    async def _copy(self, request, path, move=False):
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        destination = self._destination(request)
+        if not os.path.isdir(os.path.dirname(destination.rstrip('/'))):
+            return web.Response(status=409)
+        existed = os.path.exists(destination)
+        if existed:
+            if request.headers.get('Overwrite', 'T') == 'F':
+                return web.Response(status=412)
+            if os.path.isdir(destination):
+                shutil.rmtree(destination)
+            else:
+                os.remove(destination)
+        if move:
+            shutil.move(path, destination)
+        elif os.path.isdir(path):
+            shutil.copytree(path, destination)
+        else:
+            shutil.copyfile(path, destination)
+        return web.Response(status=204 if existed else 201)
+
+    async def _move(self, request, path):
+        if os.path.basename(path) != '.file':
+            return await self._copy(request, path, move=True)
+        # Chunked upload: concatenate the numbered chunks into the destination
+        upload_dir = os.path.dirname(path)
+        destination = self._destination(request)
+        existed = os.path.exists(destination)
+        with open(destination, 'wb') as target:
+            for name in sorted(os.listdir(upload_dir)):
+                with open(os.path.join(upload_dir, name), 'rb') as chunk:
+                    shutil.copyfileobj(chunk, target)
+        shutil.rmtree(upload_dir)
+        return web.Response(status=204 if existed else 201)
@@ -0,0 +1,1096 @@
+import os
+import json
+import pickle
+import time
+import hashlib
+import shutil
+import asyncio
+import unittest
+from io import BytesIO
+
+import aioeasywebdav
+from .server import WebdavServer
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Tests run against the in-process stand-in server, for features davserver doesn't provide.
+    """
+    files_path = '/remote.php/dav/files/test'
+    uploads_path = '/remote.php/dav/uploads/test'
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = WebdavServer()
+        url = self._run(self.server.start())
+        os.makedirs(self.server.path(self.files_path))
+        os.makedirs(self.server.path(self.uploads_path))
+        self.client = self._run(self._connect(url + self.files_path))
+
+    def tearDown(self):
+        self.client.close()
+        self._run(self.server.stop())
+        self.loop.close()
+
+    async def _connect(self, url):
+        return aioeasywebdav.connect(url=url)
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def _path(self, path):
+        return self.server.path(self.files_path + '/' + path)
+
+    def _create_file(self, path, contents):
+        with open(self._path(path), 'wb') as f:
+            f.write(contents)
+
+    def _read_file(self, path):
+        with open(self._path(path), 'rb') as f:
+            return f.read()
+
+
+class ChunkedUploadTests(ServerTestCase):
+    content = os.urandom(250 * 1024)
+
+    def _local_file(self):
+        path = os.path.join(self.server.root, 'local')
+        with open(path, 'wb') as f:
+            f.write(self.content)
+        return path
+
+    def test__upload_chunked(self):
+        self._run(self.client.upload_chunked(self._local_file(), 'file', chunk_size=64 * 1024, parallel=3))
+        self.assertEqual(self.content, self._read_file('file'))
+        self.assertEqual([], os.listdir(self.server.path(self.uploads_path)))
+        puts = [path for method, path in self.server.requests if method == 'PUT']
+        self.assertEqual(4, len(puts))
+
+    def test__upload_chunked_resume(self):
+        upload_dir = self.server.path(self.uploads_path + '/transfer')
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, '00001'), 'wb') as f:
+            f.write(self.content[:64 * 1024])
+        self._run(self.client.upload_chunked(self._local_file(), 'file', chunk_size=64 * 1024, transfer_id='transfer'))
+        self.assertEqual(self.content, self._read_file('file'))
+        puts = [path for method, path in self.server.requests if method == 'PUT']
+        self.assertNotIn(self.uploads_path + '/transfer/00001', puts)
+        self.assertEqual(3, len(puts))
+
+
+class ListingTests(ServerTestCase):
+
+    def test__ils(self):
+        for i in range(50):
+            self._create_file('file%02d' % i, b'x' * i)
+
+        async def collect():
+            return [entry async for entry in self.client.ils('/')]
+        entries = self._run(collect())
+        self.assertEqual(['/'] + ['/file%02d' % i for i in range(50)], [entry.name for entry in entries])
+        self.assertEqual(list(range(50)), [entry.size for entry in entries[1:]])
+        self.assertEqual(entries, self._run(self.client.ls('/')))
+
+    def test__file_timestamps(self):
+        self._create_file('a', b'data')
+        os.utime(self._path('a'), (784111777, 784111777))
+        entry = self._run(self.client.ls('/a'))[0]
+        self.assertEqual(784111777, entry.modified)
+        self.assertEqual('Sun, 06 Nov 1994 08:49:37 GMT', entry.mtime)
+        name, size, mtime, ctime, contenttype, checksum = entry
+        self.assertEqual(('/a', 4, entry.mtime), (name, size, mtime))
+        self.assertIsNotNone(entry.etag)
+        self.assertEqual(entry, entry._replace(checksum=None)._replace(checksum=checksum))
+        self.assertEqual(1000, entry._replace(mtime=1000).modified)
+
+        self.assertEqual('Thu, 01 Jan 1970 00:16:40 GMT', entry._replace(mtime=1000).mtime)
+
+        # Dates are kept as the server sent them, even when they can't be parsed
+        created = aioeasywebdav.File('/b', 1, '2020-01-01T00:00:00Z', '1994-11-06T09:49:37+01:00', '', None)
+        self.assertEqual((None, 784111777), (created.modified, created.created))
+        self.assertEqual(('/b', 1, '2020-01-01T00:00:00Z', '1994-11-06T09:49:37+01:00', '', None), created)
+        self.assertEqual(list(created), list(aioeasywebdav.Listing([created])[0]))
+
+    def test__file_is_a_namedtuple(self):
+        entry = aioeasywebdav.File('/a', 4, 'Sun, 06 Nov 1994 08:49:37 GMT', '', 'text/plain', 'MD5:abc', '"e"')
+        self.assertIsInstance(entry, tuple)
+        self.assertEqual(entry, aioeasywebdav.File._make(list(entry)))
+        self.assertEqual(json.dumps(list(entry)), json.dumps(entry))
+        self.assertEqual('text/plain', entry._asdict()['contenttype'])
+        self.assertEqual(entry, pickle.loads(pickle.dumps(entry)))
+        # The ETag isn't one of the tuple's fields, existing code unpacking six values keeps working
+        self.assertEqual(6, len(entry))
+        self.assertEqual('"e"', pickle.loads(pickle.dumps(entry)).etag)
+        self.assertEqual(('"e"', 5), (entry._replace(size=5).etag, entry._replace(size=5).size))
+        self.assertEqual('"e"', aioeasywebdav.Listing([entry])[0].etag)
+        self.assertIsNone(aioeasywebdav.File('/a', 4).etag)
+        with self.assertRaises(AttributeError):
+            entry.etag = None
+
+    def test__ls_columnar(self):
+        for i, size in enumerate((30, 10, 20)):
+            self._create_file('file%d' % i, b'x' * size)
+            os.utime(self._path('file%d' % i), (1000 - i, 1000 - i))
+        listing = self._run(self.client.ls('/', columnar=True))
+        self.assertIsInstance(listing, aioeasywebdav.Listing)
+        self.assertEqual(self._run(self.client.ls('/')), list(listing))
+        self.assertEqual(60, listing.total_size())
+
+        files = listing.filter(dirs=False)
+        self.assertEqual(['/file0', '/file1', '/file2'], files.names)
+        files.sort('size')
+        self.assertEqual([10, 20, 30], list(files.sizes))
+        files.sort('mtime', reverse=True)
+        self.assertEqual(['/file0', '/file1', '/file2'], [entry.name for entry in files])
+        self.assertEqual(['/file0', '/file1'], files.filter(since=999).names)
+        self.assertEqual(['/file2'], files.filter(predicate=lambda entry: entry.size == 20).names)
+        self.assertEqual('/file2', files[-1].name)
+        self.assertEqual(['/file1'], files[1:2].names)
+
+    def _create_tree(self):
+        for path in ('one/two/three', 'one/four', 'five'):
+            os.makedirs(self._path(path))
+        for path in ('a', 'one/b', 'one/two/c', 'one/two/three/d', 'five/e'):
+            self._create_file(path, b'data')
+
+    def _walk(self, **kwargs):
+        async def collect():
+            return [(dirpath, sorted(d.name for d in dirs), sorted(f.name for f in files))
+                    async for dirpath, dirs, files in self.client.walk('/', **kwargs)]
+        return sorted(self._run(collect()))
+
+    def test__walk(self):
+        self._create_tree()
+        expected = [
+            ('/', ['/five/', '/one/'], ['/a']),
+            ('/five/', [], ['/five/e']),
+            ('/one/', ['/one/four/', '/one/two/'], ['/one/b']),
+            ('/one/four/', [], []),
+            ('/one/two/', ['/one/two/three/'], ['/one/two/c']),
+            ('/one/two/three/', [], ['/one/two/three/d']),
+        ]
+        self.assertEqual(expected, self._walk())
+        self.assertEqual(expected, self._walk(infinity=False, max_concurrency=2))
+        self.assertEqual(1, len([m for m, p in self.server.requests if m == 'PROPFIND']) - len(expected))
+
+    def test__walk_finite_depth_server(self):
+        self._create_tree()
+        self.server.allow_infinity = False
+        walked = self._walk()
+        self.assertEqual(['/', '/five/', '/one/', '/one/four/', '/one/two/', '/one/two/three/'], [w[0] for w in walked])
+        self.assertEqual(['/one/two/three/d'], walked[-1][2])
+
+    def test__walk_prune(self):
+        self._create_tree()
+
+        async def collect():
+            seen = []
+            async for dirpath, dirs, files in self.client.walk('/', infinity=False):
+                seen.append(dirpath)
+                dirs[:] = [d for d in dirs if d.name != '/one/']
+            return seen
+        self.assertEqual(['/', '/five/'], self._run(collect()))
+
+
+class MetadataCacheTests(ServerTestCase):
+
+    async def _connect(self, url):
+        return aioeasywebdav.connect(url=url, metadata_cache=aioeasywebdav.MetadataCache())
+
+    def _propfinds(self):
+        return len([method for method, path in self.server.requests if method == 'PROPFIND'])
+
+    def test__ls_cached(self):
+        self._create_file('file', b'data')
+        first = self._run(self.client.ls('/'))
+        self.assertEqual(first, self._run(self.client.ls('/')))
+        self.assertEqual(1, self._propfinds())
+        self.assertEqual(1, self.client.metadata_cache.hits)
+        self.assertEqual(1, self.client.metadata_cache.misses)
+
+    def test__ls_cached_entries_unshared(self):
+        self._create_file('file', b'data')
+        first = self._run(self.client.ls('/'))
+        with self.assertRaises(AttributeError):
+            first[1].size = 0
+        first[1] = first[1]._replace(size=0)
+        first.append(first[0])
+        self.assertEqual([0, 4], [entry.size for entry in self._run(self.client.ls('/'))])
+        self.assertEqual(4, self._run(self.client.ls('/', columnar=True))[1].size)
+
+    def test__ls_revalidated(self):
+        self._create_file('file', b'data')
+        self.client.metadata_cache.ttl = 0
+        first = self._run(self.client.ls('/'))
+        self.assertEqual(first, self._run(self.client.ls('/')))
+        self.assertEqual(2, self._propfinds())
+        self.assertEqual(1, self.client.metadata_cache.revalidations)
+
+    def test__exists_cached(self):
+        self.assertFalse(self._run(self.client.exists('file')))
+        self.assertFalse(self._run(self.client.exists('file')))
+        self.assertEqual(1, len([method for method, path in self.server.requests if method == 'HEAD']))
+
+    def test__invalidated_below_collection(self):
+        self._run(self.client.mkdir('/d'))
+        self._run(self.client.mkdir('/e'))
+        self._run(self.client.upload(BytesIO(b'data'), '/d/f'))
+        self._run(self.client.upload(BytesIO(b'data'), '/e/f'))
+        for path in ('/d/f', '/e/f'):
+            self.assertTrue(self._run(self.client.exists(path)))
+        self.assertEqual(['/d/', '/d/f'], [entry.name for entry in self._run(self.client.ls('/d/'))])
+        self._run(self.client.rmdir('/d'))
+        self.assertFalse(self._run(self.client.exists('/d/f')))
+        self._run(self.client.move('/e', '/d'))
+        self.assertFalse(self._run(self.client.exists('/e/f')))
+        self.assertTrue(self._run(self.client.exists('/d/f')))
+
+    def test__invalidated_by_upload(self):
+        self.assertEqual(['/'], [entry.name for entry in self._run(self.client.ls('/'))])
+        self.assertFalse(self._run(self.client.exists('/file')))
+        self._run(self.client.upload(BytesIO(b'data'), '/file'))
+        self.assertEqual(['/', '/file'], [entry.name for entry in self._run(self.client.ls('/'))])
+        self.assertTrue(self._run(self.client.exists('/file')))
+
+
+class MkdirsTests(ServerTestCase):
+
+    def _mkcols(self):
+        return [path for method, path in self.server.requests if method == 'MKCOL']
+
+    def test__mkdirs_skips_known(self):
+        self._run(self.client.mkdirs('one/two/three'))
+        self.assertTrue(os.path.isdir(self._path('one/two/three')))
+        self.assertEqual(3, len(self._mkcols()))
+        self._run(self.client.mkdirs('/one/two/three/four'))
+        self.assertEqual(4, len(self._mkcols()))
+        self.assertEqual('/', self.client.cwd)
+
+    def test__mkdirs_known_from_listing(self):
+        os.makedirs(self._path('one/two'))
+        self._run(self.client.ls('/one/'))
+        self._run(self.client.mkdirs('/one/two/three'))
+        self.assertEqual([self.files_path + '/one/two/three'], self._mkcols())
+
+    def test__mkdirs_concurrent(self):
+        async def create():
+            await asyncio.gather(*[self.client.mkdirs('/one/two/%d' % i) for i in range(5)])
+        self._run(create())
+        self.assertEqual(7, len(self._mkcols()))
+        self.assertEqual(5, len(os.listdir(self._path('one/two'))))
+
+    def test__rmdir_forgets_known(self):
+        self._run(self.client.mkdirs('/one/two'))
+        self._run(self.client.rmdir('/one'))
+        self._run(self.client.mkdirs('/one/two'))
+        self.assertTrue(os.path.isdir(self._path('one/two')))
+
+
+class SyncTests(ServerTestCase):
+
+    def setUp(self):
+        super(SyncTests, self).setUp()
+        self.local = os.path.join(self.server.root, 'local')
+        os.makedirs(os.path.join(self.local, 'one', 'two'))
+        os.makedirs(os.path.join(self.local, 'empty'))
+        for path, contents in (('a', b'a' * 100), ('one/b', b'b' * 1000), ('one/two/c', b''), ('one/two/d', b'd' * 10)):
+            with open(os.path.join(self.local, *path.split('/')), 'wb') as f:
+                f.write(contents)
+
+    def _transfers(self, report):
+        return sorted((action.action, action.path, action.reason) for action in report.plan if action.action != 'mkdir')
+
+    def test__sync_up_and_down(self):
+        report = self._run(self.client.sync_up(self.local, '/backup'))
+        self.assertEqual([], report.errors)
+        self.assertEqual(1110, report.bytes)
+        self.assertEqual(b'b' * 1000, self._read_file('backup/one/b'))
+        self.assertTrue(os.path.isdir(self._path('backup/empty')))
+        self.assertEqual([], self._run(self.client.sync_up(self.local, '/backup')).plan)
+
+        restored = os.path.join(self.server.root, 'restored')
+        report = self._run(self.client.sync_down('/backup', restored))
+        self.assertEqual([], report.errors)
+        self.assertEqual(['a', 'one/b', 'one/two/c', 'one/two/d'], sorted(a.path for a in report.done if a.action == 'download'))
+        with open(os.path.join(restored, 'one', 'two', 'd'), 'rb') as f:
+            self.assertEqual(b'd' * 10, f.read())
+        self.assertTrue(os.path.isdir(os.path.join(restored, 'empty')))
+        self.assertEqual([], self._run(self.client.sync_down('/backup', restored)).plan)
+
+    def test__sync_up_changed_only(self):
+        self._run(self.client.sync_up(self.local, '/'))
+        with open(os.path.join(self.local, 'one', 'b'), 'wb') as f:
+            f.write(b'changed')
+        future = time.time() + 60
+        os.utime(os.path.join(self.local, 'a'), (future, future))
+        self.server.requests = []
+        report = self._run(self.client.sync_up(self.local, '/', dry_run=True))
+        self.assertEqual([('upload', 'a', 'mtime'), ('upload', 'one/b', 'size')], self._transfers(report))
+        self.assertEqual([], report.done)
+        self.assertEqual([], [path for method, path in self.server.requests if method == 'PUT'])
+        report = self._run(self.client.sync_up(self.local, '/'))
+        self.assertEqual(2, len(report.done))
+        self.assertEqual(b'changed', self._read_file('one/b'))
+
+    def test__sync_checksum(self):
+        self._run(self.client.sync_up(self.local, '/'))
+        self._create_file('a', b'x' * 100)
+        past = time.time() - 3600
+        os.utime(self._path('a'), (past, past))
+        self.assertEqual([], self._run(self.client.sync_down('/', self.local, dry_run=True)).plan)
+        report = self._run(self.client.sync_down('/', self.local, checksum=True))
+        self.assertEqual([('download', 'a', 'checksum')], self._transfers(report))
+        with open(os.path.join(self.local, 'a'), 'rb') as f:
+            self.assertEqual(b'x' * 100, f.read())
+
+    def test__sync_delete(self):
+        self._run(self.client.sync_up(self.local, '/'))
+        shutil.rmtree(os.path.join(self.local, 'one'))
+        os.remove(os.path.join(self.local, 'a'))
+        report = self._run(self.client.sync_up(self.local, '/', delete=True))
+        self.assertEqual([('delete', 'a', 'extraneous'), ('delete', 'one', 'extraneous')], self._transfers(report))
+        self.assertEqual(['empty'], os.listdir(self.server.path(self.files_path)))
+
+    def _propfinds(self):
+        return [path for method, path in self.server.requests if method == 'PROPFIND']
+
+    def test__sync_index(self):
+        index = aioeasywebdav.SyncIndex(os.path.join(self.server.root, 'index.db'))
+        self._run(self.client.sync_up(self.local, '/', index=index))
+        restored = os.path.join(self.server.root, 'restored')
+        self._run(self.client.sync_down('/', restored, index=index, checksum=True))
+
+        self.server.requests = []
+        report = self._run(self.client.sync_down('/', restored, index=aioeasywebdav.SyncIndex(index.path), checksum=True))
+        self.assertEqual([], report.plan)
+        self.assertEqual([self.files_path + '/'], self._propfinds())
+
+        self._create_file('one/two/e', b'new')
+        self.server.requests = []
+        report = self._run(self.client.sync_down('/', restored, index=index, checksum=True))
+        self.assertEqual([('download', 'one/two/e', 'missing')], self._transfers(report))
+        # The root is listed, then only the collections on the way to the change
+        self.assertEqual(['/', '/', '/one/', '/one/two/'], [p[len(self.files_path):] for p in self._propfinds()])
+
+    def test__sync_index_skips_hashing(self):
+        index = aioeasywebdav.SyncIndex(os.path.join(self.server.root, 'index.db'))
+        self._run(self.client.sync_up(self.local, '/', index=index, checksum=True))
+        hashed = []
+        md5 = aioeasywebdav.Client.md5
+        aioeasywebdav.Client.md5 = staticmethod(lambda path: hashed.append(path) or md5(path))
+        try:
+            self._run(self.client.sync_up(self.local, '/', index=index, checksum=True))
+            self.assertEqual([], hashed)
+            with open(os.path.join(self.local, 'a'), 'wb') as f:
+                f.write(b'A' * 100)
+            report = self._run(self.client.sync_up(self.local, '/', index=index, checksum=True))
+            self.assertEqual([os.path.join(self.local, 'a')], hashed)
+            self.assertEqual([('upload', 'a', 'checksum')], self._transfers(report))
+        finally:
+            aioeasywebdav.Client.md5 = staticmethod(md5)
+
+
+class CopyMoveTests(ServerTestCase):
+
+    def test__copy(self):
+        os.makedirs(self._path('dir'))
+        self._create_file('dir/a', b'data')
+        self._run(self.client.copy('/dir', '/copy'))
+        self.assertEqual(b'data', self._read_file('copy/a'))
+        self.assertEqual(b'data', self._read_file('dir/a'))
+        with self.assertRaises(aioeasywebdav.OperationFailed) as cm:
+            self._run(self.client.copy('/dir/a', '/copy/a'))
+        self.assertEqual(412, cm.exception.actual_code)
+        self._create_file('b', b'other')
+        self._run(self.client.copy('/b', '/copy/a', overwrite=True))
+        self.assertEqual(b'other', self._read_file('copy/a'))
+
+    def test__move(self):
+        self._create_file('a', b'data')
+        self.assertTrue(self._run(self.client.exists('/a')))
+        self._run(self.client.move('/a', '/b'))
+        self.assertEqual(b'data', self._read_file('b'))
+        self.assertFalse(os.path.exists(self._path('a')))
+        self.assertEqual(['/', '/b'], [entry.name for entry in self._run(self.client.ls('/'))])
+
+    def test__batch(self):
+        for i in range(20):
+            self._create_file('file%d' % i, b'%d' % i)
+        self._create_file('keep', b'keep')
+        operations = [('move', '/file%d' % i, '/moved%d' % i) for i in range(20)]
+        operations += [('delete', '/missing'), ('mkdirs', '/one/two'), ('copy', '/keep', '/copy', {'overwrite': True}),
+                       ('upload', 'local', '/x')]
+        results = self._run(self.client.batch(operations, concurrency=4))
+        self.assertEqual(operations, [result.operation for result in results])
+        self.assertEqual([None] * 20, [result.error for result in results[:20]])
+        self.assertEqual(b'19', self._read_file('moved19'))
+        self.assertEqual(404, results[20].error.actual_code)
+        self.assertIsNone(results[21].error)
+        self.assertTrue(os.path.isdir(self._path('one/two')))
+        self.assertEqual(b'keep', self._read_file('copy'))
+        self.assertIsInstance(results[23].error, ValueError)
+
+
+class BulkTests(ServerTestCase):
+
+    def setUp(self):
+        super(BulkTests, self).setUp()
+        self.local = os.path.join(self.server.root, 'local')
+        os.makedirs(self.local)
+
+    def _collect(self, results):
+        async def collect():
+            return sorted([result async for result in results], key=lambda result: result.dst)
+        return self._run(collect())
+
+    def test__upload_many(self):
+        pairs = []
+        for i in range(30):
+            local = os.path.join(self.local, 'file%02d' % i)
+            with open(local, 'wb') as f:
+                f.write(b'x' * i)
+            pairs.append((local, '/dir%d/sub/file%02d' % (i % 3, i)))
+        large = os.path.join(self.local, 'large')
+        with open(large, 'wb') as f:
+            f.write(b'y' * 5000)
+        pairs += [(large, '/dir0/large'), (os.path.join(self.local, 'missing'), '/missing')]
+
+        stats = aioeasywebdav.BulkStats()
+        results = self._collect(self.client.upload_many(iter(pairs), concurrency=4, stats=stats, small_file_bytes=1000))
+        self.assertEqual((31, 1, 5000 + sum(range(30))), (stats.done, stats.failed, stats.bytes))
+        self.assertIsInstance(results[-1].error, FileNotFoundError)
+        self.assertEqual(b'x' * 29, self._read_file('dir2/sub/file29'))
+        self.assertEqual(b'y' * 5000, self._read_file('dir0/large'))
+        self.assertEqual(6, len([path for method, path in self.server.requests if method == 'MKCOL']))
+
+    def test__upload_many_failures(self):
+        pairs = []
+        for name in ('a', 'b'):
+            local = os.path.join(self.local, name)
+            with open(local, 'wb') as f:
+                f.write(name.encode() * 100)
+            pairs.append((local, '/dir/' + name))
+        # The first MKCOL fails and takes its file with it, the next file creates the collection again
+        self.server.faults = [('MKCOL', 403, {}), ('PUT', 503, {'Retry-After': '0'})]
+        results = self._collect(self.client.upload_many(pairs, concurrency=1))
+        self.assertEqual(409, results[0].error.actual_code)
+        self.assertIsNone(results[1].error)
+        self.assertEqual(b'b' * 100, self._read_file('dir/b'))
+        # Bytes count once a PUT succeeds, not for every attempt
+        self.assertEqual(100, self.client.metrics.bytes_out)
+
+    def test__download_many(self):
+        os.makedirs(self._path('dir'))
+        for i in range(20):
+            self._create_file('dir/file%02d' % i, os.urandom(100 + i))
+        self._create_file('dir/large', os.urandom(5000))
+        entries = [entry for entry in self._run(self.client.ls('/dir')) if not aioeasywebdav.isdir(entry)]
+        pairs = [(entry, os.path.join(self.local, 'one', entry.name.rsplit('/', 1)[1])) for entry in entries]
+        pairs += [('/dir/file00', os.path.join(self.local, 'two', 'file00')), ('/missing', os.path.join(self.local, 'x'))]
+
+        stats = aioeasywebdav.BulkStats()
+        results = self._collect(self.client.download_many(pairs, concurrency=4, stats=stats, small_file_bytes=1000))
+        self.assertEqual((22, 1), (stats.done, stats.failed))
+        self.assertEqual(404, results[-1].error.actual_code)
+        for name in ['large'] + ['file%02d' % i for i in range(20)]:
+            with open(os.path.join(self.local, 'one', name), 'rb') as f:
+                self.assertEqual(self._read_file('dir/' + name), f.read())
+        self.assertEqual(sorted(['large'] + ['file%02d' % i for i in range(20)]),
+                         sorted(os.listdir(os.path.join(self.local, 'one'))))
+        self.assertEqual(100 + sum(range(100, 120)) + 5000, stats.bytes)
+
+    def test__download_many_by_path(self):
+        small, large = os.urandom(500), os.urandom(5000)
+        self._create_file('small', small)
+        self._create_file('large', large)
+        self._create_file('damaged', small)
+        self.server.chunked = True  # no Content-Length, the size isn't known until the body is read
+        self.server.faults = [('GET', 'corrupt', {})]
+        pairs = [('/damaged', os.path.join(self.local, 'damaged')), ('/small', os.path.join(self.local, 'small')),
+                 ('/large', os.path.join(self.local, 'large'))]
+        results = self._collect(self.client.download_many(pairs, concurrency=1, small_file_bytes=1000))
+        # Checked against the response's OC-Checksum header, without a listing
+        self.assertIn('Invalid Checksum', str(results[0].error))
+        self.assertFalse(os.path.exists(os.path.join(self.local, 'damaged')))
+        self.assertEqual([None, None], [result.error for result in results[1:]])
+        for name, content in (('small', small), ('large', large)):
+            with open(os.path.join(self.local, name), 'rb') as f:
+                self.assertEqual(content, f.read())
+        # The large file gave up on the single request after small_file_bytes and went through download
+        self.assertEqual(2, len([path for method, path in self.server.requests
+                                 if method == 'GET' and path.endswith('/large')]))
+
+    def test__verify_many(self):
+        os.makedirs(self._path('dir'))
+        for i in range(6):
+            self._create_file('dir/file%d' % i, os.urandom(1000 + i))
+        entries = [entry for entry in self._run(self.client.ls('/dir')) if not aioeasywebdav.isdir(entry)]
+        pairs = [(entry, os.path.join(self.local, entry.name.rsplit('/', 1)[1])) for entry in entries]
+        for entry, local in pairs:
+            shutil.copyfile(self._path(entry.name.lstrip('/')), local)
+        with open(os.path.join(self.local, 'file1'), 'r+b') as f:
+            f.write(b'damaged')
+        os.remove(os.path.join(self.local, 'file2'))
+        pairs[0] = (pairs[0][0]._replace(checksum='SHA256:%s' % hashlib.sha256(
+            self._read_file('dir/file0')).hexdigest()), pairs[0][1])
+
+        stats = aioeasywebdav.BulkStats()
+        results = self._collect(self.client.verify_many(pairs, processes=2, stats=stats))
+        self.assertEqual((4, 2), (stats.done, stats.failed))
+        self.assertIn('Invalid Checksum', str(results[1].error))
+        self.assertIsInstance(results[2].error, FileNotFoundError)
+        self.assertEqual(['PROPFIND'], sorted(set(method for method, path in self.server.requests)))
+
+
+class RangeTests(ServerTestCase):
+    content = os.urandom(9 * 1000 * 1000)
+
+    def setUp(self):
+        super(RangeTests, self).setUp()
+        self._create_file('file', self.content)
+        self.server.ranges = False
+        self.local = os.path.join(self.server.root, 'local')
+
+    def test__download_without_ranges(self):
+        remote_file = self._run(self.client.ls('/file'))[0]._replace(checksum=None)
+        self.assertIsNone(self._run(self.client.download(remote_file, self.local, streams_per_file=4)))
+        with open(self.local, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+
+    def test__download_without_ranges_checksum(self):
+        self.assertIsNone(self._run(self.client.download('/file', self.local, streams_per_file=4)))
+        with open(self.local, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+
+    def test__download_into_file_object_without_ranges(self):
+        # Blocks written straight to the caller's file object can't be started over
+        error = self._run(self.client.download('/file', BytesIO(), streams_per_file=4,
+                                               stream_buffer_bytes=4 * 1024 * 1024))
+        self.assertIn('ignored the range request', error)
+
+    def test__reorder_buffer_stops_writing_after_abort(self):
+        out = BytesIO()
+        reorder = aioeasywebdav.ReorderBuffer(self.client._range_writer(out, 'stream', None), 3, 1, 3)
+
+        async def run():
+            await reorder.complete(0, b'a')
+            await reorder.abort(aioeasywebdav.RangeNotSupported())
+            await reorder.complete(1, b'b')
+        self._run(run())
+        self.assertEqual(b'a', out.getvalue())
+        self.assertEqual(1, reorder.written)
+
+
+class RetryTests(ServerTestCase):
+    content = os.urandom(300 * 1024)
+
+    async def _connect(self, url):
+        return aioeasywebdav.connect(url=url, retry_policy=aioeasywebdav.RetryPolicy(backoff=0.01))
+
+    def _requests(self, method):
+        return [path for m, path in self.server.requests if m == method]
+
+    def test__retry_transient_status(self):
+        self.server.faults = [('PROPFIND', 503, {'Retry-After': '0'}), ('PROPFIND', 502, {})]
+        self.assertEqual(['/'], [entry.name for entry in self._run(self.client.ls('/'))])
+        self.assertEqual(3, len(self._requests('PROPFIND')))
+
+    def test__no_retry_permanent_status(self):
+        with self.assertRaises(aioeasywebdav.OperationFailed):
+            self._run(self.client.delete('/missing'))
+        self.assertEqual(1, len(self._requests('DELETE')))
+
+    def test__retry_budget(self):
+        self.client.retry_policy.budgets['DELETE'] = 2
+        self._create_file('a', b'a')
+        self.server.faults = [('DELETE', 500, {})] * 3
+        with self.assertRaises(aioeasywebdav.OperationFailed) as cm:
+            self._run(self.client.delete('/a'))
+        self.assertEqual(500, cm.exception.actual_code)
+        self.assertEqual(2, len(self._requests('DELETE')))
+
+    def test__upload_checksums(self):
+        reads = []
+
+        class Source(BytesIO):
+            def read(self, *args):
+                data = super(Source, self).read(*args)
+                reads.append(len(data))
+                return data
+        large = self.content * 5
+        # Read once, hashed while sent and verified against the server's checksum afterwards
+        self._run(self.client.upload(Source(large), '/large'))
+        self.assertEqual(len(large), sum(reads))
+        self.assertNotIn('OC-Checksum', self.server.headers[('PUT', self.files_path + '/large')])
+        self.assertEqual(1, len(self._requests('PROPFIND')))
+        self.assertEqual(large, self._read_file('large'))
+
+        # A small file is read once into memory, the header costs nothing and there's nothing to verify after
+        self._run(self.client.upload(BytesIO(b'small'), '/small'))
+        self.assertEqual('MD5:%s' % hashlib.md5(b'small').hexdigest(),
+                         self.server.headers[('PUT', self.files_path + '/small')]['OC-Checksum'])
+        self.assertEqual(1, len(self._requests('PROPFIND')))
+
+        del reads[:]
+        self._run(self.client.upload(Source(large), '/precomputed', precompute=True))
+        self.assertEqual(2 * len(large), sum(reads))
+        self.assertEqual('MD5:%s' % hashlib.md5(large).hexdigest(),
+                         self.server.headers[('PUT', self.files_path + '/precomputed')]['OC-Checksum'])
+        self.assertEqual(1, len(self._requests('PROPFIND')))
+
+    def test__non_idempotent_not_retried(self):
+        self.server.faults = [('MKCOL', 503, {}), ('MOVE', 503, {})]
+        with self.assertRaises(aioeasywebdav.OperationFailed):
+            self._run(self.client.mkdir('/dir'))
+        self._create_file('file', b'data')
+        with self.assertRaises(aioeasywebdav.OperationFailed):
+            self._run(self.client.move('/file', '/moved'))
+        self.assertEqual((1, 1), (len(self._requests('MKCOL')), len(self._requests('MOVE'))))
+        # A budget opts a method back in
+        self.client.retry_policy.budgets['MKCOL'] = 2
+        self.server.faults = [('MKCOL', 503, {})]
+        self._run(self.client.mkdir('/dir'))
+        self.assertEqual(3, len(self._requests('MKCOL')))
+
+    def test__retry_upload_rewinds(self):
+        self.server.faults = [('PUT', 503, {})]
+        digests = self._run(self.client.upload(BytesIO(self.content), '/file'))
+        self.assertEqual(self.content, self._read_file('file'))
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), digests['MD5'])
+        self.assertEqual(2, len(self._requests('PUT')))
+
+    def test__download_resumes(self):
+        self._create_file('file', self.content)
+        self.server.faults = [('GET', 'truncate', {})]
+        local = os.path.join(self.server.root, 'local')
+        self.assertIsNone(self._run(self.client.download('/file', local, streams_per_file=1)))
+        with open(local, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        self.assertEqual(2, len(self._requests('GET')))
+
+    def test__open_read_resumes(self):
+        self._create_file('file', self.content)
+        self.server.faults = [('GET', 'truncate', {})]
+
+        async def read():
+            async with (await self.client.open_read('/file')) as reader:
+                return await reader.read()
+        self.assertEqual(self.content, self._run(read()))
+
+
+class BandwidthTests(ServerTestCase):
+    content = os.urandom(100 * 1000)
+
+    def _timed(self, coro):
+        started = time.monotonic()
+        result = self._run(coro)
+        return result, time.monotonic() - started
+
+    def test__download_limited(self):
+        self._create_file('file', self.content)
+        local = os.path.join(self.server.root, 'local')
+        bandwidth = aioeasywebdav.TokenBucket(200 * 1000, burst=1)
+        error, elapsed = self._timed(self.client.download('/file', local, bandwidth=bandwidth))
+        self.assertIsNone(error)
+        self.assertGreater(elapsed, 0.4)
+
+    def test__upload_limited_client_wide(self):
+        # The first second's worth goes out at once, the rest at the limit
+        self.client.set_bandwidth(50 * 1000)
+        digests, elapsed = self._timed(self.client.upload(BytesIO(self.content), '/file'))
+        self.assertEqual(self.content, self._read_file('file'))
+        self.assertGreater(elapsed, 0.9)
+
+    def test__host_limit(self):
+        host = self.server.url.split('://', 1)[1]
+        self.client.set_bandwidth(50 * 1000, host=host)
+        digests, elapsed = self._timed(self.client.upload(BytesIO(self.content), '/file'))
+        self.assertGreater(elapsed, 0.9)
+
+    def test__rate_changed_while_waiting(self):
+        bucket = aioeasywebdav.TokenBucket(1000, burst=1)
+
+        async def consume():
+            waiting = asyncio.ensure_future(bucket.consume(1000 * 1000))
+            await asyncio.sleep(0.05)
+            bucket.rate = None
+            await waiting
+        result, elapsed = self._timed(consume())
+        self.assertLess(elapsed, 1)
+
+    def test__fair_share(self):
+        bucket = aioeasywebdav.TokenBucket(1000 * 1000, burst=1)
+        order = []
+
+        async def transfer(name):
+            for _ in range(5):
+                await bucket.consume(10 * 1000)
+                order.append(name)
+
+        async def run():
+            await asyncio.gather(transfer('a'), transfer('b'))
+        self._run(run())
+        self.assertEqual(['a', 'b'] * 5, order)
+
+
+class ResumeManifestTests(ServerTestCase):
+    block = aioeasywebdav.RESUME_BLOCK_SIZE_BYTES
+    content = os.urandom(2 * block + 1000)
+
+    def setUp(self):
+        super(ResumeManifestTests, self).setUp()
+        self._create_file('file', self.content)
+        self.local = os.path.join(self.server.root, 'local')
+        self.remote_file = self._run(self.client.ls('/file'))[0]
+
+    def _count_reads(self):
+        """
+        :return: list receiving the size of every read of the download's files by the client module
+        """
+        reads = []
+        local = self.local
+
+        class CountingFile(object):
+            def __init__(self, f):
+                self.f = f
+
+            def read(self, *args):
+                data = self.f.read(*args)
+                reads.append(len(data))
+                return data
+
+            def __getattr__(self, name):
+                return getattr(self.f, name)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.f.close()
+
+        def counting_open(path, mode='r', *args, **kwargs):
+            f = open(path, mode, *args, **kwargs)
+            return CountingFile(f) if str(path).startswith(local) and mode == 'rb' else f
+        aioeasywebdav.client.open = counting_open
+        self.addCleanup(delattr, aioeasywebdav.client, 'open')
+        return reads
+
+    def _corrupt(self, path, offset):
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            f.write(bytes([f.read(1)[0] ^ 0xff]))
+
+    def test__resume_refetches_damaged_block(self):
+        # Left over from an interrupted download: two blocks written and hashed, the second since damaged
+        with open(self.local + aioeasywebdav.TEMP_NAME, 'wb') as f:
+            f.write(self.content[:2 * self.block] + b'\0' * 1000)
+        state = aioeasywebdav.DownloadState.load(self.local, self.remote_file)
+        state.ranges = [[0, 2 * self.block, 2 * self.block], [2 * self.block, len(self.content), 0]]
+        state.blocks = dict((index, hashlib.sha1(self.content[index * self.block:(index + 1) * self.block]).hexdigest())
+                            for index in range(2))
+        state.save()
+        self._corrupt(self.local + aioeasywebdav.TEMP_NAME, self.block + 10)
+
+        self.assertIsNone(self._run(self.client.download(self.remote_file, self.local)))
+        with open(self.local, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        self.assertEqual(len(self.content) - self.block, self.client.metrics.bytes_in)
+        # The two recorded blocks checked, then the resumed block hashed into the file's MD5
+        self.assertEqual(3 * self.block, self.client.io_stats['bytes_read_back'])
+
+    def test__blocks_hashed_as_written(self):
+        class StopAfterFirstBlock(aioeasywebdav.ProgressHandler):
+            async def progress_callback(self, total_size, current_size):
+                if current_size > ResumeManifestTests.block + aioeasywebdav.DOWNLOAD_CHUNK_SIZE_BYTES:
+                    raise aioeasywebdav.WebdavException('stopped')
+
+            async def verifying_callback(self):
+                pass
+
+            async def done_callback(self, error):
+                pass
+
+        self.assertEqual('stopped', self._run(self.client.download(self.remote_file, self.local, StopAfterFirstBlock(),
+                                                                   streams_per_file=1)))
+        with open(self.local + aioeasywebdav.RESUME_NAME) as f:
+            blocks = json.load(f)['blocks']
+        self.assertEqual({'0': hashlib.sha1(self.content[:self.block]).hexdigest()}, blocks)
+
+    def test__inline_checksums(self):
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        remote_file = self.remote_file._replace(checksum='ADLER32:0 SHA256:%s' % sha256.upper())
+        reads = self._count_reads()
+        self.assertIsNone(self._run(self.client.download(remote_file, self.local, streams_per_file=4)))
+        with open(self.local, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        # File checksum and block hashes computed as the data arrived, nothing read back from disk
+        self.assertEqual(0, sum(reads))
+        self.assertEqual(0, self.client.io_stats['bytes_read_back'])
+
+    def test__inline_checksums_read_back(self):
+        remote_file = self.remote_file._replace(checksum='SHA1:%s MD5:%s' % (
+            hashlib.sha1(self.content).hexdigest(), hashlib.md5(self.content).hexdigest()))
+        # Nothing held in memory, the file is hashed from the part file as the prefix completes
+        reads = self._count_reads()
+        self.assertIsNone(self._run(self.client.download(remote_file, self.local, streams_per_file=4,
+                                                         stream_buffer_bytes=0)))
+        with open(self.local, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        self.assertEqual(len(self.content), sum(reads))
+        self.assertEqual(len(self.content), self.client.io_stats['bytes_read_back'])
+
+    def test__checksum_failure(self):
+        remote_file = self.remote_file._replace(checksum='SHA1:%s' % ('0' * 40))
+        error = self._run(self.client.download(remote_file, self.local))
+        self.assertTrue(error.startswith('Invalid Checksum'))
+        with open(self.local + '.invalid', 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        # The blocks match their hashes, none is fetched again
+        self.assertEqual(len(self.content), self.client.metrics.bytes_in)
+        self.assertFalse(os.path.exists(self.local + aioeasywebdav.RESUME_NAME))
+
+
+class TransferManagerTests(ServerTestCase):
+    content = os.urandom(400 * 1024)
+
+    def setUp(self):
+        super(TransferManagerTests, self).setUp()
+        self.local = os.path.join(self.server.root, 'local')
+        os.makedirs(self.local)
+
+    def _gets(self):
+        return [path.rsplit('/', 1)[1] for method, path in self.server.requests if method == 'GET']
+
+    def test__priorities(self):
+        for name in ('first', 'low', 'high', 'mid'):
+            self._create_file(name, name.encode())
+        manager = aioeasywebdav.TransferManager(self.client, slots={'default': 1})
+
+        async def run():
+            transfers = [manager.download('/first', os.path.join(self.local, 'first'))]
+            for name, priority in (('low', 0), ('high', 10), ('mid', 5)):
+                transfers.append(manager.download('/' + name, os.path.join(self.local, name), priority=priority))
+            self.assertEqual(['running', 'queued', 'queued', 'queued'], [transfer.state for transfer in transfers])
+            await manager.join()
+            return transfers
+        transfers = self._run(run())
+        self.assertEqual(['first', 'high', 'mid', 'low'], self._gets())
+        self.assertEqual(['done'] * 4, [transfer.state for transfer in transfers])
+        self.assertEqual(dict(slots=1, queued=0, running=0, paused=0, done=4, failed=0, cancelled=0),
+                         manager.snapshot()['groups']['default'])
+
+    def test__pause_resume_cancel(self):
+        self.server.bandwidth = 1024 * 1024
+        self._create_file('file', self.content)
+        self._create_file('other', b'other')
+        manager = aioeasywebdav.TransferManager(self.client, slots={'default': 1})
+
+        async def run():
+            transfer = manager.download('/file', os.path.join(self.local, 'file'), streams_per_file=1)
+            other = manager.download('/other', os.path.join(self.local, 'other'))
+            while not transfer.transferred:
+                await asyncio.sleep(0.01)
+            transfer.pause()
+            # The slot goes to the next transfer while the first one is paused
+            await other.wait()
+            await asyncio.sleep(0.1)
+            paused_at = transfer.transferred
+            await asyncio.sleep(0.2)
+            self.assertEqual(paused_at, transfer.transferred)
+            self.assertLess(paused_at, len(self.content))
+            self.assertEqual('paused', manager.snapshot()['transfers'][0]['state'])
+            transfer.resume()
+            await transfer.wait()
+
+            upload = manager.upload(BytesIO(self.content), '/uploaded', bandwidth=100 * 1024)
+            await asyncio.sleep(0.05)
+            upload.cancel()
+            with self.assertRaises(aioeasywebdav.TransferCancelled):
+                await upload.wait()
+            return upload
+        upload = self._run(run())
+        with open(os.path.join(self.local, 'file'), 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        # The pause let the connection go, resuming took a new range request
+        self.assertEqual(['file', 'file', 'other'], sorted(self._gets()))
+        self.assertEqual('cancelled', upload.state)
+
+    def test__long_upload_pause_restarts_put(self):
+        content = os.urandom(2 * 1024 * 1024)
+        enabled = asyncio.Event()
+        enabled.set()
+        hold = aioeasywebdav.client.PAUSE_HOLD_SECONDS
+        aioeasywebdav.client.PAUSE_HOLD_SECONDS = 0.1
+        self.addCleanup(setattr, aioeasywebdav.client, 'PAUSE_HOLD_SECONDS', hold)
+
+        class Pause(aioeasywebdav.ProgressHandler):
+            paused = False
+
+            async def progress_callback(self, total, current):
+                if not self.paused:
+                    self.paused = True
+                    enabled.clear()
+                    asyncio.get_event_loop().call_later(0.3, enabled.set)
+
+        self._run(self.client.upload(BytesIO(content), '/file', progress_handler=Pause(), enabled_event=enabled))
+        self.assertEqual(content, self._read_file('file'))
+        # The PUT was dropped once the pause outlasted the hold and sent again whole after the resume
+        self.assertEqual(2, len([method for method, path in self.server.requests if method == 'PUT']))
+
+    def test__paused_download_yields_streams(self):
+        self.server.bandwidth = 1024 * 1024
+        self._create_file('big', os.urandom(9 * 1000 * 1000))
+        self._create_file('other', b'other')
+
+        async def run():
+            client = aioeasywebdav.connect(url=self.server.url + self.files_path, max_streams=2)
+            try:
+                manager = aioeasywebdav.TransferManager(client, slots={'default': 2})
+                first = manager.download('/big', os.path.join(self.local, 'big'), streams_per_file=2)
+                while not (first.transferred and client.limit_streams.locked()):
+                    await asyncio.sleep(0.01)
+                first.pause()
+                # Both stream slots were held by the first download, they go to the next one while it's paused
+                other = manager.download('/other', os.path.join(self.local, 'other'))
+                await asyncio.wait_for(other.wait(), 5)
+                self.assertEqual(('paused', 'done'), (first.state, other.state))
+                first.cancel()
+                with self.assertRaises(aioeasywebdav.TransferCancelled):
+                    await first.wait()
+            finally:
+                client.close()
+        self._run(run())
+        with open(os.path.join(self.local, 'other'), 'rb') as f:
+            self.assertEqual(b'other', f.read())
+
+
+class MetricsTests(ServerTestCase):
+    content = os.urandom(200 * 1000)
+
+    def test__transfer_metrics(self):
+        self._run(self.client.upload(BytesIO(self.content), '/file'))
+        local = os.path.join(self.server.root, 'local')
+        self.assertIsNone(self._run(self.client.download('/file', local)))
+        with self.assertRaises(aioeasywebdav.OperationFailed):
+            self._run(self.client.delete('/missing'))
+
+        snapshot = self.client.metrics.snapshot()
+        self.assertEqual(len(self.content), snapshot['bytes_out'])
+        self.assertEqual(len(self.content), snapshot['bytes_in'])
+        self.assertGreater(snapshot['rate_in'], 0)
+        self.assertGreater(self.client.download_rate(), 0)
+        self.assertEqual({}, snapshot['transfers'])  # finished transfers are dropped
+        self.assertEqual({'DELETE': 1}, snapshot['errors'])
+        self.assertEqual(0, sum(snapshot['in_flight'].values()))
+        self.assertEqual(snapshot['requests']['PUT'], snapshot['latency']['PUT']['count'])
+
+    def test__prometheus(self):
+        self._run(self.client.ls('/'))
+        text = self.client.metrics.prometheus()
+        self.assertIn('aioeasywebdav_requests_total{method="PROPFIND"} 1\n', text)
+        self.assertIn('aioeasywebdav_request_duration_seconds_bucket{method="PROPFIND",le="+Inf"} 1\n', text)
+        self.assertIn('# TYPE aioeasywebdav_received_bytes_total counter\n', text)
+
+    def test__rate_decays(self):
+        rate = aioeasywebdav.metrics.Rate(time_constant=0.05)
+        rate.add(1000)
+        first = rate.value()
+        time.sleep(0.1)
+        self.assertLess(rate.value(), first / 5)
+
+
+class RecordingTracer(aioeasywebdav.Tracer):
+
+    def __init__(self):
+        self.started = []
+        self.ended = []
+
+    def request_start(self, trace):
+        self.started.append(trace)
+
+    def request_end(self, trace):
+        self.ended.append(trace)
+
+
+class TracingTests(ServerTestCase):
+    content = os.urandom(300 * 1000)
+
+    async def _connect(self, url):
+        self.tracer = RecordingTracer()
+        return aioeasywebdav.connect(url=url, tracer=self.tracer)
+
+    def test__trace_download(self):
+        self._create_file('file', self.content)
+        local = os.path.join(self.server.root, 'local')
+        self.assertIsNone(self._run(self.client.download('/file', local, streams_per_file=1)))
+        self.assertEqual(['PROPFIND', 'GET'], [trace.method for trace in self.tracer.started])
+        self.assertEqual(['/file', '/file'], [trace.path for trace in self.tracer.started])
+        get = self.tracer.started[1]
+        self.assertIn(get, self.tracer.ended)
+        self.assertEqual(206, get.status)
+        self.assertEqual(len(self.content), get.bytes_received)
+        timings = get.timings()
+        self.assertIn('connection_reused', timings)
+        self.assertLessEqual(timings['response_headers'], timings['response_chunk'])
+        self.assertLessEqual(timings['response_chunk'], timings['response_end'])
+
+    def test__trace_ended_on_release(self):
+        self._create_file('file', self.content)
+
+        async def first_chunk():
+            chunks = self.client.iter_content('/file', chunk_size=1000)
+            chunk = await chunks.__anext__()
+            await chunks.aclose()
+            return chunk
+        self.assertEqual(self.content[:1000], bytes(self._run(first_chunk())))
+        get, = [trace for trace in self.tracer.started if trace.method == 'GET']
+        self.assertEqual([get], [trace for trace in self.tracer.ended if trace.method == 'GET'])
+        self.assertLess(get.bytes_received, len(self.content))
+        self.assertIsNotNone(get.ended)
+
+    def test__trace_failure(self):
+        with self.assertRaises(aioeasywebdav.OperationFailed):
+            self._run(self.client.delete('/missing'))
+        trace, = self.tracer.ended
+        self.assertEqual(('DELETE', 404), (trace.method, trace.status))
+        self.assertIsInstance(trace.error, aioeasywebdav.OperationFailed)
+
+    def test__opentelemetry_spans(self):
+        spans = []
+
+        class Span(object):
+            def __init__(self, name, attributes):
+                self.name, self.attributes, self.events, self.ended = name, dict(attributes), [], False
+                spans.append(self)
+
+            def add_event(self, name, attributes):
+                self.events.append(name)
+
+            def set_attribute(self, key, value):
+                self.attributes[key] = value
+
+            def record_exception(self, exception):
+                self.events.append('exception')
+
+            def end(self):
+                self.ended = True
+
+        class OtelTracer(object):
+            def start_span(self, name, attributes=None):
+                return Span(name, attributes)
+
+        async def connect():
+            return aioeasywebdav.connect(url=self.server.url + self.files_path,
+                                         tracer=aioeasywebdav.OpenTelemetryTracer(OtelTracer()))
+        client = self._run(connect())
+        try:
+            self._run(client.ls('/'))
+        finally:
+            client.close()
+        span, = spans
+        self.assertEqual('WebDAV PROPFIND', span.name)
+        self.assertEqual('/', span.attributes['webdav.path'])
+        self.assertEqual(207, span.attributes['http.status_code'])
+        self.assertIn('response_headers', span.events)
+        self.assertTrue(span.ended)
@@ -1,4 +1,7 @@
+import os
+import hashlib
 from io import BytesIO
+import aioeasywebdav
 from . import TestCase
 
 class Tests(TestCase):
@@ -117,11 +120,52 @@ class Tests(TestCase):
         self.client.cd('one')
         self.client.download('/two/file', path)
         self._assert_local_file(path, self.content)
+    def test__download_single_file(self):
+        self._create_file('file', self.content)
+        path = self._local_path()
+        self.client.download('file', path)
+        self._assert_local_file(path, self.content)
+        self.assertFalse(os.path.exists(path + aioeasywebdav.TEMP_NAME))
+        self.assertFalse(os.path.exists(path + aioeasywebdav.RESUME_NAME))
+    def test__download_io_stats(self):
+        self._create_file('file', self.content)
+        path = self._local_path()
+        self.client.download('file', path)
+        self.assertEqual(len(self.content), self.client.io_stats['bytes_written'])
+        self.assertEqual(0.0, self.client.io_stats['blocking_time'])
+    def test__download_part_files(self):
+        self._create_file('file', self.content)
+        path = self._local_path()
+        self.client.download('file', path, single_file=False)
+        self._assert_local_file(path, self.content)
     def test__download_stream(self):
         self._create_file('file', self.content)
         sio = BytesIO()
         self.client.download('file', sio)
         self.assertEqual(self.content, sio.getvalue())
+    def test__download_stream_parallel(self):
+        content = os.urandom(3 * 1024 * 1024 + 17)
+        self._create_file('file', content)
+        sio = BytesIO()
+        self.assertIsNone(self.client.download('file', sio, streams_per_file=4, stream_buffer_bytes=2 * 1024 * 1024))
+        self.assertEqual(content, sio.getvalue())
+    def test__iter_content(self):
+        self._create_file('file', self.content)
+        async def collect():
+            return b''.join([bytes(chunk) async for chunk in self._client.iter_content('file', start=2, end=6)])
+        self.assertEqual(self.content[2:6], self._loop_run(collect()))
+    def test__open_read(self):
+        self._create_file('file', self.content)
+        reader = self.client.open_read('file')
+        async def read():
+            async with reader:
+                reader.seek(-4, os.SEEK_END)
+                tail = await reader.read()
+                reader.seek(1)
+                buffer = bytearray(3)
+                await reader.readinto(buffer)
+            return tail, bytes(buffer)
+        self.assertEqual((self.content[-4:], self.content[1:4]), self._loop_run(read()))
 
     def test__upload(self):
         path = self._local_file(self.content)
@@ -138,6 +182,12 @@ class Tests(TestCase):
         self.client.cd('one')
         self.client.upload(path, '/two/file')
         self._assert_file('two/file', self.content)
+    def test__upload_checksums(self):
+        path = self._local_file(self.content)
+        checksums = self.client.upload(path, 'file', checksums=('MD5', 'SHA256'), verify=True)
+        self._assert_file('file', self.content)
+        self.assertEqual({'MD5': hashlib.md5(self.content).hexdigest(),
+                          'SHA256': hashlib.sha256(self.content).hexdigest()}, checksums)
     def test__upload_stream(self):
         sio = BytesIO()
         sio.write(self.content)
@@ -0,0 +1,83 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+import aioeasywebdav
+
+
+class UnitTests(unittest.TestCase):
+    """
+    Tests of helpers which need neither davserver nor the stand-in server.
+    """
+
+    def setUp(self):
+        self.local = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.local)
+
+    def test__download_scheduler_splits_slow_range(self):
+        remote_file = aioeasywebdav.File('file', 20 * 1000 * 1000, '', '', '', None)
+        state = aioeasywebdav.DownloadState.load(os.path.join(self.local, 'file'), remote_file)
+        block = state.block_size
+        scheduler = aioeasywebdav.DownloadScheduler(state, streams=2)
+        first = scheduler.next_range()
+        second = scheduler.next_range()
+        # Splits fall on block boundaries so every block is written by a single stream
+        self.assertEqual((0, 3 * block), (first[0], first[1]))
+        self.assertEqual(first[1], second[0])
+        self.assertEqual(remote_file.size, second[1])
+        scheduler.release(first)
+        first[2] = first[1] - first[0]
+        stolen = scheduler.next_range()
+        self.assertEqual((4 * block, remote_file.size), (stolen[0], stolen[1]))
+        self.assertEqual(stolen[0], second[1])
+        self.assertEqual(remote_file.size, sum(end - start for start, end, written in state.ranges))
+
+    def test__parse_checksums(self):
+        self.assertEqual({'SHA1': 'ab', 'MD5': 'cd'}, aioeasywebdav.parse_checksums('SHA1:ab md5:cd'))
+        self.assertEqual({}, aioeasywebdav.parse_checksums(None))
+
+    def test__elem2file(self):
+        elem = aioeasywebdav.client.xml.fromstring(
+            '<d:response xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns"><d:href>/dav/one/two%20three</d:href>'
+            '<d:propstat><d:prop><d:getcontentlength>12</d:getcontentlength><d:getcontenttype>text/plain</d:getcontenttype>'
+            '<oc:checksums><oc:checksum>MD5:abc</oc:checksum></oc:checksums></d:prop></d:propstat></d:response>')
+        self.assertEqual(aioeasywebdav.File('/one/two three', 12, '', '', 'text/plain', 'MD5:abc'),
+                         aioeasywebdav.elem2file(elem, 'http://localhost/dav', '/dav'))
+
+    def test__host_bandwidth_bare_hostname(self):
+        async def throttled():
+            client = aioeasywebdav.connect(host='WebDAV.example.com')
+            try:
+                client.set_bandwidth(1000 * 1000, host='webdav.example.com')
+                client.set_bandwidth(1000 * 1000, host='https://webdav.example.com')
+                await client._throttle('/file', 1000)
+                return dict((host, bucket.burst - bucket._tokens) for host, bucket in client.host_bandwidth.items())
+            finally:
+                client.close()
+        loop = asyncio.new_event_loop()
+        try:
+            taken = loop.run_until_complete(throttled())
+        finally:
+            loop.close()
+        # The client's base url carries the default port, a bare hostname is limited all the same
+        self.assertEqual({'webdav.example.com:80', 'webdav.example.com:443'}, set(taken))
+        self.assertGreater(taken['webdav.example.com:80'], 900)
+        self.assertEqual(0, taken['webdav.example.com:443'])
+
+    def test__metrics_transfers_of_one_name(self):
+        metrics = aioeasywebdav.Metrics()
+        metrics.transfer_started('/file')
+        metrics.transfer_started('/file')
+        metrics.received(1000, '/file')
+        metrics.transfer_finished('/file')
+        # The other transfer of the name is still running and keeps being measured
+        self.assertIn('/file', metrics.snapshot()['transfers'])
+        metrics.received(1000, '/file')
+        self.assertGreater(metrics.transfer_rate('/file'), 0)
+        metrics.transfer_finished('/file')
+        self.assertEqual({}, metrics.snapshot()['transfers'])
+        self.assertEqual(0.0, metrics.transfer_rate('/file'))